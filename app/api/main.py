@@ -43,6 +43,10 @@ async def startup():
 @app.on_event("shutdown")
 async def shutdown():
     """Действия при остановке"""
+    from app.services.sbis_ofd import close_ofd_clients
+    from app.services.fns_receipt import fns_receipt_service
+    await close_ofd_clients()
+    await fns_receipt_service.close()
     await close_db()
     logger.info("API Server stopped")
 
@@ -3,11 +3,11 @@ API маршруты
 """
 from fastapi import APIRouter, HTTPException, Header, Depends
 from app.api.schemas import (
-    ShiftReportSchema, TransactionSchema, ResponseSchema,
+    ShiftReportSchema, ShiftReportBatchSchema, TransactionSchema, ResponseSchema,
     ReceiptSchema, CashWithdrawalSchema, AccountableReportSchema
 )
 from app.database.db import async_session_maker
-from app.database import crud
+from app.database import crud, cash_ledger
 from app.config import settings
 from datetime import datetime, date as date_type, timedelta
 from decimal import Decimal
@@ -54,59 +54,17 @@ async def receive_shift_report(
     """
     try:
         async with async_session_maker() as session:
-            # Сохранение отчета
-            db_report = await crud.create_shift_report(session, report.dict())
-
-            # Автоматическое создание транзакций
-            transactions_created = []
-
-            # 1. Доход = cash + cashless + qr
-            income_amount = Decimal('0')
-            if report.cash_fact:
-                income_amount += report.cash_fact
-            if report.cashless_fact:
-                income_amount += report.cashless_fact
-            if report.qr_payments:
-                income_amount += report.qr_payments
-
-            if income_amount > 0:
-                income_transaction = await crud.create_transaction(session, {
-                    'date': report.date,
-                    'type': 'income',
-                    'amount': income_amount,
-                    'description': f'Выручка смена {report.shift} {report.date}',
-                    'payment_method': 'mixed',
-                    'source': 'shift_report',
-                    'is_confirmed': True  # Автоматически подтверждаем доходы из смен
-                })
-                transactions_created.append(income_transaction.id)
-
-            # 2. Расходы из expenses
-            if report.expenses:
-                for expense in report.expenses:
-                    expense_transaction = await crud.create_transaction(session, {
-                        'date': report.date,
-                        'type': 'expense',
-                        'amount': Decimal(str(expense.get('amount', 0))),
-                        'description': expense.get('description', 'Расход со смены'),
-                        'source': 'shift_report',
-                        'is_confirmed': False  # Требует подтверждения
-                    })
-                    transactions_created.append(expense_transaction.id)
-
-            logger.info(
-                f"Shift report received: {report.date} {report.shift}, "
-                f"created {len(transactions_created)} transactions"
-            )
+            # Отчет и транзакции (доход + расходы) пишутся одной транзакцией,
+            # повтор той же смены возвращает первый результат без записи
+            result = await crud.ingest_shift_report(session, report.dict())
 
             return ResponseSchema(
                 status="success",
-                message="Shift report processed successfully",
-                data={
-                    "report_id": db_report.id,
-                    "transactions_created": transactions_created,
-                    "total_revenue": float(income_amount)
-                }
+                message=(
+                    "Shift report already processed" if result['duplicate']
+                    else "Shift report processed successfully"
+                ),
+                data=result
             )
 
     except Exception as e:
@@ -114,6 +72,42 @@ async def receive_shift_report(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/shift-reports:batch", response_model=ResponseSchema)
+async def receive_shift_reports_batch(
+    batch: ShiftReportBatchSchema,
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    Пакетный прием отчетов о сменах (дозагрузка истории)
+
+    - **reports**: Массив отчетов в формате /shift-report
+
+    Возвращает результат по каждому отчету: ошибка в одном отчете
+    не отменяет остальные
+    """
+    try:
+        async with async_session_maker() as session:
+            results = await crud.ingest_shift_reports(
+                session, [report.dict() for report in batch.reports]
+            )
+
+        failed = sum(1 for item in results if item['status'] != 'success')
+
+        return ResponseSchema(
+            status="success" if not failed else "partial",
+            message=f"Processed {len(results) - failed} of {len(results)} shift reports",
+            data={
+                "results": results,
+                "succeeded": len(results) - failed,
+                "failed": failed
+            }
+        )
+
+    except Exception as e:
+        logger.error(f"Error processing shift reports batch: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/check-shift")
 async def check_shift_with_ofd(
     check_data: ShiftCheckSchema,
@@ -131,19 +125,10 @@ async def check_shift_with_ofd(
     Возвращает результат сверки с кассой
     """
     try:
-        from app.services.sbis_ofd import validate_shift_with_ofd, get_shift_validation_report
+        from app.services.sbis_ofd import get_shift_validation
 
-        # Проверить с СБИС ОФД
-        validation = await validate_shift_with_ofd(
-            shift_date=check_data.date,
-            fact_cash=check_data.cash,
-            fact_cashless=check_data.cashless,
-            fact_qr=check_data.qr,
-            kkt_number=check_data.kkt_number
-        )
-
-        # Получить полный отчет
-        report = await get_shift_validation_report(
+        # Проверка и полный отчет по одному запросу итогов смены
+        validation, report = await get_shift_validation(
             shift_date=check_data.date,
             fact_cash=check_data.cash,
             fact_cashless=check_data.cashless,
@@ -330,78 +315,47 @@ async def receive_receipt(
     """
     try:
         from app.services.fns_receipt import fns_receipt_service
-        from app.database.models import Receipt, Accountable, Transaction
 
-        # Декодируем QR и получаем данные от ФНС
+        qr_params = fns_receipt_service.parse_qr_code(receipt_data.qr_data)
+
+        if not qr_params:
+            raise HTTPException(status_code=400, detail="Invalid QR code")
+
+        # Чек уже принят - без повторного запроса к ФНС
+        async with async_session_maker() as session:
+            existing = await crud.get_receipt_by_fiscal(
+                session,
+                qr_params["fiscal_sign"],
+                qr_params["fiscal_document"],
+                qr_params["fiscal_storage"]
+            )
+
+        if existing:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Receipt already registered (id={existing.id})"
+            )
+
+        # Получаем данные от ФНС
         receipt_info = await fns_receipt_service.verify_and_save_receipt(receipt_data.qr_data)
 
         if not receipt_info:
             raise HTTPException(status_code=400, detail="Invalid QR code or FNS API unavailable")
 
         async with async_session_maker() as session:
-            # Создаем запись чека
-            new_receipt = Receipt(
-                fiscal_sign=receipt_info["fiscal_sign"],
-                fiscal_document=receipt_info["fiscal_document"],
-                fiscal_storage=receipt_info["fiscal_storage"],
-                purchase_date=receipt_info["purchase_date"],
-                total_amount=receipt_info["total_amount"],
-                vat_amount=receipt_info.get("vat_amount", 0),
-                seller_name=receipt_info.get("seller_name"),
-                seller_inn=receipt_info.get("seller_inn"),
-                seller_address=receipt_info.get("seller_address"),
-                cashier=receipt_info.get("cashier"),
-                shift_number=receipt_info.get("shift_number"),
-                operation_type=receipt_info["operation_type"],
-                items=receipt_info.get("items"),
-                payment_type=receipt_info.get("payment_type", "cash"),
-                taxation_type=receipt_info.get("taxation_type"),
-                qr_raw=receipt_info["qr_raw"],
-                fns_url=receipt_info.get("fns_url"),
+            new_receipt, new_transaction = await crud.add_receipt(
+                session,
+                receipt_info,
                 category=receipt_data.category,
                 notes=receipt_data.notes,
-                accountable_id=receipt_data.accountable_id,
-                status="verified"
+                accountable_id=receipt_data.accountable_id
             )
 
-            session.add(new_receipt)
-            await session.flush()
-
-            # Создаем транзакцию расхода
-            new_transaction = Transaction(
-                date=receipt_info["purchase_date"].date(),
-                type="expense",
-                amount=receipt_info["total_amount"],
-                description=f"Чек от {receipt_info.get('seller_name', 'N/A')}",
-                counterparty=receipt_info.get("seller_name"),
-                counterparty_inn=receipt_info.get("seller_inn"),
-                payment_method=receipt_info.get("payment_type", "cash"),
-                source="receipt_qr",
-                is_confirmed=False  # Требует подтверждения
-            )
-
-            session.add(new_transaction)
-            await session.flush()
-
-            # Связываем чек и транзакцию
-            new_receipt.transaction_id = new_transaction.id
-
             # Если это отчет по подотчету - обновляем подотчет
             if receipt_data.accountable_id:
-                result = await session.execute(
-                    select(Accountable).where(Accountable.id == receipt_data.accountable_id)
+                await crud.add_accountable_reported(
+                    session, receipt_data.accountable_id, receipt_info["total_amount"]
                 )
-                accountable = result.scalar_one_or_none()
-
-                if accountable:
-                    accountable.amount_reported += receipt_info["total_amount"]
-
-                    # Проверяем статус
-                    if accountable.amount_reported >= accountable.amount_issued:
-                        accountable.status = "reported"
-                        accountable.reported_date = date_type.today()
-                    else:
-                        accountable.status = "partial"
 
             await session.commit()
 
@@ -484,6 +438,7 @@ async def create_cash_withdrawal(
             )
 
             session.add(new_transaction)
+            await cash_ledger.apply_transaction(session, new_transaction)
             await session.commit()
 
             logger.info(
@@ -518,6 +473,10 @@ async def submit_accountable_report(
     """
     Отчет по подотчетной сумме (несколько чеков)
 
+    Чеки проверяются в ФНС параллельно и сохраняются одной транзакцией.
+    Результат возвращается по каждому QR-коду: невалидные, повторные
+    и неудачные чеки не мешают сохранить остальные.
+
     - **accountable_id**: ID подотчетной суммы
     - **receipts**: Массив QR-кодов чеков
     """
@@ -525,6 +484,8 @@ async def submit_accountable_report(
         from app.services.fns_receipt import fns_receipt_service
         from app.database.models import Accountable
 
+        qr_params = [fns_receipt_service.parse_qr_code(qr_data) for qr_data in report_data.receipts]
+
         async with async_session_maker() as session:
             # Получаем подотчет
             result = await session.execute(
@@ -535,38 +496,79 @@ async def submit_accountable_report(
             if not accountable:
                 raise HTTPException(status_code=404, detail="Accountable record not found")
 
-            receipts_created = []
-            total_reported = Decimal("0")
+            accountable_data = {
+                "id": accountable.id,
+                "amount_issued": accountable.amount_issued,
+                "amount_reported": accountable.amount_reported or Decimal("0"),
+                "status": accountable.status
+            }
+
+            # Уже принятые чеки - одним запросом
+            registered = await crud.get_registered_fiscal_keys(session, (
+                (params["fiscal_sign"], params["fiscal_document"], params["fiscal_storage"])
+                for params in qr_params if params
+            ))
+
+        outcomes = [{"index": index, "qr_data": qr_data} for index, qr_data in enumerate(report_data.receipts)]
+        to_verify = []
+        seen = set()
+
+        for outcome, params in zip(outcomes, qr_params):
+            if not params:
+                outcome.update(status="invalid", error="Invalid QR code")
+                continue
+
+            key = (params["fiscal_sign"], params["fiscal_document"], params["fiscal_storage"])
+            if key in registered or key in seen:
+                outcome.update(status="duplicate", error="Receipt already registered")
+                continue
+
+            seen.add(key)
+            to_verify.append(outcome)
+
+        # Проверка в ФНС - параллельно, с ограничением
+        receipt_infos = await fns_receipt_service.verify_receipts(
+            [outcome["qr_data"] for outcome in to_verify],
+            max_concurrency=settings.FNS_MAX_CONCURRENCY
+        )
 
-            # Обрабатываем каждый чек
-            for qr_data in report_data.receipts:
-                # Используем endpoint /receipt
-                receipt_schema = ReceiptSchema(
-                    qr_data=qr_data,
-                    accountable_id=report_data.accountable_id,
+        verified = []
+        for outcome, receipt_info in zip(to_verify, receipt_infos):
+            if receipt_info:
+                verified.append((outcome, receipt_info))
+            else:
+                outcome.update(status="error", error="FNS verification failed")
+
+        if verified:
+            async with async_session_maker() as session:
+                saved = await crud.save_accountable_receipts(
+                    session,
+                    report_data.accountable_id,
+                    [receipt_info for _, receipt_info in verified],
                     notes=report_data.notes
                 )
 
-                # Вызываем обработчик чека
-                result = await receive_receipt(receipt_schema, api_key=settings.API_KEY)
-                receipts_created.append(result["data"])
-                total_reported += Decimal(str(result["data"]["total_amount"]))
+            for (outcome, _), item in zip(verified, saved["results"]):
+                item.pop("fiscal_sign")
+                outcome.update(item)
 
-            # Обновляем статус подотчета (это уже сделано в receive_receipt, но перепроверяем)
-            await session.refresh(accountable)
+            if saved["accountable"]:
+                accountable_data = saved["accountable"]
 
-            return {
-                "status": "success",
-                "message": f"Report submitted: {len(receipts_created)} receipts processed",
-                "data": {
-                    "accountable_id": accountable.id,
-                    "amount_issued": float(accountable.amount_issued),
-                    "amount_reported": float(accountable.amount_reported),
-                    "amount_remaining": float(accountable.amount_remaining),
-                    "status": accountable.status,
-                    "receipts": receipts_created
-                }
+        failed = sum(1 for outcome in outcomes if outcome["status"] != "success")
+
+        return {
+            "status": "success" if not failed else "partial",
+            "message": f"Report submitted: {len(outcomes) - failed} of {len(outcomes)} receipts processed",
+            "data": {
+                "accountable_id": accountable_data["id"],
+                "amount_issued": float(accountable_data["amount_issued"]),
+                "amount_reported": float(accountable_data["amount_reported"]),
+                "amount_remaining": float(accountable_data["amount_issued"] - accountable_data["amount_reported"]),
+                "status": accountable_data["status"],
+                "receipts": outcomes
             }
+        }
 
     except HTTPException:
         raise
@@ -41,6 +41,11 @@ class ShiftReportSchema(BaseModel):
         }
 
 
+class ShiftReportBatchSchema(BaseModel):
+    """Схема пакета отчетов о сменах (дозагрузка истории)"""
+    reports: List[ShiftReportSchema] = Field(..., min_length=1, max_length=500)
+
+
 class TransactionSchema(BaseModel):
     """Схема транзакции"""
     date: date
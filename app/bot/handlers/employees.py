@@ -15,7 +15,8 @@ from ..filters import IsOwner, IsAdmin
 from ..keyboards import get_employees_keyboard, get_employee_card_keyboard, get_contract_type_keyboard
 from ...database.db import async_session
 from ...database.models import Employee, Contract
-from ...services.document_generator import DocumentGenerator
+from ...services.document_generator import DocumentGenerator, employee_document_data, contract_document_data
+from ...services.generation_executor import generation_executor
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -258,14 +259,20 @@ async def generate_contract_callback(callback: CallbackQuery):
         # Генерация документа
         generator = DocumentGenerator()
 
+        # В процесс генерации передаются только простые данные
+        employee_data = employee_document_data(employee)
+        contract_data = contract_document_data(contract)
+
         try:
+            # Документ формируется в процессе генерации, не блокируя бота
             if contract_type == "TD":
-                filepath = generator.generate_labor_contract(employee, contract)
+                filepath = await generation_executor.run(generator.generate_labor_contract, employee_data, contract_data)
             elif contract_type == "GPH":
-                filepath = generator.generate_gph_contract(employee, contract)
+                filepath = await generation_executor.run(generator.generate_gph_contract, employee_data, contract_data)
             elif contract_type == "OFFER":
-                filepath = generator.generate_offer(
-                    employee,
+                filepath = await generation_executor.run(
+                    generator.generate_offer,
+                    employee_data,
                     employee.hourly_rate or 150.0
                 )
             else:
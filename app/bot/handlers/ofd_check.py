@@ -10,7 +10,9 @@ from sqlalchemy import select
 
 from ...database.db import async_session
 from ...database.models import Shift
-from ...services.sbis_ofd import validate_shift_with_ofd, get_shift_validation_report
+from ...services.sbis_ofd import (
+    validate_shifts_with_ofd, get_shift_validation, get_shift_validation_report
+)
 from ..keyboards import get_admin_keyboard, get_owner_keyboard
 
 router = Router()
@@ -133,19 +135,22 @@ async def check_week_handler(message: Message):
             await message.answer("❌ Смены за последнюю неделю не найдены.")
             return
 
-        # Проверить каждую смену
+        # Проверить все смены параллельно через общий клиент ОФД
+        validations = await validate_shifts_with_ofd([
+            {
+                "shift_date": shift.date,
+                "fact_cash": float(shift.cash_fact or 0),
+                "fact_cashless": float(shift.cashless_fact or 0),
+                "fact_qr": float(shift.qr_payments or 0)
+            }
+            for shift in shifts
+        ], max_concurrency=len(shifts))
+
         issues = []
         all_ok = []
 
-        for shift in shifts:
-            validation = await validate_shift_with_ofd(
-                shift_date=shift.date,
-                fact_cash=float(shift.cash_fact or 0),
-                fact_cashless=float(shift.cashless_fact or 0),
-                fact_qr=float(shift.qr_payments or 0)
-            )
-
-            if validation["status"] == "warning":
+        for shift, validation in zip(shifts, validations):
+            if validation["status"] == "warning" and validation.get("discrepancies"):
                 disc = validation["discrepancies"]
                 issues.append({
                     "date": shift.date,
@@ -183,13 +188,11 @@ async def ofd_status_handler(message: Message):
 
     Использование: /ofd_status
     """
-    import os
-    from ...services.sbis_ofd import SbisOFD
+    from ...services.sbis_ofd import get_ofd_client
 
-    token = os.getenv("SBIS_OFD_TOKEN")
-    inn = os.getenv("COMPANY_INN")
+    sbis = get_ofd_client()
 
-    if not token or not inn:
+    if not sbis:
         await message.answer(
             "❌ СБИС ОФД не настроен\n\n"
             "Добавьте в .env файл:\n"
@@ -201,7 +204,6 @@ async def ofd_status_handler(message: Message):
     await message.answer("🔍 Проверяю подключение к СБИС ОФД...")
 
     # Попробовать получить данные
-    sbis = SbisOFD(token, inn)
     shift_data = await sbis.get_shift_totals(date.today())
 
     if shift_data:
@@ -213,6 +215,7 @@ async def ofd_status_handler(message: Message):
             f"📊 Итого: {shift_data['total']:,.2f} ₽\n"
             f"🧾 Чеков: {shift_data['receipts_count']}\n"
             f"📋 Смена №{shift_data['shift_number']}"
+            + format_ofd_metrics(sbis.get_metrics())
         )
     else:
         await message.answer(
@@ -224,6 +227,24 @@ async def ofd_status_handler(message: Message):
         )
 
 
+def format_ofd_metrics(metrics: dict) -> str:
+    """Время ответа ОФД по endpoint для /ofd_status"""
+    if not metrics:
+        return ""
+
+    text = "\n\n⏱ Время ответа ОФД:\n"
+    for endpoint, stats in metrics.items():
+        text += (
+            f"• {endpoint}: {stats['requests']} запр., "
+            f"ср. {stats['avg_ms']:.0f} мс, макс. {stats['max_ms']:.0f} мс"
+        )
+        if stats['errors']:
+            text += f", ошибок {stats['errors']}"
+        text += "\n"
+
+    return text.rstrip()
+
+
 @router.message(Command("auto_check"))
 async def auto_check_handler(message: Message):
     """
@@ -266,7 +287,7 @@ async def validate_and_notify(
         True - смена совпадает
         False - есть расхождения
     """
-    validation = await validate_shift_with_ofd(
+    validation, report = await get_shift_validation(
         shift_date, cash, cashless, qr
     )
 
@@ -278,11 +299,6 @@ async def validate_and_notify(
         return False
 
     elif validation["status"] == "warning":
-        # Получить полный отчет
-        report = await get_shift_validation_report(
-            shift_date, cash, cashless, qr
-        )
-
         await bot.send_message(
             chat_id,
             f"⚠️ ОБНАРУЖЕНЫ РАСХОЖДЕНИЯ!\n\n{report}"
@@ -3,12 +3,13 @@
 """
 from aiogram import Router, F
 from aiogram.filters import Command
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message, CallbackQuery, FSInputFile
 from app.bot.filters import IsOwner
 from app.database.db import async_session_maker
-from app.database import crud
+from app.database import crud, cash_ledger, artifacts
 from app.services.calculator import calculate_usn_tax, get_tax_summary
-from app.services.kudir_generator import generate_kudir_file
+from app.services.kudir_generator import get_kudir_artifact
 from app.services.cash_control import check_cash_discipline, get_cash_discipline_report
 from datetime import datetime, date, timedelta
 import logging
@@ -99,14 +100,21 @@ async def cmd_kudir(event: Message | CallbackQuery):
         year = datetime.now().year
 
         async with async_session_maker() as session:
-            filepath = await generate_kudir_file(session, year)
+            artifact = await get_kudir_artifact(session, year)
 
-        document = FSInputFile(filepath)
+            caption = f"📊 КУДиР за {year} год\n\nООО \"Лепта\""
+            upload = FSInputFile(artifact.file_path, filename=f"kudir_{year}.xlsx")
 
-        await message.answer_document(
-            document,
-            caption=f"📊 КУДиР за {year} год\n\nООО \"Лепта\""
-        )
+            # Уже загруженный документ отправляется по file_id без повторной загрузки
+            try:
+                sent = await message.answer_document(artifact.telegram_file_id or upload, caption=caption)
+            except TelegramBadRequest:
+                if not artifact.telegram_file_id:
+                    raise
+                sent = await message.answer_document(upload, caption=caption)
+
+            if sent.document and sent.document.file_id != artifact.telegram_file_id:
+                await artifacts.set_telegram_file_id(session, artifact.id, sent.document.file_id)
 
         if isinstance(event, CallbackQuery):
             await event.answer("✅ КУДиР сгенерирована")
@@ -240,6 +248,105 @@ async def cmd_check_cash(message: Message):
     await message.answer(text, parse_mode="HTML")
 
 
+@router.message(Command("rebuild_ledger"))
+async def cmd_rebuild_ledger(message: Message):
+    """Пересборка кассовой книги с нуля"""
+    await message.answer("⏳ Пересобираю кассовую книгу...")
+
+    try:
+        async with async_session_maker() as session:
+            days = await cash_ledger.rebuild_cash_ledger(session)
+            balance = await cash_ledger.get_ledger_balance(session, date.today())
+
+        await message.answer(
+            f"✅ <b>Кассовая книга пересобрана</b>\n\n"
+            f"📅 Дней с движением: {days}\n"
+            f"💵 Остаток на сегодня: {balance:,.2f} ₽",
+            parse_mode="HTML"
+        )
+
+    except Exception as e:
+        logger.error(f"Error rebuilding cash ledger: {e}")
+        await message.answer(f"❌ Ошибка: {str(e)}")
+
+
+@router.message(Command("check_ledger"))
+async def cmd_check_ledger(message: Message):
+    """Сверка кассовой книги с полным пересчетом транзакций"""
+    async with async_session_maker() as session:
+        result = await cash_ledger.check_cash_ledger(session)
+
+    text = (
+        f"🔍 <b>Сверка кассовой книги</b>\n📅 {date.today().strftime('%d.%m.%Y')}\n\n"
+        f"📒 По книге: {result['ledger_balance']:,.2f} ₽\n"
+        f"🧮 По транзакциям: {result['full_scan_balance']:,.2f} ₽\n"
+    )
+
+    if result['is_consistent']:
+        text += "\n✅ Книга совпадает с транзакциями"
+    else:
+        text += f"\n⚠️ Разница: {result['difference']:,.2f} ₽\n"
+        if result['mismatched_days']:
+            text += f"Дни с расхождениями: {', '.join(result['mismatched_days'][:10])}\n"
+        text += "\nИспользуйте /rebuild_ledger для пересборки"
+
+    await message.answer(text, parse_mode="HTML")
+
+
+@router.message(Command("ocr_stats"))
+async def cmd_ocr_stats(message: Message):
+    """Метрики очереди распознавания чеков"""
+    from app.services.ocr_queue import ocr_queue
+    from app.services import ocr_cache, qr_decoder
+    from app.services.fns_receipt import fns_receipt_service
+
+    metrics = ocr_queue.get_metrics()
+    wait = metrics['wait']
+    process = metrics['process']
+    cache = ocr_cache.get_stats()
+    qr = qr_decoder.get_stats()
+
+    text = (
+        f"🔍 <b>Очередь распознавания чеков</b>\n\n"
+        f"👷 Воркеров: {metrics['workers']}\n"
+        f"📥 В очереди: {metrics['queue_depth']}\n"
+        f"⚙️ В работе: {metrics['in_progress']}\n"
+        f"✅ Распознано: {metrics['processed']}\n"
+        f"❌ Не распознано: {metrics['failed']}\n\n"
+        f"⏳ Ожидание: ср. {wait['avg_ms']:.0f} мс, p95 {wait['p95_ms']:.0f} мс\n"
+        f"⏱ Распознавание: ср. {process['avg_ms']:.0f} мс, "
+        f"p95 {process['p95_ms']:.0f} мс, макс. {process['max_ms']:.0f} мс\n\n"
+        f"🗂 <b>Кэш</b>: попаданий {cache['hits']} из {cache['hits'] + cache['misses']} "
+        f"({cache['hit_rate']:.0%})\n"
+        f"   по file_id: {cache['file']}, по содержимому: {cache['content']}, "
+        f"из документов: {cache['document']}\n\n"
+    )
+
+    if qr['available']:
+        text += (
+            f"⚡ <b>QR-код чека</b>: {qr['fiscal']} из {qr['attempts']} фото ({qr['hit_rate']:.0%}) "
+            f"без OCR\n"
+            f"   QR найден: {qr['qr_found']}, декодирование ср. {qr['avg_decode_ms']:.0f} мс"
+        )
+    else:
+        text += "⚡ QR-код чека: не установлен opencv-python-headless"
+
+    fns = fns_receipt_service.get_provider_stats()
+    text += (
+        f"\n\n🧾 <b>API ФНС</b> ({fns['hedge_mode']}): запросов {fns['upstream_requests']}, "
+        f"из кэша {fns['cache_hits']}, объединено {fns['coalesced']}, хеджировано {fns['hedged']}\n"
+    )
+    for name in fns['order']:
+        provider = fns['providers'][name]
+        p95 = f"{provider['p95_ms']:.0f} мс" if provider['p95_ms'] is not None else "—"
+        text += (
+            f"   {name}: ✅ {provider['success']} ❌ {provider['failure']} "
+            f"⏹ {provider['cancelled']}, p95 {p95}\n"
+        )
+
+    await message.answer(text, parse_mode="HTML")
+
+
 @router.message(Command("year_summary"))
 async def cmd_year_summary(message: Message):
     """Годовая сводка"""
@@ -1,6 +1,7 @@
 """
 Обработчики для работы с зарплатой
 """
+import asyncio
 import logging
 from datetime import date
 from aiogram import Router
@@ -9,9 +10,7 @@ from aiogram.filters import Command
 
 from ..filters import IsOwner
 from ...database.db import async_session
-from ...database.models import Payroll, Employee
 from ...services.payroll_calculator import PayrollCalculator
-from sqlalchemy import select
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -34,7 +33,8 @@ async def cmd_payroll(message: Message):
             calculator = PayrollCalculator(session)
 
             # Рассчитать для всех сотрудников
-            payrolls = await calculator.calculate_all_payrolls(year, month)
+            run = await calculator.run_payroll(year, month)
+            payrolls = run['payrolls']
 
             if not payrolls:
                 await message.answer("❌ Нет данных для расчета")
@@ -66,7 +66,10 @@ async def cmd_payroll(message: Message):
             text += f"НДФЛ: {total_ndfl:,.2f} руб.\n"
             text += f"К выплате: {total_net:,.2f} руб.\n"
             text += f"Страховые взносы: {total_contributions:,.2f} руб.\n"
-            text += f"*Всего затрат: {total_gross + total_contributions:,.2f} руб.*"
+            text += f"*Всего затрат: {total_gross + total_contributions:,.2f} руб.*\n\n"
+            text += f"⏱ Расчет: {run['duration_ms']:.0f} мс"
+            if run['skipped']:
+                text += f", без ставки пропущено: {len(run['skipped'])}"
 
             await message.answer(text, parse_mode="Markdown")
 
@@ -129,21 +132,29 @@ async def cmd_taxes_quarter(message: Message):
 
 @router.message(Command("import_shifts"), IsOwner())
 async def cmd_import_shifts(message: Message):
-    """Импорт смен из Bot_Claude"""
+    """
+    Импорт смен из Bot_Claude
+
+    Использование: /import_shifts [дней] - по умолчанию за 7 дней,
+    например /import_shifts 180 для загрузки истории
+    """
     from ...services.shift_importer import ShiftImporter
     from datetime import timedelta
 
+    args = message.text.split(maxsplit=1)
+    days = int(args[1]) if len(args) > 1 and args[1].strip().isdigit() else 7
+
     try:
-        await message.answer("⏳ Импорт смен из Bot_Claude...")
+        await message.answer(f"⏳ Импорт смен из Bot_Claude за {days} дн...")
 
         async with async_session() as session:
             importer = ShiftImporter(session)
 
-            # Импорт за последние 7 дней
             end_date = date.today()
-            start_date = end_date - timedelta(days=7)
+            start_date = end_date - timedelta(days=days)
 
             stats = await importer.import_shifts(start_date, end_date)
+            await importer.import_shift_reports(start_date, end_date)
 
             text = (
                 f"✅ *Импорт завершен*\n\n"
@@ -160,6 +171,40 @@ async def cmd_import_shifts(message: Message):
         await message.answer(f"❌ Ошибка импорта: {e}")
 
 
+@router.message(Command("check_bot_claude"), IsOwner())
+async def cmd_check_bot_claude(message: Message):
+    """Сверка смен и отчетов о сменах с Bot_Claude за всю историю"""
+    from ...services.bot_claude_reconcile import BotClaudeReconciler
+
+    try:
+        await message.answer("⏳ Сверка с Bot_Claude...")
+
+        async with async_session() as session:
+            reconciler = BotClaudeReconciler(session)
+            reports = [await reconciler.reconcile(table) for table in ('shifts', 'shift_reports')]
+
+        text = "🔍 *Сверка с Bot_Claude*\n"
+        for report, title in zip(reports, ('Смены', 'Отчеты о сменах')):
+            text += (
+                f"\n*{title}:* {'✅ совпадают' if report['consistent'] else '⚠️ есть расхождения'}\n"
+                f"Месяцев: {report['months_checked']}, с расхождениями: {report['months_differ']}\n"
+            )
+            if not report['consistent']:
+                text += (
+                    f"Дней с расхождениями: {report['days_differ']}\n"
+                    f"Нет в бухгалтерии: {len(report['missing'])}\n"
+                    f"Нет в Bot_Claude: {len(report['extra'])}\n"
+                    f"Изменены: {len(report['changed'])}\n"
+                    f"Дубли: {len(report['duplicates'])}\n"
+                )
+
+        await message.answer(text, parse_mode="Markdown")
+
+    except Exception as e:
+        logger.error(f"Error reconciling with Bot_Claude: {e}", exc_info=True)
+        await message.answer(f"❌ Ошибка сверки: {e}")
+
+
 @router.message(Command("generate_reports"), IsOwner())
 async def cmd_generate_reports(message: Message):
     """Генерация всех отчетов"""
@@ -167,7 +212,8 @@ async def cmd_generate_reports(message: Message):
         RSVGenerator, SZVMGenerator, EFS1Generator, USNDeclarationGenerator
     )
     from ...services.payroll_calculator import PayrollCalculator
-    from sqlalchemy import func
+    from ...services.generation_executor import generation_executor
+    from ...database import reporting
 
     today = date.today()
     year = today.year
@@ -183,80 +229,54 @@ async def cmd_generate_reports(message: Message):
         await message.answer(f"⏳ Генерация отчетов за {quarter} квартал {year}...")
 
         async with async_session() as session:
-            # Получить данные
             calculator = PayrollCalculator(session)
 
-            # Получить зарплаты
-            month_start = (quarter - 1) * 3 + 1
-            month_end = month_start + 2
-
-            result = await session.execute(
-                select(Payroll).where(
-                    Payroll.period_year == year,
-                    Payroll.period_month >= month_start,
-                    Payroll.period_month <= month_end
-                )
-            )
-            payrolls_db = result.scalars().all()
-
-            # Преобразовать в словари
-            payrolls = []
-            for p in payrolls_db:
-                employee = await session.get(Employee, p.employee_id)
-                payrolls.append({
-                    'employee_name': employee.full_name if employee else 'Unknown',
-                    'gross_salary': p.gross_salary,
-                    'contributions': {
-                        'pension': p.gross_salary * calculator.PENSION_RATE if p.gross_salary else 0,
-                        'medical': p.gross_salary * calculator.MEDICAL_RATE if p.gross_salary else 0,
-                        'social': p.gross_salary * calculator.SOCIAL_RATE if p.gross_salary else 0,
-                        'injury': p.gross_salary * calculator.INJURY_RATE if p.gross_salary else 0,
-                    }
-                })
-
-            # Налоги
-            tax_data = await calculator.calculate_quarterly_taxes(year, quarter)
-
-            # Генерация РСВ
-            rsv_gen = RSVGenerator()
-            rsv_path = rsv_gen.generate(year, quarter, payrolls, tax_data)
-
-            # Генерация СЗВ-М (за последний месяц квартала)
-            result = await session.execute(select(Employee).where(Employee.fire_date.is_(None)))
-            employees = result.scalars().all()
-            employees_data = [
-                {
-                    'full_name': e.full_name,
-                    'snils': e.snils,
-                    'inn': e.inn
-                }
-                for e in employees
-            ]
-
-            szv_gen = SZVMGenerator()
-            szv_path = szv_gen.generate(year, month_end, employees_data)
-
-            # Генерация ЕФС-1
-            efs_gen = EFS1Generator()
-            employees_full = [
-                {
-                    'full_name': e.full_name,
-                    'position': 'Администратор',
-                    'hire_date': e.hire_date,
-                    'employment_type': e.employment_type
-                }
-                for e in employees
-            ]
-            efs_path = efs_gen.generate(year, quarter, employees_full, [])
-
-            text = (
-                f"✅ *Отчеты сгенерированы*\n\n"
-                f"📄 РСВ: `{rsv_path}`\n"
-                f"📄 СЗВ-М: `{szv_path}`\n"
-                f"📄 ЕФС-1: `{efs_path}`\n"
-            )
-
-            await message.answer(text, parse_mode="Markdown")
+            # Начисления с сотрудниками и работающие сотрудники - два запроса
+            data = await reporting.get_quarter_report_data(session, year, quarter)
+
+            payrolls = calculator.report_payrolls(data['payroll'])
+
+            # Налоги - по тем же начислениям, без повторной выборки
+            tax_data = await calculator.calculate_quarterly_taxes(year, quarter, data['payroll'])
+
+        # Сотрудники для СЗВ-М (за последний месяц квартала) и ЕФС-1
+        employees = data['employees']
+        employees_data = [
+            {
+                'full_name': e.full_name,
+                'snils': e.snils,
+                'inn': e.inn
+            }
+            for e in employees
+        ]
+
+        employees_full = [
+            {
+                'full_name': e.full_name,
+                'position': 'Администратор',
+                'hire_date': e.hire_date,
+                'employment_type': e.employment_type
+            }
+            for e in employees
+        ]
+
+        _, month_end = reporting.quarter_months(quarter)
+
+        # РСВ, СЗВ-М и ЕФС-1 - параллельно в процессах генерации
+        rsv_path, szv_path, efs_path = await asyncio.gather(
+            generation_executor.run(RSVGenerator().generate, year, quarter, payrolls, tax_data),
+            generation_executor.run(SZVMGenerator().generate, year, month_end, employees_data),
+            generation_executor.run(EFS1Generator().generate, year, quarter, employees_full, [])
+        )
+
+        text = (
+            f"✅ *Отчеты сгенерированы*\n\n"
+            f"📄 РСВ: `{rsv_path}`\n"
+            f"📄 СЗВ-М: `{szv_path}`\n"
+            f"📄 ЕФС-1: `{efs_path}`\n"
+        )
+
+        await message.answer(text, parse_mode="Markdown")
 
     except Exception as e:
         logger.error(f"Error generating reports: {e}", exc_info=True)
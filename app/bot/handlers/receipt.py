@@ -4,12 +4,16 @@
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
-from app.services.ocr_service import recognize_receipt
+from app.services.ocr_queue import ocr_queue
+from app.services import ocr_cache
+from app.services.qr_decoder import recognize_fiscal_qr
 from app.database.db import async_session_maker
 from app.database import crud
 from app.bot.keyboards import get_receipt_confirmation_keyboard
 from datetime import datetime
 from decimal import Decimal
+from typing import Dict, Optional
+import asyncio
 import logging
 
 router = Router()
@@ -19,20 +23,79 @@ logger = logging.getLogger(__name__)
 @router.message(F.photo)
 async def handle_receipt_photo(message: Message, state: FSMContext):
     """Обработка фото чеков"""
-    await message.answer("🔍 Распознаю чек...")
-
     try:
-        # Скачиваем фото (берем самое большое разрешение)
+        # Берем самое большое разрешение
         photo = message.photo[-1]
+
+        # То же фото уже распознавали - без скачивания и OCR
+        async with async_session_maker() as session:
+            cached = await ocr_cache.get_by_file(session, photo.file_unique_id, photo.file_id)
+
+        if cached:
+            await show_recognized_receipt(message, state, cached, photo.file_id)
+            return
+
+        # Скачиваем фото
         file = await message.bot.get_file(photo.file_id)
         photo_bytes = await message.bot.download_file(file.file_path)
 
         # Читаем байты
         photo_data = photo_bytes.read()
 
-        # OCR через Claude Vision
-        receipt_data = await recognize_receipt(photo_data)
+        # Быстрый путь: фискальный QR-код на чеке -> данные из ФНС без OCR
+        receipt_data = await recognize_fiscal_qr(photo_data)
+
+        if receipt_data:
+            await show_recognized_receipt(message, state, receipt_data, photo.file_id)
+            return
+
+        # Это же изображение уже распознавали
+        sha256 = ocr_cache.content_hash(photo_data)
+        async with async_session_maker() as session:
+            cached = await ocr_cache.get_by_image(session, sha256)
+
+        if cached:
+            await show_recognized_receipt(message, state, cached, photo.file_id)
+            return
+
+        async def on_recognized(receipt_data):
+            if receipt_data:
+                try:
+                    async with async_session_maker() as session:
+                        await ocr_cache.store(session, sha256, receipt_data, photo.file_unique_id)
+                except Exception as e:
+                    logger.warning(f"Could not cache OCR result: {e}")
+
+            await show_recognized_receipt(message, state, receipt_data, photo.file_id)
+
+        # OCR выполняется воркерами очереди, результат придет в on_recognized
+        ahead = ocr_queue.submit(photo_data, on_recognized)
 
+    except asyncio.QueueFull:
+        await message.answer("⏳ Сейчас распознается слишком много чеков. Отправьте фото чуть позже.")
+        return
+
+    except Exception as e:
+        logger.error(f"Error processing receipt photo: {e}")
+        await message.answer(
+            "❌ Ошибка при обработке фото. Попробуйте еще раз или добавьте данные вручную."
+        )
+        return
+
+    if ahead:
+        await message.answer(f"🔍 Распознаю чек... (в очереди перед вами: {ahead})")
+    else:
+        await message.answer("🔍 Распознаю чек...")
+
+
+async def show_recognized_receipt(
+    message: Message,
+    state: FSMContext,
+    receipt_data: Optional[Dict],
+    photo_file_id: str
+):
+    """Показать результат распознавания и предложить подтвердить"""
+    try:
         if not receipt_data:
             await message.answer(
                 "❌ Не удалось распознать чек. Попробуйте:\n"
@@ -44,7 +107,7 @@ async def handle_receipt_photo(message: Message, state: FSMContext):
         # Сохраняем данные в состояние
         await state.update_data(
             receipt_data=receipt_data,
-            photo_file_id=photo.file_id,
+            photo_file_id=photo_file_id,
             user_id=message.from_user.id
         )
 
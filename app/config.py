@@ -19,6 +19,25 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str
     OPENAI_MODEL: str = "gpt-4o"  # Для OCR с изображениями
     OPENAI_CATEGORIZER_MODEL: str = "gpt-3.5-turbo"  # Для категоризации
+    OCR_WORKERS: int = 3  # Одновременных запросов распознавания чеков
+    OCR_QUEUE_SIZE: int = 100  # Максимум фото в очереди
+    OCR_CACHE_SIZE: int = 5000  # Записей в кэше распознанных чеков
+    GENERATION_WORKERS: int = 2  # Процессов для генерации отчетов и документов
+
+    # ФНС (проверка чеков)
+    FNS_HEDGE_MODE: str = "delay"  # off - по очереди, delay - второй API после задержки, race - оба сразу
+    FNS_HEDGE_DELAY: float = 1.0  # Задержка второго запроса, пока нет статистики (сек)
+    FNS_MAX_CONCURRENCY: int = 5  # Одновременных проверок чеков в одном отчете
+
+    # Касса
+    CASH_LIMIT: int = 100000  # Лимит остатка наличных в кассе (руб.)
+    CASH_LIMIT_WINDOW_DAYS: int = 30  # Окно ежедневной проверки лимита (дней)
+
+    # Bot_Claude (смены клуба)
+    BOT_CLAUDE_DB_PATH: str = "/opt/club_assistant/knowledge.db"
+    BOT_CLAUDE_WATCH: bool = True  # Импорт смен сразу после изменений БД
+    BOT_CLAUDE_WATCH_DEBOUNCE: float = 2.0  # Пауза в записи перед импортом (сек)
+    BOT_CLAUDE_WATCH_POLL_INTERVAL: float = 5.0  # Опрос файла без inotify (сек)
 
     # Database
     DB_HOST: str = "localhost"
@@ -44,6 +63,9 @@ class Settings(BaseSettings):
     DOCUMENTS_PATH: str = "/app/documents"
     BACKUPS_PATH: str = "/backups"
     TEMPLATES_PATH: str = "/app/templates"
+    ARTIFACTS_PATH: str = "/app/documents/generated"  # Кэш сгенерированных отчетов
+    ARTIFACTS_MAX_AGE_DAYS: int = 30
+    ARTIFACTS_MAX_BYTES: int = 500 * 1024 * 1024
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,122 @@
+"""
+Агрегации по транзакциям на стороне БД
+
+Вместо загрузки всех транзакций периода в виде ORM-объектов
+суммы и количества считаются одним запросом SUM/COUNT ... GROUP BY
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, and_, func, Select
+from app.database.models import Category, Transaction
+from datetime import date
+from typing import Dict, Iterable
+from decimal import Decimal
+
+
+def period_totals_query(start_date: date, end_date: date) -> Select:
+    """
+    Запрос итогов подтвержденных транзакций за период
+
+    Группировка по типу транзакции и признаку учета расхода в УСН.
+    Транзакции без категории попадают в группу с tax_deductible = NULL.
+    """
+    return (
+        select(
+            Transaction.type,
+            Category.tax_deductible,
+            func.count(Transaction.id),
+            func.coalesce(func.sum(Transaction.amount), 0)
+        )
+        .select_from(Transaction)
+        .outerjoin(Category, Transaction.category_id == Category.id)
+        .where(
+            and_(
+                Transaction.date >= start_date,
+                Transaction.date <= end_date,
+                Transaction.is_confirmed == True
+            )
+        )
+        .group_by(Transaction.type, Category.tax_deductible)
+    )
+
+
+def empty_totals() -> Dict:
+    """Пустые итоги периода"""
+    return {
+        'total_income': Decimal('0'),
+        'total_expense': Decimal('0'),
+        'deductible_expense': Decimal('0'),
+        'income_count': 0,
+        'expense_count': 0,
+        'deductible_count': 0
+    }
+
+
+def fold_period_totals(rows: Iterable) -> Dict:
+    """
+    Свернуть строки (type, tax_deductible, count, sum) в итоги периода
+
+    Расход учитывается в УСН только если у него есть категория
+    с tax_deductible = True (так же, как при расчете в Python).
+    """
+    totals = empty_totals()
+
+    for type_, tax_deductible, count, amount in rows:
+        amount = Decimal(str(amount))
+
+        if type_ == 'income':
+            totals['total_income'] += amount
+            totals['income_count'] += count
+        elif type_ == 'expense':
+            totals['total_expense'] += amount
+            totals['expense_count'] += count
+            if tax_deductible:
+                totals['deductible_expense'] += amount
+                totals['deductible_count'] += count
+
+    return totals
+
+
+async def get_period_totals(
+    session: AsyncSession,
+    start_date: date,
+    end_date: date
+) -> Dict:
+    """
+    Итоги подтвержденных транзакций за период одним запросом
+
+    Returns:
+        Dict с суммами (Decimal) и количеством операций:
+        total_income, total_expense, deductible_expense,
+        income_count, expense_count, deductible_count
+    """
+    result = await session.execute(period_totals_query(start_date, end_date))
+    return fold_period_totals(result.all())
+
+
+def monthly_totals_query(start_date: date, end_date: date) -> Select:
+    """Тот же запрос итогов, дополнительно сгруппированный по месяцам"""
+    month = func.extract('month', Transaction.date)
+    return (
+        period_totals_query(start_date, end_date)
+        .add_columns(month)
+        .group_by(month)
+    )
+
+
+async def get_monthly_totals(session: AsyncSession, year: int) -> Dict[int, list]:
+    """
+    Итоги подтвержденных транзакций за год по месяцам одним запросом
+
+    Returns:
+        Dict {месяц: [(type, tax_deductible, count, sum), ...]} -
+        строки для fold_period_totals, месяцы без операций отсутствуют
+    """
+    result = await session.execute(
+        monthly_totals_query(date(year, 1, 1), date(year, 12, 31))
+    )
+
+    months: Dict[int, list] = {}
+    for type_, tax_deductible, count, amount, month in result.all():
+        months.setdefault(int(month), []).append((type_, tax_deductible, count, amount))
+
+    return months
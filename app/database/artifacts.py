@@ -0,0 +1,243 @@
+"""
+Кэш сгенерированных файлов отчетов
+
+Файл отчета (КУДиР и др.) ищется по типу, периоду и версии данных
+периода. Версия - отпечаток подтвержденных транзакций периода
+(количество, сумма, последние id и отметки времени): пока он не
+изменился, отчет не генерируется заново.
+
+Подтверждение и удаление транзакции сразу удаляют файлы периодов,
+в которые она попадает. Старые и лишние по объему файлы вытесняются.
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, delete, and_, func
+from app.database.models import Transaction, GeneratedArtifact
+from app.config import settings
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+async def get_data_version(session: AsyncSession, start_date: date, end_date: date) -> str:
+    """
+    Версия данных периода - одним агрегирующим запросом
+
+    Меняется при добавлении, подтверждении, удалении транзакции
+    и изменении ее суммы.
+    """
+    result = await session.execute(
+        select(
+            func.count(Transaction.id),
+            func.coalesce(func.sum(Transaction.amount), 0),
+            func.max(Transaction.id),
+            func.max(Transaction.created_at),
+            func.max(Transaction.confirmed_at)
+        ).where(
+            and_(
+                Transaction.date >= start_date,
+                Transaction.date <= end_date,
+                Transaction.is_confirmed == True
+            )
+        )
+    )
+    fingerprint = "|".join(str(value) for value in result.one())
+    return hashlib.sha1(fingerprint.encode()).hexdigest()
+
+
+def artifact_path(report_type: str, start_date: date, end_date: date, version: str, extension: str = 'xlsx') -> str:
+    """Путь файла отчета в каталоге кэша"""
+    os.makedirs(settings.ARTIFACTS_PATH, exist_ok=True)
+    filename = f"{report_type}_{start_date:%Y%m%d}_{end_date:%Y%m%d}_{version[:12]}.{extension}"
+    return os.path.join(settings.ARTIFACTS_PATH, filename)
+
+
+def _remove_files(paths: Iterable[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove artifact {path}: {e}")
+
+
+async def get_artifact(
+    session: AsyncSession,
+    report_type: str,
+    start_date: date,
+    end_date: date,
+    version: str
+) -> Optional[GeneratedArtifact]:
+    """
+    Готовый файл отчета для этой версии данных
+
+    Returns:
+        Запись кэша или None (в том числе если файл пропал с диска)
+    """
+    result = await session.execute(
+        select(GeneratedArtifact).where(
+            and_(
+                GeneratedArtifact.report_type == report_type,
+                GeneratedArtifact.period_start == start_date,
+                GeneratedArtifact.period_end == end_date,
+                GeneratedArtifact.data_version == version
+            )
+        )
+    )
+    artifact = result.scalars().first()
+
+    if not artifact:
+        return None
+
+    if not os.path.exists(artifact.file_path):
+        await session.delete(artifact)
+        await session.commit()
+        return None
+
+    await session.execute(
+        update(GeneratedArtifact)
+        .where(GeneratedArtifact.id == artifact.id)
+        .values(hits=GeneratedArtifact.hits + 1, last_used_at=func.now())
+    )
+    await session.commit()
+
+    return artifact
+
+
+async def save_artifact(
+    session: AsyncSession,
+    report_type: str,
+    start_date: date,
+    end_date: date,
+    version: str,
+    file_path: str
+) -> GeneratedArtifact:
+    """
+    Запомнить сгенерированный файл
+
+    Файлы прежних версий того же отчета за тот же период удаляются,
+    затем кэш ужимается по возрасту и объему.
+    """
+    result = await session.execute(
+        select(GeneratedArtifact).where(
+            and_(
+                GeneratedArtifact.report_type == report_type,
+                GeneratedArtifact.period_start == start_date,
+                GeneratedArtifact.period_end == end_date
+            )
+        )
+    )
+    stale = result.scalars().all()
+    for old in stale:
+        await session.delete(old)
+    await session.flush()
+    _remove_files(old.file_path for old in stale if old.file_path != file_path)
+
+    artifact = GeneratedArtifact(
+        report_type=report_type,
+        period_start=start_date,
+        period_end=end_date,
+        data_version=version,
+        file_path=file_path,
+        file_size=os.path.getsize(file_path),
+        hits=0
+    )
+    session.add(artifact)
+    await session.commit()
+
+    await evict_artifacts(session)
+    return artifact
+
+
+async def set_telegram_file_id(session: AsyncSession, artifact_id: int, file_id: str):
+    """Запомнить file_id документа, уже загруженного в Telegram"""
+    await session.execute(
+        update(GeneratedArtifact)
+        .where(GeneratedArtifact.id == artifact_id)
+        .values(telegram_file_id=file_id)
+    )
+    await session.commit()
+
+
+async def invalidate_artifacts(session: AsyncSession, date_: date) -> int:
+    """
+    Удалить файлы отчетов за периоды, содержащие дату
+
+    Коммит остается за вызывающим кодом (в одной транзакции с изменением).
+
+    Returns:
+        Количество удаленных записей
+    """
+    result = await session.execute(
+        delete(GeneratedArtifact)
+        .where(
+            and_(
+                GeneratedArtifact.period_start <= date_,
+                GeneratedArtifact.period_end >= date_
+            )
+        )
+        .returning(GeneratedArtifact.file_path)
+    )
+    paths = result.scalars().all()
+    _remove_files(paths)
+
+    if paths:
+        logger.info(f"Invalidated {len(paths)} generated reports for {date_}")
+
+    return len(paths)
+
+
+async def evict_artifacts(
+    session: AsyncSession,
+    max_age_days: Optional[int] = None,
+    max_bytes: Optional[int] = None
+) -> int:
+    """
+    Вытеснить старые файлы и давно не использованные сверх объема
+
+    Args:
+        max_age_days: Максимальный возраст файла (по умолчанию ARTIFACTS_MAX_AGE_DAYS)
+        max_bytes: Максимальный объем кэша (по умолчанию ARTIFACTS_MAX_BYTES)
+
+    Returns:
+        Количество удаленных файлов
+    """
+    max_age_days = max_age_days or settings.ARTIFACTS_MAX_AGE_DAYS
+    max_bytes = max_bytes or settings.ARTIFACTS_MAX_BYTES
+    expire_before = datetime.now() - timedelta(days=max_age_days)
+
+    result = await session.execute(
+        select(
+            GeneratedArtifact.id,
+            GeneratedArtifact.file_path,
+            GeneratedArtifact.file_size,
+            GeneratedArtifact.created_at
+        ).order_by(GeneratedArtifact.last_used_at.desc(), GeneratedArtifact.id.desc())
+    )
+
+    evicted: List = []
+    total = 0
+    for row in result.all():
+        if row.created_at and row.created_at < expire_before:
+            evicted.append(row)
+            continue
+
+        total += row.file_size or 0
+        if total > max_bytes:
+            evicted.append(row)
+
+    if not evicted:
+        return 0
+
+    await session.execute(
+        delete(GeneratedArtifact).where(GeneratedArtifact.id.in_([row.id for row in evicted]))
+    )
+    await session.commit()
+    _remove_files(row.file_path for row in evicted)
+
+    logger.info(f"Evicted {len(evicted)} generated reports")
+    return len(evicted)
@@ -0,0 +1,252 @@
+"""
+Кассовая книга: инкрементальный учет остатка наличных
+
+Вместо пересчета всех наличных транзакций с начала времени остаток
+хранится по дням (opening / inflow / outflow / closing) и обновляется
+при создании, подтверждении и удалении транзакций.
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, delete, and_, case, func
+from sqlalchemy.dialects.postgresql import insert
+from app.database.models import Transaction, CashLedger
+from datetime import date
+from typing import Dict, Optional
+from decimal import Decimal
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _is_cash_movement(transaction: Transaction) -> bool:
+    """Влияет ли транзакция на остаток кассы"""
+    return bool(transaction.is_confirmed) and transaction.payment_method == 'cash'
+
+
+def _cash_flows_query():
+    """Приход/расход наличных по подтвержденным транзакциям"""
+    inflow = func.coalesce(func.sum(
+        case((Transaction.type == 'income', Transaction.amount), else_=0)
+    ), 0)
+    outflow = func.coalesce(func.sum(
+        case((Transaction.type == 'expense', Transaction.amount), else_=0)
+    ), 0)
+    return select(inflow, outflow).where(
+        and_(
+            Transaction.is_confirmed == True,
+            Transaction.payment_method == 'cash'
+        )
+    )
+
+
+async def apply_cash_movement(
+    session: AsyncSession,
+    date_: date,
+    inflow: Decimal = Decimal('0'),
+    outflow: Decimal = Decimal('0')
+) -> None:
+    """
+    Учесть движение наличных за день
+
+    Обновляет строку дня и сдвигает остатки всех последующих дней.
+    Коммит остается за вызывающим кодом (в одной транзакции с изменением).
+    """
+    delta = inflow - outflow
+
+    # Строка дня создается с остатком предыдущего дня. Строка предыдущего
+    # дня блокируется до коммита: параллельное движение задним числом
+    # не сдвинет ее остаток, пока этот день не создан
+    result = await session.execute(
+        select(CashLedger.closing_balance)
+        .where(CashLedger.date < date_)
+        .order_by(CashLedger.date.desc())
+        .limit(1)
+        .with_for_update()
+    )
+    opening = result.scalar() or Decimal('0')
+
+    await session.execute(
+        insert(CashLedger)
+        .values(
+            date=date_,
+            opening_balance=opening,
+            inflow=0,
+            outflow=0,
+            closing_balance=opening
+        )
+        .on_conflict_do_nothing(index_elements=['date'])
+    )
+
+    await session.execute(
+        update(CashLedger)
+        .where(CashLedger.date == date_)
+        .values(
+            inflow=CashLedger.inflow + inflow,
+            outflow=CashLedger.outflow + outflow,
+            closing_balance=CashLedger.closing_balance + delta
+        )
+    )
+
+    if delta:
+        await session.execute(
+            update(CashLedger)
+            .where(CashLedger.date > date_)
+            .values(
+                opening_balance=CashLedger.opening_balance + delta,
+                closing_balance=CashLedger.closing_balance + delta
+            )
+        )
+
+
+async def apply_transaction(
+    session: AsyncSession,
+    transaction: Transaction,
+    sign: int = 1
+) -> None:
+    """
+    Учесть транзакцию в кассовой книге
+
+    Args:
+        session: Сессия БД
+        transaction: Транзакция (учитываются только подтвержденные наличные)
+        sign: 1 - добавить движение, -1 - отменить (удаление)
+    """
+    if not _is_cash_movement(transaction):
+        return
+
+    amount = Decimal(str(transaction.amount)) * sign
+
+    if transaction.type == 'income':
+        await apply_cash_movement(session, transaction.date, inflow=amount)
+    else:
+        await apply_cash_movement(session, transaction.date, outflow=amount)
+
+
+async def get_ledger_balance(session: AsyncSession, date_: date) -> Decimal:
+    """Остаток наличных на конец дня по кассовой книге"""
+    result = await session.execute(
+        select(CashLedger.closing_balance)
+        .where(CashLedger.date <= date_)
+        .order_by(CashLedger.date.desc())
+        .limit(1)
+    )
+    return result.scalar() or Decimal('0')
+
+
+async def full_scan_cash_balance(session: AsyncSession, date_: date) -> Decimal:
+    """Остаток наличных на дату по всем транзакциям (полный пересчет)"""
+    result = await session.execute(
+        _cash_flows_query().where(Transaction.date <= date_)
+    )
+    inflow, outflow = result.one()
+    return Decimal(str(inflow)) - Decimal(str(outflow))
+
+
+async def rebuild_cash_ledger(session: AsyncSession) -> int:
+    """
+    Пересобрать кассовую книгу с нуля по транзакциям
+
+    Returns:
+        Количество дней в книге
+    """
+    result = await session.execute(
+        _cash_flows_query()
+        .add_columns(Transaction.date)
+        .group_by(Transaction.date)
+        .order_by(Transaction.date)
+    )
+    rows = result.all()
+
+    await session.execute(delete(CashLedger))
+
+    balance = Decimal('0')
+    entries = []
+    for inflow, outflow, date_ in rows:
+        inflow = Decimal(str(inflow))
+        outflow = Decimal(str(outflow))
+        opening = balance
+        balance = opening + inflow - outflow
+        entries.append({
+            'date': date_,
+            'opening_balance': opening,
+            'inflow': inflow,
+            'outflow': outflow,
+            'closing_balance': balance
+        })
+
+    if entries:
+        await session.execute(insert(CashLedger), entries)
+
+    await session.commit()
+    logger.info(f"Cash ledger rebuilt: {len(entries)} days, balance={balance}")
+    return len(entries)
+
+
+async def check_cash_ledger(session: AsyncSession, date_: Optional[date] = None) -> Dict:
+    """
+    Сверить кассовую книгу с полным пересчетом транзакций
+
+    Returns:
+        Dict с остатками по книге и по транзакциям и списком дней,
+        где движение в книге не совпадает с транзакциями
+    """
+    date_ = date_ or date.today()
+
+    ledger_balance = await get_ledger_balance(session, date_)
+    full_scan_balance = await full_scan_cash_balance(session, date_)
+
+    # Движение по дням из транзакций
+    result = await session.execute(
+        _cash_flows_query()
+        .add_columns(Transaction.date)
+        .where(Transaction.date <= date_)
+        .group_by(Transaction.date)
+    )
+    expected = {
+        row_date: (Decimal(str(inflow)), Decimal(str(outflow)))
+        for inflow, outflow, row_date in result.all()
+    }
+
+    # Движение по дням из книги
+    result = await session.execute(
+        select(
+            CashLedger.date,
+            CashLedger.opening_balance,
+            CashLedger.inflow,
+            CashLedger.outflow,
+            CashLedger.closing_balance
+        )
+        .where(CashLedger.date <= date_)
+        .order_by(CashLedger.date)
+    )
+
+    mismatched_days = []
+    previous_closing = Decimal('0')
+    seen = set()
+
+    for row_date, opening, inflow, outflow, closing in result.all():
+        seen.add(row_date)
+        expected_inflow, expected_outflow = expected.get(row_date, (Decimal('0'), Decimal('0')))
+
+        if (
+            inflow != expected_inflow
+            or outflow != expected_outflow
+            or opening != previous_closing
+            or closing != opening + inflow - outflow
+        ):
+            mismatched_days.append(row_date.isoformat())
+
+        previous_closing = closing
+
+    # Дни с движением, которых нет в книге
+    for row_date, (inflow, outflow) in expected.items():
+        if row_date not in seen and (inflow or outflow):
+            mismatched_days.append(row_date.isoformat())
+
+    return {
+        'date': date_.isoformat(),
+        'ledger_balance': float(ledger_balance),
+        'full_scan_balance': float(full_scan_balance),
+        'difference': float(ledger_balance - full_scan_balance),
+        'is_consistent': ledger_balance == full_scan_balance and not mismatched_days,
+        'mismatched_days': sorted(mismatched_days)
+    }
@@ -2,14 +2,19 @@
 CRUD операции для работы с базой данных
 """
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_, func, desc
+from sqlalchemy import select, update, and_, or_, func, desc, case
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import selectinload
+from sqlalchemy.dialects.postgresql import insert
 from app.database.models import (
     User, Category, Transaction, Document,
-    CashBalance, ShiftReport, Setting, AuditLog
+    CashBalance, ShiftReport, Setting, AuditLog, OfdShiftTotals,
+    Receipt, FNSReceiptCache, Accountable, SyncCursor
 )
+from app.database.aggregations import get_period_totals
+from app.database import cash_ledger, artifacts
 from datetime import date, datetime
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Iterable, Set, Tuple
 from decimal import Decimal
 import logging
 
@@ -94,6 +99,7 @@ async def create_transaction(session: AsyncSession, data: Dict) -> Transaction:
     """Создать транзакцию"""
     transaction = Transaction(**data)
     session.add(transaction)
+    await cash_ledger.apply_transaction(session, transaction)
     await session.commit()
     await session.refresh(transaction)
     logger.info(f"Created transaction: {transaction.id}, type: {transaction.type}, amount: {transaction.amount}")
@@ -166,10 +172,16 @@ async def confirm_transaction(
     if not transaction:
         raise ValueError(f"Transaction {transaction_id} not found")
 
+    was_confirmed = transaction.is_confirmed
+
     transaction.is_confirmed = True
     transaction.confirmed_at = datetime.now()
     transaction.confirmed_by = user_id
 
+    if not was_confirmed:
+        await cash_ledger.apply_transaction(session, transaction)
+        await artifacts.invalidate_artifacts(session, transaction.date)
+
     await session.commit()
     await session.refresh(transaction)
     logger.info(f"Transaction {transaction_id} confirmed by user {user_id}")
@@ -182,6 +194,9 @@ async def delete_transaction(session: AsyncSession, transaction_id: int) -> bool
     if not transaction:
         return False
 
+    await cash_ledger.apply_transaction(session, transaction, sign=-1)
+    if transaction.is_confirmed:
+        await artifacts.invalidate_artifacts(session, transaction.date)
     await session.delete(transaction)
     await session.commit()
     logger.info(f"Transaction {transaction_id} deleted")
@@ -224,27 +239,8 @@ async def get_current_cash_balance(session: AsyncSession) -> CashBalance:
 
 
 async def calculate_cash_balance(session: AsyncSession, date_: date) -> Decimal:
-    """Рассчитать баланс кассы на дату"""
-    # Получаем все подтвержденные транзакции до даты включительно
-    result = await session.execute(
-        select(Transaction).where(
-            and_(
-                Transaction.date <= date_,
-                Transaction.is_confirmed == True,
-                Transaction.payment_method == 'cash'
-            )
-        )
-    )
-    transactions = result.scalars().all()
-
-    balance = Decimal('0')
-    for t in transactions:
-        if t.type == 'income':
-            balance += t.amount
-        else:
-            balance -= t.amount
-
-    return balance
+    """Рассчитать баланс кассы на дату (по кассовой книге)"""
+    return await cash_ledger.get_ledger_balance(session, date_)
 
 
 async def update_cash_balance(
@@ -291,6 +287,186 @@ async def create_shift_report(session: AsyncSession, data: Dict) -> ShiftReport:
     return report
 
 
+def build_shift_transactions(data: Dict) -> List[Dict]:
+    """
+    Транзакции, создаваемые по отчету о смене
+
+    Доход = наличные + безнал + QR (подтверждается сразу),
+    расходы со смены требуют подтверждения
+    """
+    rows = []
+
+    income_amount = sum(
+        (Decimal(str(data[key])) for key in ('cash_fact', 'cashless_fact', 'qr_payments') if data.get(key)),
+        Decimal('0')
+    )
+    if income_amount > 0:
+        rows.append({
+            'date': data['date'],
+            'type': 'income',
+            'amount': income_amount,
+            'description': f"Выручка смена {data['shift']} {data['date']}",
+            'payment_method': 'mixed',
+            'source': 'shift_report',
+            'is_confirmed': True  # Автоматически подтверждаем доходы из смен
+        })
+
+    for expense in data.get('expenses') or []:
+        rows.append({
+            'date': data['date'],
+            'type': 'expense',
+            'amount': Decimal(str(expense.get('amount', 0))),
+            'description': expense.get('description', 'Расход со смены'),
+            'payment_method': None,
+            'source': 'shift_report',
+            'is_confirmed': False  # Требует подтверждения
+        })
+
+    return rows
+
+
+async def get_shift_ingest_result(
+    session: AsyncSession,
+    date_: date,
+    shift: str
+) -> Optional[Dict]:
+    """
+    Результат ранее принятого отчета о смене
+
+    Returns:
+        Сохраненный ответ первой доставки с пометкой duplicate
+        или None, если отчета за эту смену еще нет
+    """
+    result = await session.execute(
+        select(
+            ShiftReport.id,
+            ShiftReport.ingest_result,
+            ShiftReport.cash_fact,
+            ShiftReport.cashless_fact,
+            ShiftReport.qr_payments
+        )
+        .where(and_(ShiftReport.date == date_, ShiftReport.shift == shift))
+    )
+    row = result.first()
+
+    if not row:
+        return None
+
+    report_id, ingest_result, *amounts = row
+
+    if ingest_result is None:
+        # Отчет загружен до появления ingest_result
+        ingest_result = {
+            'report_id': report_id,
+            'transactions_created': [],
+            'total_revenue': float(sum((a for a in amounts if a), Decimal('0')))
+        }
+
+    return {**ingest_result, 'duplicate': True}
+
+
+async def ingest_shift_report(session: AsyncSession, data: Dict, commit: bool = True) -> Dict:
+    """
+    Сохранить отчет о смене вместе с транзакциями
+
+    Отчет и все транзакции вставляются в одной транзакции БД,
+    id возвращаются через RETURNING без отдельных refresh.
+
+    Повторная доставка той же смены (date, shift) ничего не пишет и
+    возвращает результат первой доставки с duplicate = True.
+    Одновременные доставки разводит INSERT ... ON CONFLICT DO NOTHING.
+
+    Returns:
+        Dict с report_id, transactions_created, total_revenue и duplicate
+    """
+    existing = await get_shift_ingest_result(session, data['date'], data['shift'])
+    if existing:
+        return existing
+
+    result = await session.execute(
+        insert(ShiftReport)
+        .values(**data)
+        .on_conflict_do_nothing(index_elements=['date', 'shift'])
+        .returning(ShiftReport.id)
+    )
+    report_id = result.scalar()
+
+    if report_id is None:
+        # Параллельная доставка успела вставить отчет первой
+        return await get_shift_ingest_result(session, data['date'], data['shift'])
+
+    rows = build_shift_transactions(data)
+    transaction_ids = []
+
+    if rows:
+        result = await session.execute(
+            insert(Transaction).values(rows).returning(Transaction.id)
+        )
+        transaction_ids = list(result.scalars().all())
+
+        for row in rows:
+            await cash_ledger.apply_transaction(session, Transaction(**row))
+
+    total_revenue = sum(
+        (row['amount'] for row in rows if row['type'] == 'income'),
+        Decimal('0')
+    )
+    ingest_result = {
+        'report_id': report_id,
+        'transactions_created': transaction_ids,
+        'total_revenue': float(total_revenue)
+    }
+
+    await session.execute(
+        update(ShiftReport)
+        .where(ShiftReport.id == report_id)
+        .values(ingest_result=ingest_result)
+    )
+
+    if commit:
+        await session.commit()
+
+    logger.info(
+        f"Ingested shift report: {data['date']} {data['shift']}, "
+        f"created {len(transaction_ids)} transactions"
+    )
+
+    return {**ingest_result, 'duplicate': False}
+
+
+async def ingest_shift_reports(session: AsyncSession, reports: List[Dict]) -> List[Dict]:
+    """
+    Пакетная загрузка отчетов о сменах (для дозагрузки истории)
+
+    Каждый отчет пишется в своей точке сохранения: ошибка в одном
+    отчете не отменяет остальные. Уже принятые смены возвращаются
+    как duplicate без записи. Коммит один на весь пакет.
+
+    Returns:
+        Результат по каждому отчету в порядке запроса
+    """
+    results = []
+
+    for index, data in enumerate(reports):
+        item = {
+            'index': index,
+            'date': data['date'].isoformat(),
+            'shift': data['shift']
+        }
+        try:
+            async with session.begin_nested():
+                item.update(await ingest_shift_report(session, data, commit=False))
+            item['status'] = 'success'
+        except Exception as e:
+            logger.error(f"Error ingesting shift report {data['date']} {data['shift']}: {e}")
+            item['status'] = 'error'
+            item['error'] = str(e)
+        results.append(item)
+
+    await session.commit()
+    return results
+
+
 async def get_unprocessed_shift_reports(session: AsyncSession) -> List[ShiftReport]:
     """Получить необработанные отчеты о сменах"""
     result = await session.execute(
@@ -317,6 +493,357 @@ async def mark_shift_report_processed(session: AsyncSession, report_id: int) ->
     return report
 
 
+# ═══════════════════════════════════════════════════
+# OFD SHIFT TOTALS
+# ═══════════════════════════════════════════════════
+
+async def get_ofd_shift_totals(
+    session: AsyncSession,
+    inn: str,
+    kkt_number: Optional[str],
+    date_: date
+) -> Optional[OfdShiftTotals]:
+    """Получить сохраненные итоги закрытой смены ККТ"""
+    result = await session.execute(
+        select(OfdShiftTotals).where(
+            and_(
+                OfdShiftTotals.inn == inn,
+                OfdShiftTotals.kkt_number == (kkt_number or ''),
+                OfdShiftTotals.date == date_
+            )
+        )
+    )
+    return result.scalars().first()
+
+
+async def save_ofd_shift_totals(
+    session: AsyncSession,
+    inn: str,
+    kkt_number: Optional[str],
+    date_: date,
+    totals: Dict
+) -> None:
+    """Сохранить итоги закрытой смены ККТ (повторное сохранение игнорируется)"""
+    await session.execute(
+        insert(OfdShiftTotals)
+        .values(
+            inn=inn,
+            kkt_number=kkt_number or '',
+            date=date_,
+            cash=totals['cash'],
+            cashless=totals['cashless'],
+            total=totals['total'],
+            receipts_count=totals.get('receipts_count'),
+            shift_number=totals.get('shift_number'),
+            opened_at=totals.get('opened_at'),
+            closed_at=totals['closed_at']
+        )
+        .on_conflict_do_nothing(index_elements=['inn', 'kkt_number', 'date'])
+    )
+    await session.commit()
+
+
+# ═══════════════════════════════════════════════════
+# FNS RECEIPTS
+# ═══════════════════════════════════════════════════
+
+async def get_receipt_by_fiscal(
+    session: AsyncSession,
+    fiscal_sign: str,
+    fiscal_document: str,
+    fiscal_storage: str
+) -> Optional[Receipt]:
+    """Найти уже сохраненный чек по фискальным реквизитам (ФП, ФД, ФН)"""
+    result = await session.execute(
+        select(Receipt).where(
+            and_(
+                Receipt.fiscal_sign == fiscal_sign,
+                Receipt.fiscal_document == fiscal_document,
+                Receipt.fiscal_storage == fiscal_storage
+            )
+        )
+    )
+    return result.scalars().first()
+
+
+async def get_registered_fiscal_keys(
+    session: AsyncSession,
+    keys: Iterable[Tuple[str, str, str]]
+) -> Set[Tuple[str, str, str]]:
+    """
+    Какие из чеков (ФП, ФД, ФН) уже сохранены - одним запросом
+
+    Returns:
+        Множество найденных ключей (fiscal_sign, fiscal_document, fiscal_storage)
+    """
+    keys = set(keys)
+    if not keys:
+        return set()
+
+    result = await session.execute(
+        select(Receipt.fiscal_sign, Receipt.fiscal_document, Receipt.fiscal_storage)
+        .where(Receipt.fiscal_sign.in_({key[0] for key in keys}))
+    )
+    return {tuple(row) for row in result.all()} & keys
+
+
+async def add_receipt(
+    session: AsyncSession,
+    receipt_info: Dict,
+    category: Optional[str] = None,
+    notes: Optional[str] = None,
+    accountable_id: Optional[int] = None
+) -> Tuple[Receipt, Transaction]:
+    """
+    Добавить проверенный чек и неподтвержденную транзакцию расхода по нему
+
+    Без коммита: вызывающий код сам завершает транзакцию.
+
+    Args:
+        receipt_info: Данные чека из FNSReceiptService.verify_and_save_receipt
+
+    Returns:
+        (чек, транзакция)
+    """
+    receipt = Receipt(
+        fiscal_sign=receipt_info["fiscal_sign"],
+        fiscal_document=receipt_info["fiscal_document"],
+        fiscal_storage=receipt_info["fiscal_storage"],
+        purchase_date=receipt_info["purchase_date"],
+        total_amount=receipt_info["total_amount"],
+        vat_amount=receipt_info.get("vat_amount", 0),
+        seller_name=receipt_info.get("seller_name"),
+        seller_inn=receipt_info.get("seller_inn"),
+        seller_address=receipt_info.get("seller_address"),
+        cashier=receipt_info.get("cashier"),
+        shift_number=receipt_info.get("shift_number"),
+        operation_type=receipt_info["operation_type"],
+        items=receipt_info.get("items"),
+        payment_type=receipt_info.get("payment_type", "cash"),
+        taxation_type=receipt_info.get("taxation_type"),
+        qr_raw=receipt_info["qr_raw"],
+        fns_url=receipt_info.get("fns_url"),
+        category=category,
+        notes=notes,
+        accountable_id=accountable_id,
+        status="verified"
+    )
+
+    transaction = Transaction(
+        date=receipt_info["purchase_date"].date(),
+        type="expense",
+        amount=receipt_info["total_amount"],
+        description=f"Чек от {receipt_info.get('seller_name', 'N/A')}",
+        counterparty=receipt_info.get("seller_name"),
+        counterparty_inn=receipt_info.get("seller_inn"),
+        payment_method=receipt_info.get("payment_type", "cash"),
+        source="receipt_qr",
+        is_confirmed=False  # Требует подтверждения
+    )
+
+    session.add_all([receipt, transaction])
+    await session.flush()
+
+    # Связываем чек и транзакцию
+    receipt.transaction_id = transaction.id
+    await session.flush()
+
+    return receipt, transaction
+
+
+async def add_accountable_reported(
+    session: AsyncSession,
+    accountable_id: int,
+    amount: Decimal
+) -> Optional[Dict]:
+    """
+    Атомарно увеличить отчитанную сумму подотчета и пересчитать статус
+
+    Один UPDATE ... RETURNING без чтения строки: одновременные отчеты
+    по одному подотчету не затирают суммы друг друга. Без коммита.
+
+    Returns:
+        Dict (id, amount_issued, amount_reported, status) или None,
+        если подотчет не найден
+    """
+    reported = func.coalesce(Accountable.amount_reported, 0) + amount
+    is_reported = reported >= Accountable.amount_issued
+
+    result = await session.execute(
+        update(Accountable)
+        .where(Accountable.id == accountable_id)
+        .values(
+            amount_reported=reported,
+            status=case((is_reported, 'reported'), else_='partial'),
+            reported_date=case((is_reported, date.today()), else_=Accountable.reported_date)
+        )
+        .returning(
+            Accountable.id,
+            Accountable.amount_issued,
+            Accountable.amount_reported,
+            Accountable.status
+        )
+        .execution_options(synchronize_session=False)
+    )
+    row = result.first()
+
+    if not row:
+        return None
+
+    return {
+        'id': row.id,
+        'amount_issued': Decimal(str(row.amount_issued)),
+        'amount_reported': Decimal(str(row.amount_reported)),
+        'status': row.status
+    }
+
+
+async def save_accountable_receipts(
+    session: AsyncSession,
+    accountable_id: int,
+    receipts: List[Dict],
+    notes: Optional[str] = None
+) -> Dict:
+    """
+    Сохранить чеки отчета по подотчету одной транзакцией
+
+    Каждый чек пишется в своей точке сохранения: дубликат или ошибка
+    в одном чеке не отменяет остальные. Сумма сохраненных чеков
+    добавляется к подотчету одним атомарным UPDATE.
+
+    Args:
+        receipts: Данные чеков из FNSReceiptService.verify_and_save_receipt
+
+    Returns:
+        {'results': [результат по каждому чеку], 'accountable': итог подотчета или None}
+    """
+    results = []
+    total = Decimal('0')
+
+    for receipt_info in receipts:
+        item = {'fiscal_sign': receipt_info['fiscal_sign']}
+        try:
+            async with session.begin_nested():
+                receipt, transaction = await add_receipt(
+                    session, receipt_info, notes=notes, accountable_id=accountable_id
+                )
+        except IntegrityError:
+            item['status'] = 'duplicate'
+            item['error'] = 'Receipt already registered'
+        except Exception as e:
+            logger.error(f"Error saving receipt {receipt_info['fiscal_sign']}: {e}")
+            item['status'] = 'error'
+            item['error'] = str(e)
+        else:
+            total += Decimal(str(receipt_info['total_amount']))
+            item.update({
+                'status': 'success',
+                'receipt_id': receipt.id,
+                'transaction_id': transaction.id,
+                'total_amount': float(receipt_info['total_amount']),
+                'seller': receipt_info.get('seller_name'),
+                'fns_url': receipt_info.get('fns_url')
+            })
+        results.append(item)
+
+    accountable = None
+    if total:
+        accountable = await add_accountable_reported(session, accountable_id, total)
+
+    await session.commit()
+
+    return {'results': results, 'accountable': accountable}
+
+
+async def get_fns_response(
+    session: AsyncSession,
+    fiscal_sign: str,
+    fiscal_document: str,
+    fiscal_storage: str
+) -> Optional[Dict]:
+    """Сохраненный ответ API ФНС по чеку"""
+    result = await session.execute(
+        select(FNSReceiptCache.response).where(
+            and_(
+                FNSReceiptCache.fiscal_sign == fiscal_sign,
+                FNSReceiptCache.fiscal_document == fiscal_document,
+                FNSReceiptCache.fiscal_storage == fiscal_storage
+            )
+        )
+    )
+    return result.scalar()
+
+
+async def save_fns_response(
+    session: AsyncSession,
+    fiscal_sign: str,
+    fiscal_document: str,
+    fiscal_storage: str,
+    response: Dict
+) -> None:
+    """Сохранить ответ API ФНС по чеку (повторное сохранение игнорируется)"""
+    await session.execute(
+        insert(FNSReceiptCache)
+        .values(
+            fiscal_sign=fiscal_sign,
+            fiscal_document=fiscal_document,
+            fiscal_storage=fiscal_storage,
+            response=response
+        )
+        .on_conflict_do_nothing(index_elements=['fiscal_storage', 'fiscal_document', 'fiscal_sign'])
+    )
+    await session.commit()
+
+
+# ═══════════════════════════════════════════════════
+# SYNC CURSORS
+# ═══════════════════════════════════════════════════
+
+async def get_sync_cursor(session: AsyncSession, source: str) -> Dict:
+    """
+    Водяной знак синхронизации источника
+
+    Returns:
+        {'rowid': ..., 'updated_at': ...}; для нового источника - с начала
+    """
+    result = await session.execute(
+        select(SyncCursor.last_rowid, SyncCursor.last_updated_at)
+        .where(SyncCursor.source == source)
+    )
+    row = result.first()
+
+    if not row:
+        return {'rowid': 0, 'updated_at': None}
+
+    return {'rowid': row.last_rowid, 'updated_at': row.last_updated_at}
+
+
+async def save_sync_cursor(session: AsyncSession, source: str, cursor: Dict, rows: int):
+    """
+    Сдвинуть водяной знак источника
+
+    Коммит остается за вызывающим кодом: знак фиксируется вместе
+    с загруженной пачкой строк.
+    """
+    statement = insert(SyncCursor).values(
+        source=source,
+        last_rowid=cursor['rowid'],
+        last_updated_at=cursor.get('updated_at'),
+        rows_synced=rows
+    )
+    await session.execute(
+        statement.on_conflict_do_update(
+            index_elements=['source'],
+            set_={
+                'last_rowid': statement.excluded.last_rowid,
+                'last_updated_at': statement.excluded.last_updated_at,
+                'rows_synced': SyncCursor.rows_synced + rows,
+                'updated_at': func.now()
+            }
+        )
+    )
+
+
 # ═══════════════════════════════════════════════════
 # DOCUMENTS
 # ═══════════════════════════════════════════════════
@@ -353,29 +880,17 @@ async def get_period_statistics(
     end_date: date
 ) -> Dict:
     """Получить статистику за период"""
-    transactions = await get_transactions_by_period(
-        session, start_date, end_date, confirmed_only=True
-    )
-
-    incomes = [t for t in transactions if t.type == 'income']
-    expenses = [t for t in transactions if t.type == 'expense']
-
-    # Расходы с учетом налогообложения
-    deductible_expenses = [
-        t for t in expenses
-        if t.category and t.category.tax_deductible
-    ]
+    totals = await get_period_totals(session, start_date, end_date)
 
-    total_income = sum(t.amount for t in incomes)
-    total_expense = sum(t.amount for t in expenses)
-    deductible_expense = sum(t.amount for t in deductible_expenses)
+    total_income = totals['total_income']
+    total_expense = totals['total_expense']
 
     return {
         'period': f'{start_date} - {end_date}',
         'total_income': float(total_income),
         'total_expense': float(total_expense),
-        'deductible_expense': float(deductible_expense),
-        'income_count': len(incomes),
-        'expense_count': len(expenses),
+        'deductible_expense': float(totals['deductible_expense']),
+        'income_count': totals['income_count'],
+        'expense_count': totals['expense_count'],
         'balance': float(total_income - total_expense)
     }
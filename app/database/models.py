@@ -84,6 +84,7 @@ class Transaction(Base):
     confirmed_at = Column(DateTime)
     confirmed_by = Column(Integer, ForeignKey('users.id'))
     notes = Column(Text)
+    shift_id = Column(Integer, ForeignKey('shifts.id', ondelete='SET NULL'))  # Доход импортированной смены
 
     __table_args__ = (
         CheckConstraint("type IN ('income', 'expense')", name='check_transaction_type'),
@@ -96,6 +97,7 @@ class Transaction(Base):
         Index('idx_transactions_confirmed', 'is_confirmed'),
         Index('idx_transactions_category', 'category_id'),
         Index('idx_transactions_source', 'source'),
+        Index('idx_transactions_shift', 'shift_id', unique=True),
     )
 
     # Relationships
@@ -182,6 +184,7 @@ class ShiftReport(Base):
     received_at = Column(DateTime, default=func.now())
     processed = Column(Boolean, default=False)
     processed_at = Column(DateTime)
+    ingest_result = Column(JSONB)  # Ответ на первую доставку (для повторов)
 
     __table_args__ = (
         CheckConstraint("shift IN ('morning', 'evening')", name='check_shift_type'),
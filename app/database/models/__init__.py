@@ -13,6 +13,12 @@ from .accountable import Accountable
 from .receipt import Receipt
 from .bank_transaction import BankTransaction
 from .tax_calculation import TaxCalculation, TaxPayment
+from .cash_ledger import CashLedger
+from .ofd_shift_totals import OfdShiftTotals
+from .ocr_cache import OCRCache
+from .fns_receipt_cache import FNSReceiptCache
+from .generated_artifact import GeneratedArtifact
+from .sync_cursor import SyncCursor
 
 __all__ = [
     'Base',
@@ -36,4 +42,10 @@ __all__ = [
     'Receipt',
     'BankTransaction',
     'TaxCalculation',
+    'CashLedger',
+    'OfdShiftTotals',
+    'OCRCache',
+    'FNSReceiptCache',
+    'GeneratedArtifact',
+    'SyncCursor',
 ]
@@ -0,0 +1,25 @@
+"""
+Модель кассовой книги (остаток наличных по дням)
+"""
+from sqlalchemy import Column, Integer, Date, DateTime, Numeric
+from sqlalchemy.sql import func
+from ..models import Base
+
+
+class CashLedger(Base):
+    """
+    Движение наличных по дням
+
+    Поддерживается инкрементально при создании, подтверждении и удалении
+    наличных транзакций. Остаток на дату = closing_balance последнего дня
+    не позже этой даты.
+    """
+    __tablename__ = 'cash_ledger'
+
+    id = Column(Integer, primary_key=True)
+    date = Column(Date, unique=True, nullable=False)
+    opening_balance = Column(Numeric(12, 2), default=0, nullable=False)
+    inflow = Column(Numeric(12, 2), default=0, nullable=False)
+    outflow = Column(Numeric(12, 2), default=0, nullable=False)
+    closing_balance = Column(Numeric(12, 2), default=0, nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
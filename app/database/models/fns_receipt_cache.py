@@ -0,0 +1,28 @@
+"""
+Модель кэша ответов API ФНС по чекам
+"""
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func
+from ..models import Base
+
+
+class FNSReceiptCache(Base):
+    """
+    Ответ API ФНС по чеку (ФН, ФД, ФП)
+
+    Данные фискального документа не меняются, поэтому повторная
+    проверка того же QR-кода обходится без запроса к ФНС.
+    """
+    __tablename__ = 'fns_receipt_cache'
+
+    id = Column(Integer, primary_key=True)
+    fiscal_storage = Column(String(50), nullable=False)
+    fiscal_document = Column(String(50), nullable=False)
+    fiscal_sign = Column(String(50), nullable=False)
+    response = Column(JSONB, nullable=False)
+    fetched_at = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint('fiscal_storage', 'fiscal_document', 'fiscal_sign', name='uq_fns_receipt_cache'),
+    )
@@ -0,0 +1,35 @@
+"""
+Модель кэша сгенерированных файлов отчетов
+"""
+from sqlalchemy import Column, Integer, String, Date, DateTime, BigInteger, UniqueConstraint, Index
+from sqlalchemy.sql import func
+from ..models import Base
+
+
+class GeneratedArtifact(Base):
+    """
+    Сгенерированный файл отчета (КУДиР и др.)
+
+    Ключ - тип отчета, период и версия данных периода: пока данные
+    не менялись, повторный запрос отдает готовый файл или уже
+    загруженный в Telegram документ (telegram_file_id).
+    """
+    __tablename__ = 'generated_artifacts'
+
+    id = Column(Integer, primary_key=True)
+    report_type = Column(String(50), nullable=False)
+    period_start = Column(Date, nullable=False)
+    period_end = Column(Date, nullable=False)
+    data_version = Column(String(64), nullable=False)
+    file_path = Column(String(500), nullable=False)
+    file_size = Column(BigInteger, default=0, nullable=False)
+    telegram_file_id = Column(String(255))
+    hits = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+    last_used_at = Column(DateTime, default=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('report_type', 'period_start', 'period_end', 'data_version', name='uq_generated_artifact'),
+        Index('idx_generated_artifacts_period', 'period_start', 'period_end'),
+        Index('idx_generated_artifacts_last_used', 'last_used_at'),
+    )
@@ -0,0 +1,29 @@
+"""
+Модель кэша результатов распознавания чеков
+"""
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func
+from ..models import Base
+
+
+class OCRCache(Base):
+    """
+    Результат OCR по содержимому фото
+
+    Ключи: sha256 байтов изображения и file_unique_id фото в Telegram.
+    Размер ограничен, вытесняются давно не использованные записи.
+    """
+    __tablename__ = 'ocr_cache'
+
+    id = Column(Integer, primary_key=True)
+    content_hash = Column(String(64), unique=True, nullable=False)
+    file_unique_id = Column(String(100), unique=True)
+    ocr_data = Column(JSONB, nullable=False)
+    hits = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+    last_used_at = Column(DateTime, default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('idx_ocr_cache_last_used', 'last_used_at'),
+    )
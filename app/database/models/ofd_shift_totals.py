@@ -0,0 +1,33 @@
+"""
+Модель кэша итогов закрытых смен СБИС ОФД
+"""
+from sqlalchemy import Column, Integer, String, Date, DateTime, Numeric, UniqueConstraint
+from sqlalchemy.sql import func
+from ..models import Base
+
+
+class OfdShiftTotals(Base):
+    """
+    Итоги закрытой смены ККТ (Z-отчет) из СБИС ОФД
+
+    После закрытия смены итоги не меняются, поэтому хранятся
+    бессрочно и повторно из ОФД не запрашиваются.
+    """
+    __tablename__ = 'ofd_shift_totals'
+
+    id = Column(Integer, primary_key=True)
+    inn = Column(String(12), nullable=False)
+    kkt_number = Column(String(50), nullable=False, default='')  # '' - основная касса
+    date = Column(Date, nullable=False)
+    cash = Column(Numeric(12, 2), nullable=False)
+    cashless = Column(Numeric(12, 2), nullable=False)
+    total = Column(Numeric(12, 2), nullable=False)
+    receipts_count = Column(Integer)
+    shift_number = Column(Integer)
+    opened_at = Column(String(32))
+    closed_at = Column(String(32), nullable=False)
+    fetched_at = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint('inn', 'kkt_number', 'date', name='uq_ofd_shift_totals'),
+    )
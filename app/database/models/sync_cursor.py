@@ -0,0 +1,25 @@
+"""
+Модель курсора синхронизации с внешней БД
+"""
+from sqlalchemy import Column, Integer, String, DateTime, BigInteger
+from sqlalchemy.sql import func
+from ..models import Base
+
+
+class SyncCursor(Base):
+    """
+    Водяной знак синхронизации таблицы-источника (Bot_Claude)
+
+    Хранит rowid и updated_at последней загруженной строки: следующий
+    запуск читает только строки после них. Сохраняется в одной
+    транзакции с каждой загруженной пачкой - прерванная загрузка
+    продолжается с последней пачки.
+    """
+    __tablename__ = 'sync_cursors'
+
+    id = Column(Integer, primary_key=True)
+    source = Column(String(100), unique=True, nullable=False)  # bot_claude.shifts
+    last_rowid = Column(BigInteger, default=0, nullable=False)
+    last_updated_at = Column(String(32))  # Как хранится в источнике (текст SQLite)
+    rows_synced = Column(BigInteger, default=0, nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
@@ -0,0 +1,93 @@
+"""
+Данные для квартальных отчетов по зарплате
+
+Начисления за квартал читаются одним запросом вместе с данными
+сотрудников и возвращаются легкими строками (Row), без ORM-объектов
+и догрузки сотрудника на каждое начисление. Одна выборка на запрос
+пользователя используется и генераторами отчетов (РСВ, СЗВ-М, ЕФС-1),
+и расчетом налогов за квартал.
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, and_, Row
+from app.database.models import Employee, Payroll
+from typing import Dict, List, Sequence, Tuple
+
+
+def quarter_months(quarter: int) -> Tuple[int, int]:
+    """Первый и последний месяц квартала"""
+    month_start = (quarter - 1) * 3 + 1
+    return month_start, month_start + 2
+
+
+async def get_quarter_payroll(session: AsyncSession, year: int, quarter: int) -> List[Row]:
+    """
+    Начисления за квартал с ФИО, СНИЛС и ИНН сотрудника
+
+    Returns:
+        Строки с полями начисления (employee_id, period_month, gross_salary,
+        ndfl, contributions, net_salary, status) и сотрудника (full_name, snils, inn)
+    """
+    month_start, month_end = quarter_months(quarter)
+
+    result = await session.execute(
+        select(
+            Payroll.id,
+            Payroll.employee_id,
+            Payroll.period_year,
+            Payroll.period_month,
+            Payroll.total_hours,
+            Payroll.gross_salary,
+            Payroll.ndfl,
+            Payroll.contributions,
+            Payroll.net_salary,
+            Payroll.status,
+            Employee.full_name,
+            Employee.snils,
+            Employee.inn
+        )
+        .outerjoin(Employee, Employee.id == Payroll.employee_id)
+        .where(
+            and_(
+                Payroll.period_year == year,
+                Payroll.period_month >= month_start,
+                Payroll.period_month <= month_end
+            )
+        )
+        .order_by(Payroll.period_month, Payroll.employee_id)
+    )
+    return result.all()
+
+
+async def get_active_employees(session: AsyncSession) -> List[Row]:
+    """Работающие сотрудники (для СЗВ-М и ЕФС-1)"""
+    result = await session.execute(
+        select(
+            Employee.id,
+            Employee.full_name,
+            Employee.snils,
+            Employee.inn,
+            Employee.hire_date,
+            Employee.employment_type
+        )
+        .where(Employee.fire_date.is_(None))
+        .order_by(Employee.id)
+    )
+    return result.all()
+
+
+async def get_quarter_report_data(session: AsyncSession, year: int, quarter: int) -> Dict:
+    """
+    Все данные квартального пакета отчетов - два запроса
+
+    Returns:
+        {'payroll': начисления квартала, 'employees': работающие сотрудники}
+    """
+    return {
+        'payroll': await get_quarter_payroll(session, year, quarter),
+        'employees': await get_active_employees(session)
+    }
+
+
+def approved_payroll(rows: Sequence[Row]) -> List[Row]:
+    """Начисления, учитываемые в налогах (утвержденные и выплаченные)"""
+    return [row for row in rows if row.status != 'DRAFT']
@@ -12,6 +12,12 @@ from app.config import settings
 from app.database.db import init_db, close_db
 from app.bot.handlers import owner, admin, common, receipt, employees, payroll, ofd_check, manual_check
 from app.services.scheduler import setup_scheduler, start_scheduler, stop_scheduler
+from app.services.bot_claude_watcher import bot_claude_watcher
+from app.services.sbis_ofd import close_ofd_clients
+from app.services.fns_receipt import fns_receipt_service
+from app.services.ocr_queue import ocr_queue
+from app.services.ocr_service import close_openai_client
+from app.services.generation_executor import generation_executor
 
 # Настройка логирования
 logging.basicConfig(
@@ -58,6 +64,16 @@ async def start_bot():
         start_scheduler()
         logger.info("Scheduler started")
 
+        # Воркеры распознавания чеков
+        ocr_queue.start()
+
+        # Процессы генерации отчетов и документов
+        generation_executor.start()
+
+        # Импорт смен Bot_Claude сразу после изменений его БД
+        if settings.BOT_CLAUDE_WATCH:
+            bot_claude_watcher.start()
+
         logger.info("Starting Accounting Bot...")
         logger.info(f"Company: {settings.COMPANY_NAME}")
         logger.info(f"Tax system: {settings.TAX_SYSTEM}")
@@ -74,6 +90,12 @@ async def start_bot():
         raise
     finally:
         stop_scheduler()
+        await bot_claude_watcher.stop()
+        await ocr_queue.stop()
+        await generation_executor.stop()
+        await close_openai_client()
+        await close_ofd_clients()
+        await fns_receipt_service.close()
         await close_db()
 
 
@@ -0,0 +1,299 @@
+"""
+Сверка смен и отчетов о сменах с Bot_Claude
+
+Сверка идет сверху вниз, как по дереву хэшей: сначала сравниваются
+отпечатки месяцев, затем только в разошедшихся месяцах - отпечатки
+дней, и только за разошедшиеся дни читаются сами строки. Отпечаток
+периода - число строк и сумма md5-отпечатков строк (ключ и все
+сравниваемые поля), которые каждая БД считает сама, поэтому
+совпадающие периоды не читаются построчно. Сумма не зависит от порядка
+строк, но любое изменение поля, в том числе обмен значениями между
+строками, меняет отпечаток.
+"""
+import asyncio
+import logging
+from collections import Counter
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, and_, cast, extract, func, BigInteger, String
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+from ..database.models import Employee, Shift, ShiftReport
+from .bot_claude_sync import BotClaudeSync
+
+logger = logging.getLogger(__name__)
+
+TABLES = ('shifts', 'shift_reports')
+
+# Сравниваемые поля отчета (в копейках)
+REPORT_FIELDS = ('cash_fact', 'cash_plan', 'cashless_fact', 'qr_payments', 'safe')
+
+# Весь период, если границы не заданы
+MIN_DATE = date(2000, 1, 1)
+MAX_DATE = date(2100, 1, 1)
+
+
+def _cents(value) -> int:
+    return int((Decimal(str(value or 0)) * 100).quantize(Decimal('1')))
+
+
+def _cents_sql(column):
+    return cast(func.round(func.coalesce(column, 0) * 100), BigInteger)
+
+
+class row_digest(FunctionElement):
+    """Отпечаток строки в SQL, как bot_claude_sync.row_digest"""
+    type = BigInteger()
+    name = 'row_digest'
+    inherit_cache = True
+
+
+@compiles(row_digest)
+def _compile_row_digest(element, compiler, **kw):
+    return (
+        "('x' || substr(md5(concat_ws('|', %s)), 1, 12))::bit(48)::bigint"
+        % compiler.process(element.clauses, **kw)
+    )
+
+
+def normalize_row(table: str, row: Dict) -> Tuple[object, Dict]:
+    """
+    Ключ и сравниваемые поля строки (одинаково для обеих сторон)
+
+    Returns:
+        (ключ, {поле: нормализованное значение})
+    """
+    if table == 'shifts':
+        return row['bot_shift_id'], {
+            'shift_date': row['shift_date'].isoformat(),
+            'employee_name': row.get('employee_name') or '',
+            'hours_worked': _cents(row.get('hours_worked')),
+            'revenue': _cents(row.get('revenue')),
+            'expenses': _cents(row.get('expenses')),
+            'notes': row.get('notes') or ''
+        }
+
+    return (row['date'].isoformat(), row['shift']), {
+        field: _cents(row.get(field)) for field in REPORT_FIELDS
+    }
+
+
+class BotClaudeReconciler:
+    """Сверка данных бухгалтерии с БД Bot_Claude"""
+
+    def __init__(self, session: AsyncSession, sync: Optional[BotClaudeSync] = None):
+        self.session = session
+        self.sync = sync or BotClaudeSync()
+
+    async def reconcile(
+        self,
+        table: str,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+    ) -> Dict:
+        """
+        Сверить таблицу за период (по умолчанию - всю историю)
+
+        Args:
+            table: shifts или shift_reports
+
+        Returns:
+            Dict с числом проверенных и разошедшихся периодов и строками:
+            missing - есть только в Bot_Claude, extra - только в бухгалтерии,
+            changed - различаются значения, duplicates - ключ встречается
+            больше одного раза хотя бы с одной стороны
+        """
+        if table not in TABLES:
+            raise ValueError(f"Unknown table: {table}")
+
+        start_date = start_date or MIN_DATE
+        end_date = end_date or MAX_DATE
+
+        # Уровень 1: месяцы
+        source_months, local_months = await asyncio.gather(
+            asyncio.to_thread(self.sync.fingerprints, table, 'month', start_date, end_date),
+            self._fingerprints(table, 'month', start_date, end_date)
+        )
+        months = _differing(source_months, local_months)
+
+        # Уровень 2: дни разошедшихся месяцев
+        days = []
+        days_checked = 0
+        for month in sorted(months):
+            month_start = max(start_date, date(month // 100, month % 100, 1))
+            month_end = min(end_date, _month_end(month))
+
+            source_days = await asyncio.to_thread(self.sync.fingerprints, table, 'day', month_start, month_end)
+            local_days = await self._fingerprints(table, 'day', month_start, month_end)
+
+            days_checked += len(source_days.keys() | local_days.keys())
+            days.extend(date.fromisoformat(day) for day in _differing(source_days, local_days))
+
+        # Уровень 3: строки разошедшихся дней
+        report = {
+            'table': table,
+            'months_checked': len(source_months.keys() | local_months.keys()),
+            'months_differ': len(months),
+            'days_checked': days_checked,
+            'days_differ': len(days),
+            'rows_compared': 0,
+            'missing': [],
+            'extra': [],
+            'changed': [],
+            'duplicates': []
+        }
+
+        if days:
+            source_rows = await asyncio.to_thread(self.sync.fetch_days, table, sorted(days))
+            local_rows = await self._fetch_days(table, sorted(days))
+            self._compare_rows(table, source_rows, local_rows, report)
+
+        report['consistent'] = not (
+            report['missing'] or report['extra'] or report['changed'] or report['duplicates']
+        )
+
+        logger.info(
+            f"Reconciled {table}: {report['months_differ']}/{report['months_checked']} months, "
+            f"{report['days_differ']} days differ, missing={len(report['missing'])}, "
+            f"extra={len(report['extra'])}, changed={len(report['changed'])}, "
+            f"duplicates={len(report['duplicates'])}"
+        )
+        return report
+
+    async def _fingerprints(self, table: str, period: str, start_date: date, end_date: date) -> Dict:
+        """Те же агрегаты, что BotClaudeSync.fingerprints, по данным бухгалтерии"""
+        if table == 'shifts':
+            date_column = Shift.shift_date
+            digest = row_digest(
+                Shift.bot_shift_id,
+                cast(Shift.shift_date, String),
+                func.coalesce(Employee.full_name, ''),
+                _cents_sql(Shift.hours_worked),
+                _cents_sql(Shift.revenue),
+                _cents_sql(Shift.expenses),
+                func.coalesce(Shift.notes, '')
+            )
+            base = (
+                select()
+                .select_from(Shift)
+                .outerjoin(Employee, Employee.id == Shift.employee_id)
+                .where(Shift.bot_shift_id.isnot(None))
+            )
+        else:
+            date_column = ShiftReport.date
+            digest = row_digest(
+                cast(ShiftReport.date, String),
+                ShiftReport.shift,
+                *(_cents_sql(getattr(ShiftReport, field)) for field in REPORT_FIELDS)
+            )
+            base = select().select_from(ShiftReport)
+
+        aggregates = [func.count(), func.sum(digest)]
+
+        if period == 'month':
+            period_column = extract('year', date_column) * 100 + extract('month', date_column)
+        else:
+            period_column = date_column
+
+        result = await self.session.execute(
+            base.add_columns(period_column.label('period'), *aggregates)
+            .where(and_(date_column >= start_date, date_column <= end_date))
+            .group_by(period_column)
+        )
+
+        fingerprints = {}
+        for row in result.all():
+            key = int(row[0]) if period == 'month' else row[0].isoformat()
+            fingerprints[key] = tuple(int(value or 0) for value in row[1:])
+        return fingerprints
+
+    async def _fetch_days(self, table: str, days: List[date]) -> List[Dict]:
+        """Строки бухгалтерии за дни в формате BotClaudeSync"""
+        rows = []
+
+        for start in range(0, len(days), 500):
+            batch = days[start:start + 500]
+
+            if table == 'shifts':
+                result = await self.session.execute(
+                    select(Shift, Employee.full_name)
+                    .outerjoin(Employee, Employee.id == Shift.employee_id)
+                    .where(and_(Shift.shift_date.in_(batch), Shift.bot_shift_id.isnot(None)))
+                )
+                rows.extend(
+                    {
+                        'bot_shift_id': shift.bot_shift_id,
+                        'shift_date': shift.shift_date,
+                        'employee_name': full_name,
+                        'hours_worked': shift.hours_worked,
+                        'revenue': shift.revenue,
+                        'expenses': shift.expenses,
+                        'notes': shift.notes
+                    }
+                    for shift, full_name in result.all()
+                )
+            else:
+                result = await self.session.execute(
+                    select(ShiftReport).where(ShiftReport.date.in_(batch))
+                )
+                rows.extend(
+                    {
+                        'date': report.date,
+                        'shift': report.shift,
+                        **{field: getattr(report, field) for field in REPORT_FIELDS}
+                    }
+                    for report in result.scalars().all()
+                )
+
+        return rows
+
+    @staticmethod
+    def _compare_rows(table: str, source_rows: List[Dict], local_rows: List[Dict], report: Dict):
+        source_pairs = [normalize_row(table, row) for row in source_rows]
+        local_pairs = [normalize_row(table, row) for row in local_rows]
+        source = dict(source_pairs)
+        local = dict(local_pairs)
+        report['rows_compared'] = len(source.keys() | local.keys())
+
+        # Повторы ключа: в словаре остается одна строка, остальные
+        # иначе пропали бы из сравнения
+        source_counts = Counter(key for key, _ in source_pairs)
+        local_counts = Counter(key for key, _ in local_pairs)
+        for key in sorted(source_counts.keys() | local_counts.keys(), key=str):
+            if source_counts[key] > 1 or local_counts[key] > 1:
+                report['duplicates'].append({
+                    'key': key,
+                    'source': source_counts[key],
+                    'accounting': local_counts[key]
+                })
+
+        for key in sorted(source.keys() - local.keys(), key=str):
+            report['missing'].append({'key': key, **source[key]})
+
+        for key in sorted(local.keys() - source.keys(), key=str):
+            report['extra'].append({'key': key, **local[key]})
+
+        for key in sorted(source.keys() & local.keys(), key=str):
+            fields = {
+                field: {'source': source[key][field], 'accounting': local[key][field]}
+                for field in source[key]
+                if source[key][field] != local[key][field]
+            }
+            if fields:
+                report['changed'].append({'key': key, 'fields': fields})
+
+
+def _differing(source: Dict, local: Dict) -> List:
+    """Периоды, отпечатки которых различаются или есть только с одной стороны"""
+    return [period for period in source.keys() | local.keys() if source.get(period) != local.get(period)]
+
+
+def _month_end(month: int) -> date:
+    year, month = divmod(month, 100)
+    if month == 12:
+        return date(year, 12, 31)
+    return date.fromordinal(date(year, month + 1, 1).toordinal() - 1)
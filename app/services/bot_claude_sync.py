@@ -1,25 +1,267 @@
 """
 Сервис синхронизации с Bot_Claude
 """
+import hashlib
 import sqlite3
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import date, datetime, timedelta
 from pathlib import Path
 
+from app.config import settings
+
 logger = logging.getLogger(__name__)
 
+SHIFT_COLUMNS = """
+    id as shift_id,
+    date,
+    shift_type,
+    employee_name,
+    hours_worked,
+    revenue_cash,
+    revenue_cashless,
+    revenue_qr,
+    expenses,
+    notes
+"""
+
+REPORT_COLUMNS = """
+    date,
+    shift_type,
+    cash_fact,
+    cash_plan,
+    cashless_fact,
+    qr_payments,
+    safe,
+    expenses_json,
+    workers_list,
+    equipment_issues
+"""
+
+# Таблицы-источники инкрементальной синхронизации
+SYNC_TABLES = {
+    'shifts': SHIFT_COLUMNS,
+    'shift_reports': REPORT_COLUMNS,
+}
+
+# Отпечатки периодов для сверки (см. bot_claude_reconcile): число строк
+# и сумма цифровых отпечатков строк. Отпечаток строки - row_digest от
+# ключа и сравниваемых полей (суммы - в копейках), как в normalize_row
+CENTS = "CAST(ROUND(COALESCE({}, 0) * 100) AS INTEGER)"
+
+SHIFT_FINGERPRINT = f"""
+    COUNT(*),
+    SUM(row_digest(
+        id,
+        date,
+        COALESCE(employee_name, ''),
+        {CENTS.format('hours_worked')},
+        {CENTS.format('COALESCE(revenue_cash, 0) + COALESCE(revenue_cashless, 0) + COALESCE(revenue_qr, 0)')},
+        {CENTS.format('expenses')},
+        COALESCE(notes, '')
+    ))
+"""
+
+REPORT_FINGERPRINT = f"""
+    COUNT(*),
+    SUM(row_digest(
+        date,
+        shift_type,
+        {CENTS.format('cash_fact')},
+        {CENTS.format('cash_plan')},
+        {CENTS.format('cashless_fact')},
+        {CENTS.format('qr_payments')},
+        {CENTS.format('safe')}
+    ))
+"""
+
+FINGERPRINTS = {
+    'shifts': SHIFT_FINGERPRINT,
+    'shift_reports': REPORT_FINGERPRINT,
+}
+
+# Период группировки: месяц как YYYYMM, день как YYYY-MM-DD
+PERIODS = {
+    'month': "CAST(substr(date, 1, 4) AS INTEGER) * 100 + CAST(substr(date, 6, 2) AS INTEGER)",
+    'day': "date",
+}
+
+
+def row_digest(*values) -> int:
+    """
+    Цифровой отпечаток строки: первые 48 бит md5 значений, соединенных через '|'
+
+    На стороне PostgreSQL то же считает
+    ('x' || substr(md5(concat_ws('|', ...)), 1, 12))::bit(48)::bigint.
+    48 бит оставляют запас, чтобы сумма отпечатков периода не
+    переполняла INTEGER SQLite.
+    """
+    text = '|'.join('' if value is None else str(value) for value in values)
+    return int(hashlib.md5(text.encode('utf-8')).hexdigest()[:12], 16)
+
 
 class BotClaudeSync:
     """Синхронизация данных из Bot_Claude"""
 
-    def __init__(self, db_path: str = "/opt/club_assistant/knowledge.db"):
-        self.db_path = db_path
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.BOT_CLAUDE_DB_PATH
 
     def is_available(self) -> bool:
         """Проверка доступности БД Bot_Claude"""
         return Path(self.db_path).exists()
 
+    def _connect(self) -> sqlite3.Connection:
+        """Подключение только для чтения (mode=ro): БД Bot_Claude не блокируется на запись"""
+        uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _shift_from_row(row: sqlite3.Row) -> Dict:
+        return {
+            'bot_shift_id': row['shift_id'],
+            'shift_date': datetime.strptime(row['date'], '%Y-%m-%d').date(),
+            'employee_name': row['employee_name'],
+            'hours_worked': row['hours_worked'] if row['hours_worked'] else None,
+            'revenue': (
+                (row['revenue_cash'] or 0) +
+                (row['revenue_cashless'] or 0) +
+                (row['revenue_qr'] or 0)
+            ),
+            'expenses': row['expenses'] if row['expenses'] else None,
+            'notes': row['notes']
+        }
+
+    @staticmethod
+    def _report_from_row(row: sqlite3.Row) -> Dict:
+        return {
+            'date': datetime.strptime(row['date'], '%Y-%m-%d').date(),
+            'shift': row['shift_type'],
+            'cash_fact': row['cash_fact'],
+            'cash_plan': row['cash_plan'],
+            'cashless_fact': row['cashless_fact'],
+            'qr_payments': row['qr_payments'],
+            'safe': row['safe'],
+            'expenses': row['expenses_json'],
+            'workers': row['workers_list'].split(',') if row['workers_list'] else [],
+            'equipment_issues': row['equipment_issues'].split(',') if row['equipment_issues'] else []
+        }
+
+    def fingerprints(self, table: str, period: str, start_date: date, end_date: date) -> Dict:
+        """
+        Агрегатные отпечатки строк таблицы по месяцам или дням (синхронно)
+
+        Args:
+            table: shifts или shift_reports
+            period: month (ключ YYYYMM) или day (ключ YYYY-MM-DD)
+
+        Returns:
+            {период: кортеж агрегатов}
+        """
+        query = f"""
+        SELECT {PERIODS[period]} AS period, {FINGERPRINTS[table]}
+        FROM {table}
+        WHERE date BETWEEN ? AND ?
+        GROUP BY period
+        """
+
+        conn = self._connect()
+        try:
+            conn.create_function('row_digest', -1, row_digest, deterministic=True)
+            rows = conn.execute(query, (start_date.isoformat(), end_date.isoformat())).fetchall()
+        finally:
+            conn.close()
+
+        return {row[0]: tuple(int(value or 0) for value in tuple(row)[1:]) for row in rows}
+
+    def fetch_days(self, table: str, days: List[date]) -> List[Dict]:
+        """
+        Строки таблицы за указанные дни (синхронно)
+
+        Returns:
+            Строки в формате fetch_shifts / get_shift_reports
+        """
+        to_dict = self._shift_from_row if table == 'shifts' else self._report_from_row
+        result = []
+
+        conn = self._connect()
+        try:
+            for start in range(0, len(days), 500):
+                batch = [day.isoformat() for day in days[start:start + 500]]
+                placeholders = ", ".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT {SYNC_TABLES[table]} FROM {table} WHERE date IN ({placeholders})",
+                    batch
+                ).fetchall()
+                result.extend(to_dict(row) for row in rows)
+        finally:
+            conn.close()
+
+        return result
+
+    def fetch_since(self, table: str, cursor: Dict, limit: int = 1000) -> Tuple[List[Dict], Dict]:
+        """
+        Строки таблицы после водяного знака (синхронно, для asyncio.to_thread)
+
+        Новые строки определяются по rowid. Если в таблице есть колонка
+        updated_at, знак - пара (updated_at, rowid): тогда возвращаются
+        и исправленные задним числом строки.
+
+        Args:
+            table: shifts или shift_reports
+            cursor: {'rowid': ..., 'updated_at': ...} последней загруженной строки
+            limit: Размер пачки
+
+        Returns:
+            (строки в формате fetch_shifts / get_shift_reports, знак после пачки)
+        """
+        columns = SYNC_TABLES[table]
+        last_rowid = cursor.get('rowid') or 0
+        last_updated_at = cursor.get('updated_at') or ''
+
+        conn = self._connect()
+        try:
+            has_updated_at = any(
+                column['name'] == 'updated_at'
+                for column in conn.execute(f"PRAGMA table_info({table})")
+            )
+
+            if has_updated_at:
+                query = f"""
+                SELECT rowid AS sync_rowid, COALESCE(updated_at, '') AS sync_updated_at, {columns}
+                FROM {table}
+                WHERE COALESCE(updated_at, '') > ?
+                   OR (COALESCE(updated_at, '') = ? AND rowid > ?)
+                ORDER BY COALESCE(updated_at, ''), rowid
+                LIMIT ?
+                """
+                params = (last_updated_at, last_updated_at, last_rowid, limit)
+            else:
+                query = f"""
+                SELECT rowid AS sync_rowid, NULL AS sync_updated_at, {columns}
+                FROM {table}
+                WHERE rowid > ?
+                ORDER BY rowid
+                LIMIT ?
+                """
+                params = (last_rowid, limit)
+
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+        if not rows:
+            return [], cursor
+
+        to_dict = self._shift_from_row if table == 'shifts' else self._report_from_row
+        last = rows[-1]
+
+        return [to_dict(row) for row in rows], {
+            'rowid': last['sync_rowid'],
+            'updated_at': last['sync_updated_at']
+        }
+
     def fetch_shifts(self, start_date: date, end_date: date) -> List[Dict]:
         """
         Получить смены из Bot_Claude за период
@@ -32,24 +274,13 @@ class BotClaudeSync:
             return []
 
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
+            conn = self._connect()
             cursor = conn.cursor()
 
             # Попытка извлечь смены
             # Адаптировать запрос под реальную структуру БД Bot_Claude
-            query = """
-            SELECT
-                id as shift_id,
-                date,
-                shift_type,
-                employee_name,
-                hours_worked,
-                revenue_cash,
-                revenue_cashless,
-                revenue_qr,
-                expenses,
-                notes
+            query = f"""
+            SELECT {SHIFT_COLUMNS}
             FROM shifts
             WHERE date BETWEEN ? AND ?
             ORDER BY date DESC
@@ -58,21 +289,7 @@ class BotClaudeSync:
             cursor.execute(query, (start_date.isoformat(), end_date.isoformat()))
             rows = cursor.fetchall()
 
-            shifts = []
-            for row in rows:
-                shifts.append({
-                    'bot_shift_id': row['shift_id'],
-                    'shift_date': datetime.strptime(row['date'], '%Y-%m-%d').date(),
-                    'employee_name': row['employee_name'],
-                    'hours_worked': row['hours_worked'] if row['hours_worked'] else None,
-                    'revenue': (
-                        (row['revenue_cash'] or 0) +
-                        (row['revenue_cashless'] or 0) +
-                        (row['revenue_qr'] or 0)
-                    ),
-                    'expenses': row['expenses'] if row['expenses'] else None,
-                    'notes': row['notes']
-                })
+            shifts = [self._shift_from_row(row) for row in rows]
 
             conn.close()
             logger.info(f"Fetched {len(shifts)} shifts from Bot_Claude")
@@ -92,8 +309,7 @@ class BotClaudeSync:
             return []
 
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
+            conn = self._connect()
             cursor = conn.cursor()
 
             query = """
@@ -135,22 +351,11 @@ class BotClaudeSync:
             return []
 
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
+            conn = self._connect()
             cursor = conn.cursor()
 
-            query = """
-            SELECT
-                date,
-                shift_type,
-                cash_fact,
-                cash_plan,
-                cashless_fact,
-                qr_payments,
-                safe,
-                expenses_json,
-                workers_list,
-                equipment_issues
+            query = f"""
+            SELECT {REPORT_COLUMNS}
             FROM shift_reports
             WHERE date BETWEEN ? AND ?
             ORDER BY date DESC
@@ -159,20 +364,7 @@ class BotClaudeSync:
             cursor.execute(query, (start_date.isoformat(), end_date.isoformat()))
             rows = cursor.fetchall()
 
-            reports = []
-            for row in rows:
-                reports.append({
-                    'date': datetime.strptime(row['date'], '%Y-%m-%d').date(),
-                    'shift': row['shift_type'],
-                    'cash_fact': row['cash_fact'],
-                    'cash_plan': row['cash_plan'],
-                    'cashless_fact': row['cashless_fact'],
-                    'qr_payments': row['qr_payments'],
-                    'safe': row['safe'],
-                    'expenses': row['expenses_json'],
-                    'workers': row['workers_list'].split(',') if row['workers_list'] else [],
-                    'equipment_issues': row['equipment_issues'].split(',') if row['equipment_issues'] else []
-                })
+            reports = [self._report_from_row(row) for row in rows]
 
             conn.close()
             logger.info(f"Fetched {len(reports)} shift reports from Bot_Claude")
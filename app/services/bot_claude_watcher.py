@@ -0,0 +1,228 @@
+"""
+Отслеживание изменений БД Bot_Claude
+
+Клубный бот пишет смены в SQLite (knowledge.db и журнал -wal).
+Наблюдатель замечает изменения этих файлов (inotify через watchfiles,
+без него - опрос mtime/размера) и запускает инкрементальный импорт
+через несколько секунд, а не в ночной задаче.
+
+Серия записей схлопывается в один запуск: импорт начинается после
+паузы в изменениях (debounce), одновременно идет не больше одного
+импорта, а изменения во время импорта дают ровно один повторный запуск.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+try:
+    from watchfiles import awatch
+except ImportError:  # pragma: no cover - зависит от окружения
+    awatch = None
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+ImportFunc = Callable[[], Awaitable[Dict]]
+
+
+async def import_bot_claude_changes() -> Dict:
+    """Инкрементальный импорт смен и отчетов Bot_Claude"""
+    from app.database.db import async_session
+    from app.services.bot_claude_sync import BotClaudeSync
+    from app.services.shift_importer import ShiftImporter
+
+    async with async_session() as session:
+        importer = ShiftImporter(session, BotClaudeSync(settings.BOT_CLAUDE_DB_PATH))
+        stats = await importer.sync_shifts()
+        stats['reports_imported'] = await importer.sync_shift_reports()
+
+    return stats
+
+
+class BotClaudeWatcher:
+    """Наблюдатель за файлом БД Bot_Claude с запуском импорта"""
+
+    def __init__(
+        self,
+        db_path: str,
+        import_func: ImportFunc = import_bot_claude_changes,
+        debounce: float = 2.0,
+        max_delay: float = 30.0,
+        poll_interval: float = 5.0,
+        use_inotify: bool = True
+    ):
+        """
+        Args:
+            db_path: Путь к БД Bot_Claude
+            import_func: Импорт изменений (по умолчанию import_bot_claude_changes)
+            debounce: Пауза без изменений перед импортом (сек)
+            max_delay: Максимальная задержка импорта при непрерывной записи (сек)
+            poll_interval: Период опроса файлов без inotify (сек)
+            use_inotify: Использовать watchfiles, если установлен
+        """
+        self.db_path = db_path
+        self.import_func = import_func
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify and awatch is not None
+
+        self._changed = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._tasks = []
+
+        self.changes = 0
+        self.runs = 0
+        self.failed = 0
+        self.last_run_at: Optional[float] = None
+        self.last_stats: Optional[Dict] = None
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def watched_files(self) -> Tuple[str, str]:
+        return self.db_path, f"{self.db_path}-wal"
+
+    def start(self):
+        """Запустить наблюдение и обработчик импорта (в работающем цикле событий)"""
+        if self.is_running:
+            return
+
+        self._stop.clear()
+        watch = self._watch_inotify if self.use_inotify else self._watch_polling
+        self._tasks = [
+            asyncio.create_task(watch(), name="bot-claude-watch"),
+            asyncio.create_task(self._import_loop(), name="bot-claude-import")
+        ]
+        logger.info(
+            f"Bot_Claude watcher started: {self.db_path} "
+            f"({'inotify' if self.use_inotify else 'polling'})"
+        )
+
+    async def stop(self):
+        """Остановить наблюдение (текущий импорт прерывается)"""
+        if not self.is_running:
+            return
+
+        self._stop.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Bot_Claude watcher stopped")
+
+    def notify(self):
+        """Отметить изменение файлов Bot_Claude"""
+        self.changes += 1
+        self._changed.set()
+
+    async def run_import(self) -> Optional[Dict]:
+        """
+        Выполнить импорт сейчас
+
+        Не запускается параллельно с другим импортом наблюдателя:
+        ночная задача и ручной запуск ждут текущий.
+
+        Returns:
+            Статистика импорта или None при ошибке
+        """
+        async with self._lock:
+            started = time.perf_counter()
+            try:
+                stats = await self.import_func()
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Bot_Claude import failed: {e}", exc_info=True)
+                return None
+
+            self.runs += 1
+            self.last_run_at = time.time()
+            self.last_stats = stats
+            logger.info(f"Bot_Claude import in {time.perf_counter() - started:.2f} s: {stats}")
+            return stats
+
+    async def _import_loop(self):
+        while True:
+            await self._changed.wait()
+
+            # Ждем паузы в записи, но не дольше max_delay
+            deadline = time.monotonic() + self.max_delay
+            while True:
+                self._changed.clear()
+                timeout = min(self.debounce, deadline - time.monotonic())
+                if timeout <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+            # Изменения во время импорта снова взведут событие - один повторный запуск
+            self._changed.clear()
+            await self.run_import()
+
+    async def _watch_inotify(self):
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        names = {os.path.basename(path) for path in self.watched_files}
+
+        try:
+            async for _ in awatch(
+                directory,
+                watch_filter=lambda change, path: os.path.basename(path) in names,
+                stop_event=self._stop,
+                debounce=int(self.debounce * 1000),
+                step=50
+            ):
+                self.notify()
+        except (OSError, RuntimeError) as e:
+            # Каталога еще нет или inotify недоступен (лимит наблюдений, сетевая ФС)
+            logger.warning(f"File watching unavailable for {directory}, falling back to polling: {e}")
+            self.use_inotify = False
+            await self._watch_polling()
+
+    def _snapshot(self) -> Tuple:
+        """(mtime, размер) файла БД и журнала"""
+        snapshot = []
+        for path in self.watched_files:
+            try:
+                stat = os.stat(path)
+                snapshot.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                snapshot.append(None)
+        return tuple(snapshot)
+
+    async def _watch_polling(self):
+        previous = self._snapshot()
+
+        while not self._stop.is_set():
+            await asyncio.sleep(self.poll_interval)
+            current = self._snapshot()
+            if current != previous:
+                previous = current
+                self.notify()
+
+    def get_metrics(self) -> Dict:
+        """Метрики наблюдателя"""
+        return {
+            'running': self.is_running,
+            'mode': 'inotify' if self.use_inotify else 'polling',
+            'changes': self.changes,
+            'runs': self.runs,
+            'failed': self.failed,
+            'last_run_at': self.last_run_at,
+            'last_stats': self.last_stats
+        }
+
+
+# Общий наблюдатель приложения
+bot_claude_watcher = BotClaudeWatcher(
+    settings.BOT_CLAUDE_DB_PATH,
+    debounce=settings.BOT_CLAUDE_WATCH_DEBOUNCE,
+    poll_interval=settings.BOT_CLAUDE_WATCH_POLL_INTERVAL
+)
@@ -1,7 +1,9 @@
 """
 Калькулятор налогов УСН "доходы минус расходы" 15%
 """
-from app.database import crud
+from app.database.aggregations import (
+    get_period_totals, get_monthly_totals, fold_period_totals
+)
 from datetime import date
 from typing import Dict
 from decimal import Decimal
@@ -11,23 +13,17 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-async def calculate_usn_tax(
-    session: AsyncSession,
-    year: int,
-    quarter: int = None
-) -> Dict:
+def get_period_bounds(year: int, quarter: int = None) -> tuple[date, date]:
     """
-    Расчет налога УСН "доходы минус расходы" 15%
+    Границы периода расчета
 
     Args:
-        session: Сессия БД
         year: Год
         quarter: Квартал (1-4), если None - весь год
 
     Returns:
-        Dict с расчетом налога
+        (первый день, последний день)
     """
-    # Определяем период
     if quarter:
         start_date = date(year, (quarter - 1) * 3 + 1, 1)
         if quarter == 4:
@@ -42,26 +38,28 @@ async def calculate_usn_tax(
         start_date = date(year, 1, 1)
         end_date = date(year, 12, 31)
 
-    # Получаем транзакции
-    transactions = await crud.get_transactions_by_period(
-        session,
-        start_date,
-        end_date,
-        confirmed_only=True
-    )
+    return start_date, end_date
+
+
+def build_usn_tax(totals: Dict, year: int, quarter: int = None) -> Dict:
+    """
+    Расчет налога УСН 15% по готовым итогам периода
+
+    Args:
+        totals: Итоги периода (см. aggregations.fold_period_totals)
+        year: Год
+        quarter: Квартал (1-4), если None - весь год
+
+    Returns:
+        Dict с расчетом налога
+    """
+    start_date, end_date = get_period_bounds(year, quarter)
 
-    # Считаем доходы
-    incomes = [t for t in transactions if t.type == 'income']
-    total_income = sum(t.amount for t in incomes)
+    # Доходы
+    total_income = totals['total_income']
 
-    # Считаем расходы (только те что учитываются в УСН)
-    expenses = [
-        t for t in transactions
-        if t.type == 'expense'
-        and t.category
-        and t.category.tax_deductible
-    ]
-    total_expense = sum(t.amount for t in expenses)
+    # Расходы (только те что учитываются в УСН)
+    total_expense = totals['deductible_expense']
 
     # База налогообложения (не может быть отрицательной)
     tax_base = max(total_income - total_expense, Decimal('0'))
@@ -77,11 +75,6 @@ async def calculate_usn_tax(
     # К уплате = максимум из двух
     tax_to_pay = max(tax_amount, min_tax)
 
-    logger.info(
-        f"Tax calculated for {year}" + (f" Q{quarter}" if quarter else "") +
-        f": income={total_income}, expense={total_expense}, tax={tax_to_pay}"
-    )
-
     return {
         'period': f"{year} год" + (f", {quarter} квартал" if quarter else ""),
         'start_date': start_date.isoformat(),
@@ -93,18 +86,48 @@ async def calculate_usn_tax(
         'tax_amount': float(tax_amount),
         'min_tax': float(min_tax),
         'tax_to_pay': float(tax_to_pay),
-        'income_count': len(incomes),
-        'expense_count': len(expenses)
+        'income_count': totals['income_count'],
+        'expense_count': totals['deductible_count']
     }
 
 
-async def calculate_quarter_taxes(session: AsyncSession, year: int) -> list[Dict]:
+async def calculate_usn_tax(
+    session: AsyncSession,
+    year: int,
+    quarter: int = None
+) -> Dict:
     """
-    Расчет налога по всем кварталам года
+    Расчет налога УСН "доходы минус расходы" 15%
 
     Args:
         session: Сессия БД
         year: Год
+        quarter: Квартал (1-4), если None - весь год
+
+    Returns:
+        Dict с расчетом налога
+    """
+    start_date, end_date = get_period_bounds(year, quarter)
+
+    # Итоги периода считаются в БД одним запросом
+    totals = await get_period_totals(session, start_date, end_date)
+    tax_data = build_usn_tax(totals, year, quarter)
+
+    logger.info(
+        f"Tax calculated for {year}" + (f" Q{quarter}" if quarter else "") +
+        f": income={tax_data['incomes']}, expense={tax_data['expenses']}, tax={tax_data['tax_to_pay']}"
+    )
+
+    return tax_data
+
+
+def build_quarter_taxes(monthly_totals: Dict[int, list], year: int) -> list[Dict]:
+    """
+    Расчет налога по кварталам из помесячных итогов
+
+    Args:
+        monthly_totals: Строки итогов по месяцам (см. aggregations.get_monthly_totals)
+        year: Год
 
     Returns:
         Список расчетов по кварталам
@@ -112,8 +135,35 @@ async def calculate_quarter_taxes(session: AsyncSession, year: int) -> list[Dict
     results = []
 
     for quarter in range(1, 5):
-        tax_data = await calculate_usn_tax(session, year, quarter)
-        results.append(tax_data)
+        months = range((quarter - 1) * 3 + 1, quarter * 3 + 1)
+        totals = fold_period_totals(
+            row for month in months for row in monthly_totals.get(month, [])
+        )
+        results.append(build_usn_tax(totals, year, quarter))
+
+    return results
+
+
+async def calculate_quarter_taxes(session: AsyncSession, year: int) -> list[Dict]:
+    """
+    Расчет налога по всем кварталам года
+
+    Все кварталы считаются из одного запроса с группировкой по месяцам
+
+    Args:
+        session: Сессия БД
+        year: Год
+
+    Returns:
+        Список расчетов по кварталам
+    """
+    monthly_totals = await get_monthly_totals(session, year)
+    results = build_quarter_taxes(monthly_totals, year)
+
+    logger.info(
+        f"Quarter taxes calculated for {year}: " +
+        ", ".join(f"Q{i}={q['tax_to_pay']}" for i, q in enumerate(results, start=1))
+    )
 
     return results
 
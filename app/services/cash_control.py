@@ -1,23 +1,92 @@
 """
 Контроль кассовой дисциплины
 """
-from app.database import crud
+from app.database.models import CashBalance, Document, Transaction
+from app.config import settings
 from datetime import date, timedelta
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 from decimal import Decimal
+from sqlalchemy import select, and_, case, func
 from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Транзакции дороже этой суммы должны иметь документ
+DOCUMENT_REQUIRED_AMOUNT = Decimal('1000')
 
-async def check_cash_discipline(session: AsyncSession, date_: date) -> Dict:
+# Допустимое расхождение фактического и расчетного баланса
+MAX_BALANCE_DIFFERENCE = Decimal('100')
+
+
+async def get_daily_transaction_counts(
+    session: AsyncSession,
+    start_date: date,
+    end_date: date
+) -> Dict[date, Tuple[int, int]]:
     """
-    Проверка кассовой дисциплины на дату
+    Неподтвержденные транзакции и транзакции без документов по дням
+
+    Один запрос GROUP BY по дате; количество документов считается
+    подзапросом, без загрузки транзакций и их документов.
+
+    Returns:
+        {дата: (неподтвержденных, подтвержденных без документов дороже 1000 руб.)}
+    """
+    documents = (
+        select(Document.transaction_id, func.count(Document.id).label('count'))
+        .group_by(Document.transaction_id)
+        .subquery()
+    )
+
+    result = await session.execute(
+        select(
+            Transaction.date,
+            func.sum(case((Transaction.is_confirmed == True, 0), else_=1)),
+            func.sum(
+                case(
+                    (
+                        and_(
+                            Transaction.is_confirmed == True,
+                            Transaction.amount > DOCUMENT_REQUIRED_AMOUNT,
+                            documents.c.count.is_(None)
+                        ),
+                        1
+                    ),
+                    else_=0
+                )
+            )
+        )
+        .outerjoin(documents, documents.c.transaction_id == Transaction.id)
+        .where(
+            and_(
+                Transaction.date >= start_date,
+                Transaction.date <= end_date
+            )
+        )
+        .group_by(Transaction.date)
+    )
+
+    return {
+        row[0]: (int(row[1] or 0), int(row[2] or 0))
+        for row in result.all()
+    }
+
+
+def evaluate_cash_day(
+    date_: date,
+    balance: Optional[CashBalance],
+    unconfirmed_count: int = 0,
+    no_documents_count: int = 0
+) -> Dict:
+    """
+    Результат проверки кассовой дисциплины за день по готовым данным
 
     Args:
-        session: Сессия БД
         date_: Дата проверки
+        balance: Баланс кассы на дату
+        unconfirmed_count: Неподтвержденных транзакций
+        no_documents_count: Подтвержденных транзакций без документов (>1000 руб)
 
     Returns:
         Dict с результатами проверки
@@ -25,9 +94,6 @@ async def check_cash_discipline(session: AsyncSession, date_: date) -> Dict:
     issues = []
     warnings = []
 
-    # Получаем баланс кассы
-    balance = await crud.get_cash_balance_by_date(session, date_)
-
     if not balance:
         issues.append("Отсутствует запись баланса кассы")
         return {
@@ -40,7 +106,7 @@ async def check_cash_discipline(session: AsyncSession, date_: date) -> Dict:
     # Проверка 1: Расхождение между фактом и расчетом
     if balance.calculated_balance is not None:
         difference = abs(balance.closing_balance - balance.calculated_balance)
-        if difference > Decimal('100'):
+        if difference > MAX_BALANCE_DIFFERENCE:
             issues.append(f"Расхождение баланса: {difference} руб.")
 
     # Проверка 2: Отрицательный баланс
@@ -48,18 +114,12 @@ async def check_cash_discipline(session: AsyncSession, date_: date) -> Dict:
         issues.append(f"Отрицательный баланс кассы: {balance.closing_balance} руб.")
 
     # Проверка 3: Неподтвержденные транзакции
-    transactions = await crud.get_transactions_by_date(session, date_, confirmed_only=False)
-    unconfirmed = [t for t in transactions if not t.is_confirmed]
-
-    if unconfirmed:
-        warnings.append(f"Неподтвержденных транзакций: {len(unconfirmed)}")
+    if unconfirmed_count:
+        warnings.append(f"Неподтвержденных транзакций: {unconfirmed_count}")
 
     # Проверка 4: Транзакции без документов
-    transactions_confirmed = [t for t in transactions if t.is_confirmed]
-    no_documents = [t for t in transactions_confirmed if not t.documents and t.amount > 1000]
-
-    if no_documents:
-        warnings.append(f"Транзакций без документов (>1000 руб): {len(no_documents)}")
+    if no_documents_count:
+        warnings.append(f"Транзакций без документов (>1000 руб): {no_documents_count}")
 
     # Проверка 5: Несверенный баланс
     if not balance.is_reconciled:
@@ -74,13 +134,65 @@ async def check_cash_discipline(session: AsyncSession, date_: date) -> Dict:
         'calculated_balance': float(balance.calculated_balance) if balance.calculated_balance else None,
         'difference': float(balance.difference) if balance.difference else None,
         'is_reconciled': balance.is_reconciled,
-        'unconfirmed_count': len(unconfirmed),
-        'no_documents_count': len(no_documents),
+        'unconfirmed_count': unconfirmed_count,
+        'no_documents_count': no_documents_count,
         'issues': issues,
         'warnings': warnings
     }
 
 
+async def check_cash_discipline_range(
+    session: AsyncSession,
+    start_date: date,
+    end_date: date
+) -> List[Dict]:
+    """
+    Проверка кассовой дисциплины за каждый день периода
+
+    Два запроса на весь период: балансы кассы и счетчики транзакций
+    по дням (вместо нескольких запросов на каждый день).
+
+    Returns:
+        Список результатов проверки по дням, по возрастанию даты
+    """
+    result = await session.execute(
+        select(CashBalance).where(
+            and_(
+                CashBalance.date >= start_date,
+                CashBalance.date <= end_date
+            )
+        )
+    )
+    balances = {balance.date: balance for balance in result.scalars().all()}
+    counts = await get_daily_transaction_counts(session, start_date, end_date)
+
+    results = []
+    current_date = start_date
+
+    while current_date <= end_date:
+        results.append(
+            evaluate_cash_day(current_date, balances.get(current_date), *counts.get(current_date, (0, 0)))
+        )
+        current_date += timedelta(days=1)
+
+    return results
+
+
+async def check_cash_discipline(session: AsyncSession, date_: date) -> Dict:
+    """
+    Проверка кассовой дисциплины на дату
+
+    Args:
+        session: Сессия БД
+        date_: Дата проверки
+
+    Returns:
+        Dict с результатами проверки
+    """
+    results = await check_cash_discipline_range(session, date_, date_)
+    return results[0]
+
+
 async def get_cash_discipline_report(
     session: AsyncSession,
     start_date: date,
@@ -97,13 +209,7 @@ async def get_cash_discipline_report(
     Returns:
         Dict с отчетом
     """
-    results = []
-    current_date = start_date
-
-    while current_date <= end_date:
-        check_result = await check_cash_discipline(session, current_date)
-        results.append(check_result)
-        current_date += timedelta(days=1)
+    results = await check_cash_discipline_range(session, start_date, end_date)
 
     # Подсчет статистики
     total_days = len(results)
@@ -122,38 +228,76 @@ async def get_cash_discipline_report(
     }
 
 
-async def get_cash_limit_violations(
+async def scan_cash_limit(
     session: AsyncSession,
-    cash_limit: Decimal = Decimal('100000')
-) -> List[Dict]:
+    start_date: date,
+    end_date: date,
+    cash_limit: Optional[Decimal] = None
+) -> Dict:
     """
-    Проверка превышения лимита остатка наличных в кассе
+    Превышения лимита остатка кассы за произвольный период
+
+    Один запрос: балансы выше лимита по порядку дат. Серия - превышения
+    в дни подряд; стоимость не зависит от длины периода.
 
     Args:
         session: Сессия БД
-        cash_limit: Лимит остатка кассы
+        start_date: Начало периода
+        end_date: Конец периода
+        cash_limit: Лимит остатка кассы (по умолчанию CASH_LIMIT)
 
     Returns:
-        Список дат с превышением лимита
+        Dict с превышениями по дням, самой длинной серией и пиком превышения
     """
-    # Получаем все балансы за последние 30 дней
-    end_date = date.today()
-    start_date = end_date - timedelta(days=30)
+    cash_limit = Decimal(cash_limit if cash_limit is not None else settings.CASH_LIMIT)
+
+    result = await session.execute(
+        select(
+            CashBalance.date,
+            CashBalance.closing_balance
+        )
+        .where(
+            and_(
+                CashBalance.date >= start_date,
+                CashBalance.date <= end_date,
+                CashBalance.closing_balance > cash_limit
+            )
+        )
+        .order_by(CashBalance.date)
+    )
 
     violations = []
-    current_date = start_date
-
-    while current_date <= end_date:
-        balance = await crud.get_cash_balance_by_date(session, current_date)
+    longest = None
+    peak = None
+    peak_excess = None
+    streak_start = None
+    previous_date = None
+
+    for row in result.all():
+        excess = row.closing_balance - cash_limit
+        violations.append({
+            'date': row.date.isoformat(),
+            'balance': float(row.closing_balance),
+            'limit': float(cash_limit),
+            'excess': float(excess)
+        })
+
+        if previous_date is None or row.date - previous_date != timedelta(days=1):
+            streak_start = row.date
+        previous_date = row.date
+
+        days = (row.date - streak_start).days + 1
+        if not longest or days > longest['days']:
+            longest = {'start': streak_start.isoformat(), 'end': row.date.isoformat(), 'days': days}
+
+        if peak_excess is None or excess > peak_excess:
+            peak, peak_excess = violations[-1], excess
 
-        if balance and balance.closing_balance > cash_limit:
-            violations.append({
-                'date': current_date.isoformat(),
-                'balance': float(balance.closing_balance),
-                'limit': float(cash_limit),
-                'excess': float(balance.closing_balance - cash_limit)
-            })
-
-        current_date += timedelta(days=1)
-
-    return violations
+    return {
+        'period': f'{start_date.isoformat()} - {end_date.isoformat()}',
+        'limit': float(cash_limit),
+        'violation_days': len(violations),
+        'longest_streak': longest,
+        'peak': peak,
+        'violations': violations
+    }
@@ -4,19 +4,45 @@
 import logging
 from datetime import date
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional
 from docx import Document
 from docx.shared import Pt, Inches, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 
-from ..database.models import Employee, Contract
 from ..config import settings
 
 logger = logging.getLogger(__name__)
 
 
+def employee_document_data(employee) -> Dict:
+    """Данные сотрудника для документов (без ORM-объекта)"""
+    return {
+        'id': employee.id,
+        'full_name': employee.full_name,
+        'passport': employee.full_passport,
+        'inn': employee.inn
+    }
+
+
+def contract_document_data(contract) -> Dict:
+    """Данные договора для документов (без ORM-объекта)"""
+    return {
+        'contract_number': contract.contract_number,
+        'start_date': contract.start_date,
+        'end_date': contract.end_date,
+        'position': contract.position,
+        'salary': contract.salary,
+        'work_conditions': contract.work_conditions
+    }
+
+
 class DocumentGenerator:
-    """Генерация документов для сотрудников"""
+    """
+    Генерация документов для сотрудников
+
+    Сотрудник и договор передаются словарями (employee_document_data,
+    contract_document_data): генерация идет в процессе пула.
+    """
 
     def __init__(self, output_dir: str = "/opt/accounting-bot/documents"):
         self.output_dir = Path(output_dir)
@@ -26,8 +52,8 @@ class DocumentGenerator:
 
     def generate_labor_contract(
         self,
-        employee: Employee,
-        contract: Contract
+        employee: Dict,
+        contract: Dict
     ) -> str:
         """
         Генерация трудового договора (ТД)
@@ -52,7 +78,7 @@ class DocumentGenerator:
 
         # Номер и дата
         doc.add_paragraph(
-            f"№ {contract.contract_number or '_____'} от {contract.start_date.strftime('%d.%m.%Y')} г."
+            f"№ {contract['contract_number'] or '_____'} от {contract['start_date'].strftime('%d.%m.%Y')} г."
         )
         doc.add_paragraph(f"г. {settings.COMPANY_CITY or 'Москва'}")
 
@@ -64,11 +90,11 @@ class DocumentGenerator:
         p.add_run('с одной стороны, и ')
 
         p = doc.add_paragraph()
-        p.add_run(f'{employee.full_name}, ')
-        if employee.full_passport:
-            p.add_run(f'паспорт {employee.full_passport}, ')
-        if employee.inn:
-            p.add_run(f'ИНН {employee.inn}, ')
+        p.add_run(f'{employee["full_name"]}, ')
+        if employee['passport']:
+            p.add_run(f'паспорт {employee["passport"]}, ')
+        if employee['inn']:
+            p.add_run(f'ИНН {employee["inn"]}, ')
         p.add_run('именуемый в дальнейшем «Работник», с другой стороны, ')
         p.add_run('заключили настоящий трудовой договор о нижеследующем:')
 
@@ -79,16 +105,16 @@ class DocumentGenerator:
 
         doc.add_paragraph(
             f'1.1. Работник принимается на работу в {settings.COMPANY_NAME} '
-            f'на должность {contract.position}.'
+            f'на должность {contract["position"]}.'
         )
 
         doc.add_paragraph(
-            f'1.2. Дата начала работы: {contract.start_date.strftime("%d.%m.%Y")} г.'
+            f'1.2. Дата начала работы: {contract["start_date"].strftime("%d.%m.%Y")} г.'
         )
 
-        if contract.end_date:
+        if contract['end_date']:
             doc.add_paragraph(
-                f'1.3. Договор заключен на определенный срок до {contract.end_date.strftime("%d.%m.%Y")} г.'
+                f'1.3. Договор заключен на определенный срок до {contract["end_date"].strftime("%d.%m.%Y")} г.'
             )
 
         # 2. Оплата труда
@@ -98,7 +124,7 @@ class DocumentGenerator:
 
         doc.add_paragraph(
             f'2.1. За выполнение трудовых обязанностей Работнику устанавливается '
-            f'заработная плата в размере {contract.salary:,.2f} руб. в месяц.'
+            f'заработная плата в размере {contract["salary"]:,.2f} руб. в месяц.'
         )
 
         doc.add_paragraph(
@@ -133,7 +159,7 @@ class DocumentGenerator:
         doc.add_paragraph()
         p = doc.add_paragraph(f'{settings.COMPANY_NAME}')
         p.add_run('\t\t\t')
-        p.add_run(employee.full_name)
+        p.add_run(employee['full_name'])
 
         doc.add_paragraph()
         doc.add_paragraph()
@@ -142,7 +168,7 @@ class DocumentGenerator:
         p.add_run('_______________ / _____________')
 
         # Сохранение
-        filename = f"TD_{employee.id}_{contract.contract_number}_{date.today().isoformat()}.docx"
+        filename = f"TD_{employee['id']}_{contract['contract_number']}_{date.today().isoformat()}.docx"
         filepath = self.output_dir / filename
         doc.save(str(filepath))
 
@@ -151,8 +177,8 @@ class DocumentGenerator:
 
     def generate_gph_contract(
         self,
-        employee: Employee,
-        contract: Contract
+        employee: Dict,
+        contract: Dict
     ) -> str:
         """
         Генерация договора ГПХ
@@ -177,7 +203,7 @@ class DocumentGenerator:
 
         # Номер и дата
         doc.add_paragraph(
-            f"№ {contract.contract_number or '_____'} от {contract.start_date.strftime('%d.%m.%Y')} г."
+            f"№ {contract['contract_number'] or '_____'} от {contract['start_date'].strftime('%d.%m.%Y')} г."
         )
         doc.add_paragraph(f"г. {settings.COMPANY_CITY or 'Москва'}")
 
@@ -188,9 +214,9 @@ class DocumentGenerator:
         p.add_run('именуемое в дальнейшем «Заказчик», с одной стороны, и ')
 
         p = doc.add_paragraph()
-        p.add_run(f'{employee.full_name}, ')
-        if employee.full_passport:
-            p.add_run(f'паспорт {employee.full_passport}, ')
+        p.add_run(f'{employee["full_name"]}, ')
+        if employee['passport']:
+            p.add_run(f'паспорт {employee["passport"]}, ')
         p.add_run('именуемый в дальнейшем «Исполнитель», с другой стороны, ')
         p.add_run('заключили настоящий договор о нижеследующем:')
 
@@ -201,7 +227,7 @@ class DocumentGenerator:
 
         doc.add_paragraph(
             f'1.1. Исполнитель обязуется по заданию Заказчика выполнить работы '
-            f'по {contract.work_conditions or "оказанию услуг"}, '
+            f'по {contract["work_conditions"] or "оказанию услуг"}, '
             f'а Заказчик обязуется принять и оплатить выполненные работы.'
         )
 
@@ -212,7 +238,7 @@ class DocumentGenerator:
 
         doc.add_paragraph(
             f'2.1. Стоимость работ по настоящему договору составляет '
-            f'{contract.salary:,.2f} руб.'
+            f'{contract["salary"]:,.2f} руб.'
         )
 
         # 3. Срок выполнения
@@ -221,8 +247,8 @@ class DocumentGenerator:
         heading.add_run('3. СРОК ВЫПОЛНЕНИЯ РАБОТ').bold = True
 
         doc.add_paragraph(
-            f'3.1. Работы выполняются в период с {contract.start_date.strftime("%d.%m.%Y")} г. '
-            f'по {contract.end_date.strftime("%d.%m.%Y") if contract.end_date else "___________"} г.'
+            f'3.1. Работы выполняются в период с {contract["start_date"].strftime("%d.%m.%Y")} г. '
+            f'по {contract["end_date"].strftime("%d.%m.%Y") if contract["end_date"] else "___________"} г.'
         )
 
         # Подписи
@@ -236,7 +262,7 @@ class DocumentGenerator:
         doc.add_paragraph()
         p = doc.add_paragraph(f'{settings.COMPANY_NAME}')
         p.add_run('\t\t\t')
-        p.add_run(employee.full_name)
+        p.add_run(employee['full_name'])
 
         doc.add_paragraph()
         doc.add_paragraph()
@@ -245,7 +271,7 @@ class DocumentGenerator:
         p.add_run('_______________ / _____________')
 
         # Сохранение
-        filename = f"GPH_{employee.id}_{contract.contract_number}_{date.today().isoformat()}.docx"
+        filename = f"GPH_{employee['id']}_{contract['contract_number']}_{date.today().isoformat()}.docx"
         filepath = self.output_dir / filename
         doc.save(str(filepath))
 
@@ -254,7 +280,7 @@ class DocumentGenerator:
 
     def generate_offer(
         self,
-        employee: Employee,
+        employee: Dict,
         hourly_rate: float,
         position: str = "Администратор"
     ) -> str:
@@ -333,7 +359,7 @@ class DocumentGenerator:
         doc.add_paragraph(f'Адрес: {getattr(settings, "COMPANY_ADDRESS", "_____")}')
 
         # Сохранение
-        filename = f"OFFER_{employee.id}_{date.today().isoformat()}.docx"
+        filename = f"OFFER_{employee['id']}_{date.today().isoformat()}.docx"
         filepath = self.output_dir / filename
         doc.save(str(filepath))
 
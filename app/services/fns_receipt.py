@@ -1,17 +1,44 @@
 """
 Сервис работы с чеками ФНС через QR-код
 Декодирование QR → запрос к API ФНС → получение данных чека
+
+Ответы ФНС сохраняются в БД (fns_receipt_cache): фискальный документ
+не меняется, поэтому повторная проверка того же чека идет без запроса.
+Одновременные проверки одного QR-кода ждут общий запрос.
+
+Основной и альтернативный API опрашиваются с хеджированием: если
+первый не ответил за p95 своего времени ответа, запускается второй
+и берется первый корректный ответ. Первым идет API с лучшей
+статистикой (доля успешных ответов, затем p95).
 """
 
 import aiohttp
+import asyncio
 import logging
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional, Dict
+import time
+from collections import deque
+from functools import partial
+from typing import Optional, Dict, List, Tuple
 from urllib.parse import parse_qs, urlparse
 
+from app.config import settings
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_API_URL = "https://проверка-чека.рус/api/v1/check"
+DEFAULT_ALT_API_URL = "https://receipt.taxcom.ru/v01/extract"
+
+HEDGE_MODES = ('off', 'delay', 'race')
+
+# Границы задержки второго запроса (сек)
+MIN_HEDGE_DELAY = 0.1
+MAX_HEDGE_DELAY = 10.0
+
+# Сколько ответов нужно, чтобы статистика API влияла на порядок
+MIN_PROVIDER_SAMPLES = 5
+
 
 class FNSReceiptService:
     """
@@ -20,11 +47,94 @@ class FNSReceiptService:
     API документация: https://проверить-чек.рф/dev
     """
 
-    def __init__(self):
-        # URL API ФНС для проверки чеков
-        self.api_url = "https://проверка-чека.рус/api/v1/check"
-        # Альтернативный API
-        self.alt_api_url = "https://receipt.taxcom.ru/v01/extract"
+    def __init__(
+        self,
+        api_url: Optional[str] = None,
+        alt_api_url: Optional[str] = None,
+        max_connections: int = 10,
+        session_factory=None,
+        hedge_mode: str = 'delay',
+        hedge_delay: float = 1.0,
+        history: int = 100
+    ):
+        """
+        Args:
+            api_url: URL API ФНС для проверки чеков
+            alt_api_url: Альтернативный API
+            max_connections: Размер пула соединений
+            session_factory: Фабрика сессий БД для кэша ответов
+                (по умолчанию async_session_maker)
+            hedge_mode: off - второй API только после ошибки первого,
+                delay - второй API после задержки, race - оба сразу
+            hedge_delay: Задержка второго запроса, пока у первого API
+                нет статистики (сек)
+            history: Сколько последних ответов API учитывать в p95
+        """
+        if hedge_mode not in HEDGE_MODES:
+            raise ValueError(f"Unknown hedge mode: {hedge_mode}")
+
+        self.api_url = api_url or DEFAULT_API_URL
+        self.alt_api_url = alt_api_url or DEFAULT_ALT_API_URL
+        self.max_connections = max_connections
+        self.session_factory = session_factory
+        self.timeout = aiohttp.ClientTimeout(total=10)
+        self.hedge_mode = hedge_mode
+        self.hedge_delay = hedge_delay
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Запросы в работе по (ФН, ФД, ФП)
+        self._inflight: Dict[Tuple[str, str, str], asyncio.Future] = {}
+
+        self.stats = {
+            'lookups': 0,
+            'coalesced': 0,
+            'cache_hits': 0,
+            'upstream_requests': 0,
+            'hedged': 0
+        }
+
+        # Статистика по API: время ответов (сек) и исходы
+        self.providers = {
+            name: {
+                'latency': deque(maxlen=history),
+                'success': 0,
+                'failure': 0,
+                'cancelled': 0
+            }
+            for name in ('primary', 'alternate')
+        }
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Общая HTTP-сессия (пересоздается, если закрыта или цикл событий сменился)"""
+        loop = asyncio.get_running_loop()
+
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_connections,
+                    keepalive_timeout=60
+                )
+            )
+            self._loop = loop
+
+        return self._session
+
+    async def close(self):
+        """Закрыть пул соединений"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+    def _get_session_factory(self):
+        """Фабрика сессий БД для кэша ответов ФНС"""
+        if self.session_factory is None:
+            from app.database.db import async_session_maker
+            self.session_factory = async_session_maker
+        return self.session_factory
 
     def parse_qr_code(self, qr_data: str) -> Optional[Dict]:
         """
@@ -99,47 +209,235 @@ class FNSReceiptService:
         """
         Получить детали чека от ФНС
 
-        Использует публичный API для проверки чеков
+        Сначала ищет сохраненный ответ в БД, затем использует публичный
+        API для проверки чеков. Одновременные запросы одного чека
+        выполняются один раз.
 
         Returns:
             Полные данные чека или None
         """
+        key = (fiscal_storage, fiscal_document, fiscal_sign)
+        loop = asyncio.get_running_loop()
+        self.stats['lookups'] += 1
+
+        future = self._inflight.get(key)
+        if future is not None and future.get_loop() is loop and not future.done():
+            self.stats['coalesced'] += 1
+        else:
+            future = loop.create_task(self._lookup(key, purchase_date))
+            self._inflight[key] = future
+            future.add_done_callback(partial(self._forget_inflight, key))
+
+        # shield: отмена одного ожидающего не отменяет общий запрос
+        data = await asyncio.shield(future)
+
+        if data is None:
+            return None
+
+        return self._parse_fns_response(data)
+
+    def _forget_inflight(self, key: Tuple[str, str, str], future: asyncio.Future):
+        """Убрать завершенный запрос из списка выполняющихся"""
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+
+    async def _lookup(self, key: Tuple[str, str, str], purchase_date: datetime) -> Optional[Dict]:
+        """Ответ ФНС по чеку: из БД или из API (с сохранением в БД)"""
+        data = await self._load_cached(key)
+        if data is not None:
+            self.stats['cache_hits'] += 1
+            return data
+
+        data = await self._fetch(key, purchase_date)
+        if data is not None:
+            await self._store_cached(key, data)
+
+        return data
+
+    async def _load_cached(self, key: Tuple[str, str, str]) -> Optional[Dict]:
+        """Сохраненный ответ ФНС (None, если нет или БД недоступна)"""
+        from app.database import crud
+
+        fiscal_storage, fiscal_document, fiscal_sign = key
+
         try:
-            # Формат даты для API
-            date_str = purchase_date.strftime("%Y%m%dT%H%M")
-
-            # Параметры запроса
-            params = {
-                "fn": fiscal_storage,
-                "i": fiscal_document,
-                "fp": fiscal_sign,
-                "t": date_str
-            }
+            async with self._get_session_factory()() as session:
+                return await crud.get_fns_response(session, fiscal_sign, fiscal_document, fiscal_storage)
+        except Exception as e:
+            logger.warning(f"FNS receipt cache unavailable: {e}")
+            return None
+
+    async def _store_cached(self, key: Tuple[str, str, str], data: Dict):
+        """Сохранить ответ ФНС в БД"""
+        from app.database import crud
 
-            async with aiohttp.ClientSession() as session:
-                # Пробуем основной API
-                async with session.get(self.api_url, params=params, timeout=10) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        return self._parse_fns_response(data)
-
-                # Если не сработало, пробуем альтернативный API
-                async with session.post(
-                    self.alt_api_url,
-                    json=params,
-                    timeout=10
-                ) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        return self._parse_fns_response(data)
+        fiscal_storage, fiscal_document, fiscal_sign = key
 
+        try:
+            async with self._get_session_factory()() as session:
+                await crud.save_fns_response(session, fiscal_sign, fiscal_document, fiscal_storage, data)
+        except Exception as e:
+            logger.warning(f"Could not cache FNS response for fn={fiscal_storage}, fd={fiscal_document}: {e}")
+
+    async def _fetch(self, key: Tuple[str, str, str], purchase_date: datetime) -> Optional[Dict]:
+        """Запросить чек в API ФНС (без кэша); возвращает исходный JSON ответа"""
+        fiscal_storage, fiscal_document, fiscal_sign = key
+        self.stats['upstream_requests'] += 1
+
+        # Параметры запроса
+        params = {
+            "fn": fiscal_storage,
+            "i": fiscal_document,
+            "fp": fiscal_sign,
+            "t": purchase_date.strftime("%Y%m%dT%H%M")
+        }
+
+        first, second = self.provider_order()
+
+        if self.hedge_mode == 'off':
+            data = await self._call_provider(first, params)
+            if data is None:
+                data = await self._call_provider(second, params)
+        else:
+            data = await self._hedged_call(first, second, params)
+
+        if data is None:
             logger.warning("Could not fetch receipt details from FNS API")
+
+        return data
+
+    async def _hedged_call(self, first: str, second: str, params: Dict) -> Optional[Dict]:
+        """
+        Запрос с хеджированием: второй API запускается после задержки
+        (или сразу в режиме race, или сразу после ошибки первого),
+        возвращается первый корректный ответ, остальные запросы отменяются
+        """
+        delay = 0 if self.hedge_mode == 'race' else self.get_hedge_delay(first)
+        tasks = [asyncio.create_task(self._call_provider(first, params))]
+
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done and tasks[0].result() is not None:
+                return tasks[0].result()
+
+            self.stats['hedged'] += 1
+            tasks.append(asyncio.create_task(self._call_provider(second, params)))
+            pending = {task for task in tasks if not task.done()}
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result() is not None:
+                        return task.result()
+
             return None
 
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _call_provider(self, name: str, params: Dict) -> Optional[Dict]:
+        """
+        Запрос к одному API ФНС с учетом статистики
+
+        Returns:
+            JSON ответа, если он разбирается как чек, иначе None
+        """
+        session = self._get_session()
+        stats = self.providers[name]
+        started = time.perf_counter()
+
+        try:
+            if name == 'primary':
+                request = session.get(self.api_url, params=params)
+            else:
+                request = session.post(self.alt_api_url, json=params)
+
+            async with request as resp:
+                data = await resp.json() if resp.status == 200 else None
+
+        except asyncio.CancelledError:
+            # Проигравший запрос: время ответа не меньше прошедшего
+            stats['cancelled'] += 1
+            stats['latency'].append(time.perf_counter() - started)
+            raise
+
         except Exception as e:
-            logger.error(f"Error fetching receipt from FNS: {e}")
+            logger.warning(f"FNS {name} API error: {e}")
+            data = None
+
+        stats['latency'].append(time.perf_counter() - started)
+
+        if not self._is_valid_response(data):
+            stats['failure'] += 1
             return None
 
+        stats['success'] += 1
+        return data
+
+    def _is_valid_response(self, data) -> bool:
+        """Ответ разбирается как чек (есть итоговая сумма)"""
+        if not isinstance(data, dict):
+            return False
+
+        receipt_data = data.get("document", {}).get("receipt", data.get("ticket", data))
+        return isinstance(receipt_data, dict) and "totalSum" in receipt_data
+
+    def _p95(self, name: str) -> Optional[float]:
+        """p95 времени ответа API (сек) или None без статистики"""
+        latency = self.providers[name]['latency']
+        if len(latency) < MIN_PROVIDER_SAMPLES:
+            return None
+        ordered = sorted(latency)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def _success_rate(self, name: str) -> float:
+        """Доля корректных ответов API (1.0, пока ответов мало)"""
+        stats = self.providers[name]
+        total = stats['success'] + stats['failure']
+        if total < MIN_PROVIDER_SAMPLES:
+            return 1.0
+        return stats['success'] / total
+
+    def provider_order(self) -> List[str]:
+        """
+        Порядок опроса API: сначала чаще отвечающий корректно,
+        при равной доле - с меньшим p95 (без статистики - основной)
+        """
+        def rank(name: str):
+            p95 = self._p95(name)
+            return (-round(self._success_rate(name), 1), p95 if p95 is not None else float('inf'))
+
+        return sorted(('primary', 'alternate'), key=rank)
+
+    def get_hedge_delay(self, name: str) -> float:
+        """Сколько ждать ответа API перед запуском второго запроса (сек)"""
+        p95 = self._p95(name)
+        if p95 is None:
+            return self.hedge_delay
+        return min(max(p95, MIN_HEDGE_DELAY), MAX_HEDGE_DELAY)
+
+    def get_provider_stats(self) -> Dict:
+        """Статистика API ФНС для мониторинга"""
+        result = {}
+
+        for name, stats in self.providers.items():
+            p95 = self._p95(name)
+            result[name] = {
+                'success': stats['success'],
+                'failure': stats['failure'],
+                'cancelled': stats['cancelled'],
+                'p95_ms': round(p95 * 1000, 1) if p95 is not None else None
+            }
+
+        return {
+            **self.stats,
+            'hedge_mode': self.hedge_mode,
+            'order': self.provider_order(),
+            'providers': result
+        }
+
     def _parse_fns_response(self, data: Dict) -> Dict:
         """
         Парсинг ответа от API ФНС
@@ -222,6 +520,26 @@ class FNSReceiptService:
 
         return qr_params
 
+    async def verify_receipts(self, qr_codes: List[str], max_concurrency: int = 5) -> List[Optional[Dict]]:
+        """
+        Проверить несколько чеков параллельно (не больше max_concurrency запросов)
+
+        Returns:
+            Результаты verify_and_save_receipt в порядке QR-кодов
+            (None - QR-код не разобран или проверка упала)
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def verify(qr_data: str) -> Optional[Dict]:
+            async with semaphore:
+                try:
+                    return await self.verify_and_save_receipt(qr_data)
+                except Exception as e:
+                    logger.error(f"Error verifying receipt {qr_data}: {e}")
+                    return None
+
+        return await asyncio.gather(*(verify(qr_data) for qr_data in qr_codes))
+
     def _build_fns_url(self, params: Dict) -> str:
         """
         Создать URL для просмотра чека на сайте ФНС
@@ -237,4 +555,7 @@ class FNSReceiptService:
 
 
 # Singleton instance
-fns_receipt_service = FNSReceiptService()
+fns_receipt_service = FNSReceiptService(
+    hedge_mode=settings.FNS_HEDGE_MODE,
+    hedge_delay=settings.FNS_HEDGE_DELAY
+)
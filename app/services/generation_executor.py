@@ -0,0 +1,152 @@
+"""
+Исполнитель генерации документов и отчетов
+
+Генераторы (openpyxl, python-docx) работают синхронно и грузят CPU,
+поэтому из обработчиков бота они запускаются в пуле процессов:
+цикл событий продолжает обрабатывать другие обновления, а независимые
+отчеты формируются параллельно. Процессы пула заранее импортируют
+openpyxl/docx и модули генераторов.
+"""
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Deque, Dict, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Импортируются в каждом процессе пула при запуске
+WARM_MODULES = (
+    'openpyxl',
+    'docx',
+    'app.services.report_generators',
+    'app.services.document_generator',
+)
+
+
+def _warm_up():
+    """Инициализатор процесса пула: импорт тяжелых модулей заранее"""
+    for name in WARM_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logger.warning(f"Generation worker could not import {name}: {e}")
+
+
+def _ready() -> bool:
+    return True
+
+
+class GenerationExecutor:
+    """
+    Пул процессов для генерации файлов с асинхронным API
+
+    Задание - любая функция или метод генератора, которые можно
+    передать в другой процесс (pickle), например RSVGenerator().generate.
+    """
+
+    def __init__(self, workers: int = 2, start_method: str = 'spawn', history: int = 100):
+        """
+        Args:
+            workers: Количество процессов
+            start_method: Способ запуска процессов (spawn безопасен
+                при работающем цикле событий и потоках)
+            history: Сколько последних заданий учитывать в метриках времени
+        """
+        self.workers = workers
+        self.start_method = start_method
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._in_progress = 0
+
+        self.completed = 0
+        self.failed = 0
+        self._durations_ms: Deque[float] = deque(maxlen=history)
+
+    @property
+    def is_running(self) -> bool:
+        return self._pool is not None
+
+    def start(self):
+        """Создать пул и запустить прогрев процессов"""
+        if self.is_running:
+            return
+
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_warm_up
+        )
+
+        # Процессы создаются по мере заданий - пустые задания поднимают все сразу
+        for _ in range(self.workers):
+            self._pool.submit(_ready)
+
+        logger.info(f"Generation executor started: {self.workers} processes")
+
+    async def stop(self):
+        """Дождаться текущих заданий и остановить процессы"""
+        if not self.is_running:
+            return
+
+        pool, self._pool = self._pool, None
+        await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+        logger.info("Generation executor stopped")
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Выполнить генерацию в процессе пула
+
+        Args:
+            func: Функция или метод генератора (передается через pickle)
+
+        Returns:
+            Результат функции (обычно путь к файлу)
+        """
+        if not self.is_running:
+            self.start()
+
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        self._in_progress += 1
+
+        try:
+            result = await loop.run_in_executor(self._pool, partial(func, *args, **kwargs))
+        except BrokenProcessPool:
+            # Процесс пула упал - следующий вызов создаст новый пул
+            self.failed += 1
+            self._pool = None
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._in_progress -= 1
+            self._durations_ms.append((time.perf_counter() - started) * 1000)
+
+        self.completed += 1
+        return result
+
+    def get_metrics(self) -> Dict:
+        """Метрики исполнителя (время в миллисекундах)"""
+        ordered = sorted(self._durations_ms)
+
+        return {
+            'workers': self.workers if self.is_running else 0,
+            'in_progress': self._in_progress,
+            'completed': self.completed,
+            'failed': self.failed,
+            'avg_ms': round(sum(ordered) / len(ordered), 1) if ordered else 0.0,
+            'max_ms': round(ordered[-1], 1) if ordered else 0.0
+        }
+
+
+# Общий исполнитель приложения
+generation_executor = GenerationExecutor(workers=settings.GENERATION_WORKERS)
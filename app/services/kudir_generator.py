@@ -1,18 +1,85 @@
 """
 Генератор КУДиР (Книга учета доходов и расходов) для УСН "доходы минус расходы"
+
+Без шаблона книга строится потоково: транзакции читаются курсором
+в порядке из SQL и пишутся в write-only книгу с именованными стилями,
+так что память не растет с числом операций.
 """
 import openpyxl
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, Border, Side, PatternFill, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
 from openpyxl.utils import get_column_letter
-from app.database import crud
+from app.database import crud, artifacts
+from app.database.models import Category, Transaction, GeneratedArtifact
 from app.config import settings
 from datetime import date
+from decimal import Decimal
+from sqlalchemy import select, and_, Select
 from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Optional, Tuple
+import asyncio
+import calendar
+from copy import copy
 import os
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Строк транзакций за одну выборку из курсора
+STREAM_BATCH_SIZE = 1000
+
+# Дата подписи заполняется при подписании: файл книги кэшируется
+# по версии данных и выдается повторно в другие дни
+SIGNATURE_DATE = "Дата: «____» ______________ 20___ г."
+
+# Шапка таблицы: (заголовок, ширина колонки)
+HEADERS = [
+    ("№", 5),
+    ("Дата и номер\nпервичного\nдокумента", 20),
+    ("Содержание операции", 40),
+    ("Доходы,\nучитываемые\nпри исчислении\nналоговой базы", 15),
+    ("Расходы,\nучитываемые\nпри исчислении\nналоговой базы", 15)
+]
+
+
+def kudir_period(year: int, quarter: Optional[int] = None) -> Tuple[date, date, str]:
+    """Границы периода книги и его название"""
+    if quarter:
+        start_date = date(year, (quarter - 1) * 3 + 1, 1)
+        last_month = quarter * 3
+        last_day = calendar.monthrange(year, last_month)[1]
+        end_date = date(year, last_month, last_day)
+        period_text = f"{year} год, {quarter} квартал"
+    else:
+        start_date = date(year, 1, 1)
+        end_date = date(year, 12, 31)
+        period_text = f"{year} год"
+
+    return start_date, end_date, period_text
+
+
+def document_text(date_: date, document_number: Optional[str]) -> str:
+    """Графа 2: дата и номер первичного документа"""
+    text = date_.strftime('%d.%m.%Y')
+    if document_number:
+        text += f"\n№ {document_number}"
+    return text
+
+
+def operation_content(
+    description: Optional[str],
+    counterparty: Optional[str],
+    category_name: Optional[str]
+) -> str:
+    """Графа 3: содержание операции"""
+    content = description or ""
+    if counterparty:
+        content = f"{counterparty}\n{content}" if content else counterparty
+    if category_name:
+        content += f"\n({category_name})"
+    return content
+
 
 async def generate_kudir(
     session: AsyncSession,
@@ -45,17 +112,7 @@ async def generate_kudir(
     ws.title = "Раздел I"
 
     # Определяем период
-    if quarter:
-        start_date = date(year, (quarter - 1) * 3 + 1, 1)
-        import calendar
-        last_month = quarter * 3
-        last_day = calendar.monthrange(year, last_month)[1]
-        end_date = date(year, last_month, last_day)
-        period_text = f"{year} год, {quarter} квартал"
-    else:
-        start_date = date(year, 1, 1)
-        end_date = date(year, 12, 31)
-        period_text = f"{year} год"
+    start_date, end_date, period_text = kudir_period(year, quarter)
 
     # Стили
     header_font = Font(bold=True, size=14)
@@ -83,17 +140,8 @@ async def generate_kudir(
     ws.merge_cells('A3:E3')
     ws['A3'].alignment = center_align
 
-    # Шапка таблицы
-    headers = [
-        ("№", 5),
-        ("Дата и номер\nпервичного\nдокумента", 20),
-        ("Содержание операции", 40),
-        ("Доходы,\nучитываемые\nпри исчислении\nналоговой базы", 15),
-        ("Расходы,\nучитываемые\nпри исчислении\nналоговой базы", 15)
-    ]
-
     row = 5
-    for col, (header, width) in enumerate(headers, start=1):
+    for col, (header, width) in enumerate(HEADERS, start=1):
         cell = ws.cell(row=row, column=col)
         cell.value = header
         cell.font = table_header_font
@@ -125,20 +173,12 @@ async def generate_kudir(
         cell.alignment = Alignment(horizontal='center')
 
         # Дата и номер документа
-        doc_text = t.date.strftime('%d.%m.%Y')
-        if t.document_number:
-            doc_text += f"\n№ {t.document_number}"
-        cell = ws.cell(row=row, column=2, value=doc_text)
+        cell = ws.cell(row=row, column=2, value=document_text(t.date, t.document_number))
         cell.border = border
         cell.alignment = Alignment(wrap_text=True)
 
         # Содержание операции
-        content = t.description or ""
-        if t.counterparty:
-            content = f"{t.counterparty}\n{content}" if content else t.counterparty
-        if t.category:
-            content += f"\n({t.category.name})"
-
+        content = operation_content(t.description, t.counterparty, t.category.name if t.category else None)
         cell = ws.cell(row=row, column=3, value=content)
         cell.border = border
         cell.alignment = Alignment(wrap_text=True, vertical='top')
@@ -205,18 +245,215 @@ async def generate_kudir(
     ws.cell(row=row, column=1, value=f"Директор ООО \"Лепта\"")
     ws.cell(row=row, column=3, value="__________________")
     row += 2
-    ws.cell(row=row, column=1, value=f"Дата: {date.today().strftime('%d.%m.%Y')}")
+    ws.cell(row=row, column=1, value=SIGNATURE_DATE)
 
     logger.info(f"KUDiR generated for {period_text}: income={total_income}, expense={total_expense}")
 
     return wb
 
 
-async def generate_kudir_file(
+def kudir_rows_query(start_date: date, end_date: date) -> Select:
+    """Строки книги: подтвержденные транзакции периода в порядке книги"""
+    return (
+        select(
+            Transaction.date,
+            Transaction.document_number,
+            Transaction.description,
+            Transaction.counterparty,
+            Transaction.type,
+            Transaction.amount,
+            Category.name,
+            Category.tax_deductible
+        )
+        .select_from(Transaction)
+        .outerjoin(Category, Transaction.category_id == Category.id)
+        .where(
+            and_(
+                Transaction.date >= start_date,
+                Transaction.date <= end_date,
+                Transaction.is_confirmed == True
+            )
+        )
+        .order_by(Transaction.date, Transaction.created_at, Transaction.id)
+    )
+
+
+def register_kudir_styles(wb: openpyxl.Workbook):
+    """Именованные стили книги (те же, что у ячеек generate_kudir)"""
+    border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+    center_align = Alignment(horizontal='center', vertical='center', wrap_text=True)
+    right = Alignment(horizontal='right')
+
+    for style in (
+        NamedStyle('kudir_title', font=Font(bold=True, size=14), alignment=center_align),
+        NamedStyle('kudir_company', font=DEFAULT_FONT, alignment=center_align),
+        NamedStyle('kudir_period', font=Font(bold=True, size=12), alignment=center_align),
+        NamedStyle('kudir_header', font=Font(bold=True, size=11), alignment=center_align, border=border),
+        NamedStyle('kudir_number', font=DEFAULT_FONT, border=border, alignment=Alignment(horizontal='center')),
+        NamedStyle('kudir_document', font=DEFAULT_FONT, border=border, alignment=Alignment(wrap_text=True)),
+        NamedStyle('kudir_content', font=DEFAULT_FONT, border=border, alignment=Alignment(wrap_text=True, vertical='top')),
+        NamedStyle('kudir_amount', font=DEFAULT_FONT, border=border, alignment=right, number_format='#,##0.00'),
+        NamedStyle('kudir_blank', font=DEFAULT_FONT, border=border, alignment=right),
+        NamedStyle('kudir_total_label', font=Font(bold=True, size=12), alignment=right, border=border),
+        NamedStyle('kudir_total', font=Font(bold=True), alignment=right, border=border, number_format='#,##0.00'),
+        NamedStyle('kudir_base_label', font=Font(bold=True), alignment=right),
+        NamedStyle(
+            'kudir_base', font=Font(bold=True, size=12), border=border, number_format='#,##0.00',
+            fill=PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+        ),
+    ):
+        wb.add_named_style(style)
+
+
+def _styled(ws, value, style: str, cache: Dict) -> WriteOnlyCell:
+    """
+    Ячейка write-only листа с именованным стилем
+
+    Поиск стиля по имени дорогой, поэтому индексы стиля запоминаются
+    в cache при первом использовании и копируются в новые ячейки.
+    """
+    cell = WriteOnlyCell(ws, value=value)
+
+    if style in cache:
+        cell._style = copy(cache[style])
+    else:
+        cell.style = style
+        cache[style] = copy(cell._style)
+
+    return cell
+
+
+def _append_transactions(ws, rows, number: int, styles: Dict) -> Tuple[int, Decimal, Decimal]:
+    """
+    Записать строки транзакций (вызывается в отдельном потоке)
+
+    Returns:
+        (номер последней строки, доходы, учитываемые расходы) по этим строкам
+    """
+    income = Decimal('0')
+    expense = Decimal('0')
+
+    for date_, document_number, description, counterparty, type_, amount, category_name, tax_deductible in rows:
+        number += 1
+        amount_cell = _styled(ws, float(amount), 'kudir_amount', styles)
+
+        if type_ == 'income':
+            income += amount
+            amounts = [amount_cell, _styled(ws, "", 'kudir_blank', styles)]
+        elif tax_deductible:
+            # Расходы учитываем только если категория tax_deductible
+            expense += amount
+            amounts = [_styled(ws, "", 'kudir_blank', styles), amount_cell]
+        else:
+            amounts = [_styled(ws, "", 'kudir_blank', styles), _styled(ws, "", 'kudir_blank', styles)]
+
+        ws.append([
+            _styled(ws, number, 'kudir_number', styles),
+            _styled(ws, document_text(date_, document_number), 'kudir_document', styles),
+            _styled(ws, operation_content(description, counterparty, category_name), 'kudir_content', styles),
+            *amounts
+        ])
+
+    return number, income, expense
+
+
+async def stream_kudir_file(
     session: AsyncSession,
     year: int,
     quarter: int = None,
     output_path: str = None
+) -> str:
+    """
+    Сгенерировать КУДиР потоково (без шаблона)
+
+    Содержимое листа совпадает с generate_kudir. Транзакции читаются
+    серверным курсором пачками по STREAM_BATCH_SIZE, запись строк
+    и сохранение файла идут в отдельном потоке.
+
+    Returns:
+        Путь к созданному файлу
+    """
+    start_date, end_date, period_text = kudir_period(year, quarter)
+
+    wb = openpyxl.Workbook(write_only=True)
+    register_kudir_styles(wb)
+    ws = wb.create_sheet("Раздел I")
+    styles = {}
+
+    for col, (_, width) in enumerate(HEADERS, start=1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+
+    # Титульная информация
+    ws.append([_styled(ws, "Раздел I. Доходы и расходы", 'kudir_title', styles)])
+    ws.append([_styled(ws, f"ООО \"Лепта\" (ИНН {settings.COMPANY_INN})", 'kudir_company', styles)])
+    ws.append([_styled(ws, period_text, 'kudir_period', styles)])
+    for title_row in (1, 2, 3):
+        ws.merged_cells.add(f'A{title_row}:E{title_row}')
+    ws.append([])
+
+    ws.append([_styled(ws, header, 'kudir_header', styles) for header, _ in HEADERS])
+
+    # Транзакции
+    number = 0
+    total_income = Decimal('0')
+    total_expense = Decimal('0')
+
+    result = await session.stream(
+        kudir_rows_query(start_date, end_date).execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+    async for rows in result.partitions(STREAM_BATCH_SIZE):
+        number, income, expense = await asyncio.to_thread(_append_transactions, ws, rows, number, styles)
+        total_income += income
+        total_expense += expense
+
+    # Итого
+    ws.append([])
+    row = 6 + number + 1
+    ws.append([
+        _styled(ws, "ИТОГО:", 'kudir_total_label', styles), None, None,
+        _styled(ws, float(total_income), 'kudir_total', styles),
+        _styled(ws, float(total_expense), 'kudir_total', styles)
+    ])
+    ws.merged_cells.add(f'A{row}:C{row}')
+
+    # База налогообложения
+    ws.append([])
+    tax_base = max(total_income - total_expense, 0)
+    ws.append([
+        _styled(ws, "База налогообложения (доходы - расходы):", 'kudir_base_label', styles), None, None,
+        _styled(ws, float(tax_base), 'kudir_base', styles)
+    ])
+    ws.merged_cells.add(f'A{row + 2}:C{row + 2}')
+
+    # Подпись
+    for _ in range(3):
+        ws.append([])
+    ws.append([f"Директор ООО \"Лепта\"", None, "__________________"])
+    ws.append([])
+    ws.append([SIGNATURE_DATE])
+
+    if not output_path:
+        quarter_suffix = f"_q{quarter}" if quarter else ""
+        output_path = f"/tmp/kudir_{year}{quarter_suffix}.xlsx"
+
+    await asyncio.to_thread(wb.save, output_path)
+
+    logger.info(f"KUDiR streamed for {period_text}: rows={number}, income={total_income}, expense={total_expense}")
+
+    return output_path
+
+
+async def generate_kudir_file(
+    session: AsyncSession,
+    year: int,
+    quarter: int = None,
+    output_path: str = None,
+    streaming: bool = True
 ) -> str:
     """
     Сгенерировать КУДиР и сохранить в файл
@@ -226,10 +463,16 @@ async def generate_kudir_file(
         year: Год
         quarter: Квартал
         output_path: Путь для сохранения (если None - в /tmp)
+        streaming: Потоковая генерация (если нет шаблона книги)
 
     Returns:
         Путь к созданному файлу
     """
+    template_path = os.path.join(settings.TEMPLATES_PATH, 'kudir_usn_income_expense.xlsx')
+
+    if streaming and not os.path.exists(template_path):
+        return await stream_kudir_file(session, year, quarter, output_path)
+
     wb = await generate_kudir(session, year, quarter)
 
     if not output_path:
@@ -241,3 +484,31 @@ async def generate_kudir_file(
     logger.info(f"KUDiR file saved: {output_path}")
 
     return output_path
+
+
+async def get_kudir_artifact(
+    session: AsyncSession,
+    year: int,
+    quarter: int = None
+) -> GeneratedArtifact:
+    """
+    Файл КУДиР из кэша отчетов или сгенерированный заново
+
+    Книга генерируется, только если подтвержденные транзакции
+    периода изменились с прошлой генерации.
+
+    Returns:
+        Запись кэша (file_path, telegram_file_id)
+    """
+    start_date, end_date, period_text = kudir_period(year, quarter)
+    version = await artifacts.get_data_version(session, start_date, end_date)
+
+    artifact = await artifacts.get_artifact(session, 'KUDIR', start_date, end_date, version)
+    if artifact:
+        logger.info(f"KUDiR for {period_text} served from cache")
+        return artifact
+
+    output_path = artifacts.artifact_path('KUDIR', start_date, end_date, version)
+    await generate_kudir_file(session, year, quarter, output_path=output_path)
+
+    return await artifacts.save_artifact(session, 'KUDIR', start_date, end_date, version, output_path)
@@ -0,0 +1,178 @@
+"""
+Кэш результатов распознавания чеков
+
+Повторно отправленное фото чека не распознается заново: результат
+ищется по file_unique_id из Telegram, по sha256 байтов изображения,
+а также в ocr_data уже сохраненных документов.
+
+Похожие (например, пересжатые) фото не ищутся: у разных чеков одной
+кассы одинаковая верстка, и новому чеку достались бы сумма, дата
+и фискальные данные другого.
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.postgresql import insert
+from app.database.models import OCRCache, Document
+from app.config import settings
+from typing import Dict, Optional
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Попадания по источникам и промахи с момента запуска
+_stats = {
+    'file': 0,
+    'content': 0,
+    'document': 0,
+    'misses': 0
+}
+
+
+def content_hash(image_bytes: bytes) -> str:
+    """sha256 байтов изображения"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+async def _touch(session: AsyncSession, entry_id: int):
+    """Учесть попадание: счетчик и время последнего использования (для LRU)"""
+    await session.execute(
+        update(OCRCache)
+        .where(OCRCache.id == entry_id)
+        .values(hits=OCRCache.hits + 1, last_used_at=func.now())
+    )
+    await session.commit()
+
+
+async def get_by_file(
+    session: AsyncSession,
+    file_unique_id: str,
+    file_id: Optional[str] = None
+) -> Optional[Dict]:
+    """
+    Результат OCR по фото Telegram - без скачивания файла
+
+    Args:
+        file_unique_id: Постоянный идентификатор файла в Telegram
+        file_id: file_id для поиска среди сохраненных документов
+
+    Returns:
+        Данные чека или None
+    """
+    result = await session.execute(
+        select(OCRCache.id, OCRCache.ocr_data)
+        .where(OCRCache.file_unique_id == file_unique_id)
+    )
+    row = result.first()
+
+    if row:
+        await _touch(session, row.id)
+        _stats['file'] += 1
+        return row.ocr_data
+
+    if file_id:
+        result = await session.execute(
+            select(Document.ocr_data)
+            .where(Document.telegram_file_id == file_id, Document.ocr_data.isnot(None))
+            .order_by(Document.id.desc())
+            .limit(1)
+        )
+        ocr_data = result.scalar()
+
+        if ocr_data:
+            _stats['document'] += 1
+            return ocr_data
+
+    return None
+
+
+async def get_by_image(session: AsyncSession, sha256: str) -> Optional[Dict]:
+    """
+    Результат OCR по содержимому изображения (совпадение байтов)
+
+    Args:
+        sha256: Хэш из content_hash
+
+    Returns:
+        Данные чека или None (учитывается как промах кэша)
+    """
+    result = await session.execute(
+        select(OCRCache.id, OCRCache.ocr_data)
+        .where(OCRCache.content_hash == sha256)
+    )
+    row = result.first()
+
+    if row:
+        await _touch(session, row.id)
+        _stats['content'] += 1
+        return row.ocr_data
+
+    _stats['misses'] += 1
+    return None
+
+
+async def store(
+    session: AsyncSession,
+    sha256: str,
+    ocr_data: Dict,
+    file_unique_id: Optional[str] = None,
+    max_entries: Optional[int] = None
+):
+    """
+    Сохранить результат OCR и вытеснить давно не использованные записи
+
+    Args:
+        sha256: Хэш изображения из content_hash
+        ocr_data: Распознанные данные чека
+        file_unique_id: Идентификатор файла в Telegram
+        max_entries: Размер кэша (по умолчанию OCR_CACHE_SIZE)
+    """
+    max_entries = max_entries or settings.OCR_CACHE_SIZE
+
+    statement = insert(OCRCache).values(
+        content_hash=sha256,
+        file_unique_id=file_unique_id,
+        ocr_data=ocr_data,
+        hits=0
+    )
+    await session.execute(
+        statement.on_conflict_do_update(
+            index_elements=['content_hash'],
+            set_={
+                'ocr_data': statement.excluded.ocr_data,
+                'file_unique_id': func.coalesce(OCRCache.file_unique_id, statement.excluded.file_unique_id),
+                'last_used_at': func.now()
+            }
+        )
+    )
+
+    # LRU: оставляем max_entries последних использованных
+    await session.execute(
+        delete(OCRCache).where(
+            OCRCache.id.in_(
+                select(OCRCache.id)
+                .order_by(OCRCache.last_used_at.desc(), OCRCache.id.desc())
+                .offset(max_entries)
+            )
+        )
+    )
+
+    await session.commit()
+
+
+def get_stats() -> Dict:
+    """Попадания по источникам, промахи и доля попаданий"""
+    hits = sum(value for key, value in _stats.items() if key != 'misses')
+    total = hits + _stats['misses']
+
+    return {
+        **_stats,
+        'hits': hits,
+        'hit_rate': round(hits / total, 3) if total else 0.0
+    }
+
+
+def reset_stats():
+    """Сбросить счетчики попаданий"""
+    for key in _stats:
+        _stats[key] = 0
@@ -0,0 +1,168 @@
+"""
+Очередь распознавания чеков
+
+Запросы к OpenAI Vision занимают секунды, поэтому обработчик фото
+не ждет их сам: задание кладется в очередь, его забирает один из
+воркеров, а результат возвращается через callback.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from app.config import settings
+from app.services.ocr_service import recognize_receipt
+
+logger = logging.getLogger(__name__)
+
+OCRCallback = Callable[[Optional[Dict]], Awaitable[None]]
+
+
+class OCRQueue:
+    """
+    Очередь OCR с ограниченным пулом асинхронных воркеров
+
+    Метрики: глубина очереди, задания в работе, время ожидания
+    в очереди и время распознавания (по последним заданиям).
+    """
+
+    def __init__(
+        self,
+        workers: int = 3,
+        maxsize: int = 100,
+        recognizer: Callable[[bytes], Awaitable[Optional[Dict]]] = recognize_receipt,
+        history: int = 200
+    ):
+        """
+        Args:
+            workers: Количество одновременных запросов к OCR
+            maxsize: Максимальная длина очереди
+            recognizer: Функция распознавания (по умолчанию recognize_receipt)
+            history: Сколько последних заданий учитывать в метриках времени
+        """
+        self.workers = workers
+        self.maxsize = maxsize
+        self.recognizer = recognizer
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._in_progress = 0
+
+        self.processed = 0
+        self.failed = 0
+        self._wait_ms: Deque[float] = deque(maxlen=history)
+        self._process_ms: Deque[float] = deque(maxlen=history)
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Запустить воркеры (в работающем цикле событий)"""
+        if self.is_running:
+            return
+
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"ocr-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"OCR queue started: {self.workers} workers")
+
+    async def stop(self, drain: bool = False):
+        """
+        Остановить воркеры
+
+        Args:
+            drain: Дождаться обработки уже поставленных заданий
+        """
+        if not self.is_running:
+            return
+
+        if drain:
+            await self._queue.join()
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        self._tasks = []
+        logger.info("OCR queue stopped")
+
+    def submit(self, image_bytes: bytes, callback: OCRCallback) -> int:
+        """
+        Поставить фото чека в очередь
+
+        Args:
+            image_bytes: Байты изображения
+            callback: Корутина, которая получит результат распознавания
+                (Dict с данными чека или None)
+
+        Returns:
+            Количество заданий перед этим в очереди
+
+        Raises:
+            asyncio.QueueFull: Очередь переполнена
+        """
+        if not self.is_running:
+            self.start()
+
+        ahead = self._queue.qsize()
+        self._queue.put_nowait((image_bytes, callback, time.perf_counter()))
+        return ahead
+
+    async def _worker(self, number: int):
+        """Воркер: берет задания из очереди, пока его не отменят"""
+        while True:
+            image_bytes, callback, enqueued_at = await self._queue.get()
+            self._in_progress += 1
+            started = time.perf_counter()
+            self._wait_ms.append((started - enqueued_at) * 1000)
+
+            try:
+                result = await self.recognizer(image_bytes)
+            except Exception as e:
+                logger.error(f"OCR worker {number}: recognition failed: {e}")
+                result = None
+            finally:
+                self._process_ms.append((time.perf_counter() - started) * 1000)
+                self._in_progress -= 1
+
+            if result is None:
+                self.failed += 1
+            else:
+                self.processed += 1
+
+            try:
+                await callback(result)
+            except Exception as e:
+                logger.error(f"OCR worker {number}: callback failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def get_metrics(self) -> Dict:
+        """Метрики очереди (время в миллисекундах)"""
+        def stats(values: Deque[float]) -> Dict:
+            if not values:
+                return {'avg_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+            ordered = sorted(values)
+            return {
+                'avg_ms': round(sum(ordered) / len(ordered), 1),
+                'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+                'max_ms': round(ordered[-1], 1)
+            }
+
+        return {
+            'workers': len(self._tasks),
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'in_progress': self._in_progress,
+            'processed': self.processed,
+            'failed': self.failed,
+            'wait': stats(self._wait_ms),
+            'process': stats(self._process_ms)
+        }
+
+
+# Общая очередь приложения
+ocr_queue = OCRQueue(workers=settings.OCR_WORKERS, maxsize=settings.OCR_QUEUE_SIZE)
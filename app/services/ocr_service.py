@@ -1,7 +1,7 @@
 """
 OCR сервис для распознавания чеков через OpenAI Vision API
 """
-from openai import OpenAI
+from openai import AsyncOpenAI
 from app.config import settings
 from typing import Dict, Optional
 import json
@@ -10,6 +10,37 @@ import base64
 
 logger = logging.getLogger(__name__)
 
+# Общий клиент: пул HTTP-соединений к OpenAI переиспользуется между вызовами
+_client: Optional[AsyncOpenAI] = None
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """Общий асинхронный клиент OpenAI"""
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+    return _client
+
+
+async def close_openai_client():
+    """Закрыть соединения общего клиента (при остановке приложения)"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def parse_receipt_response(response_text: str) -> Dict:
+    """Извлечь JSON с данными чека из ответа модели"""
+    if "```json" in response_text:
+        json_str = response_text.split("```json")[1].split("```")[0].strip()
+    elif "```" in response_text:
+        json_str = response_text.split("```")[1].split("```")[0].strip()
+    else:
+        json_str = response_text.strip()
+
+    return json.loads(json_str)
+
 
 async def recognize_receipt(image_bytes: bytes) -> Optional[Dict]:
     """
@@ -21,8 +52,10 @@ async def recognize_receipt(image_bytes: bytes) -> Optional[Dict]:
     Returns:
         Dict с данными чека или None при ошибке
     """
+    response_text = None
+
     try:
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        client = get_openai_client()
 
         # Кодируем изображение в base64
         image_base64 = base64.b64encode(image_bytes).decode('utf-8')
@@ -61,7 +94,7 @@ async def recognize_receipt(image_bytes: bytes) -> Optional[Dict]:
 """
 
         # Запрос к OpenAI GPT-4 Vision
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-4o",  # gpt-4o поддерживает vision и дешевле
             max_tokens=1024,
             messages=[
@@ -87,14 +120,7 @@ async def recognize_receipt(image_bytes: bytes) -> Optional[Dict]:
         response_text = response.choices[0].message.content
 
         # Извлекаем JSON из ответа
-        if "```json" in response_text:
-            json_str = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            json_str = response_text.split("```")[1].split("```")[0].strip()
-        else:
-            json_str = response_text.strip()
-
-        receipt_data = json.loads(json_str)
+        receipt_data = parse_receipt_response(response_text)
 
         logger.info(f"Receipt recognized: {receipt_data.get('seller')}, amount: {receipt_data.get('amount')}")
         return receipt_data
@@ -120,7 +146,7 @@ async def categorize_expense(description: str, items: list = None) -> str:
         Название категории
     """
     try:
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        client = get_openai_client()
 
         items_text = ", ".join(items) if items else "нет данных"
 
@@ -149,7 +175,7 @@ async def categorize_expense(description: str, items: list = None) -> str:
 Верни только название категории, без пояснений.
 """
 
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-3.5-turbo",  # Для простой категоризации достаточно 3.5
             max_tokens=50,
             messages=[{"role": "user", "content": prompt}]
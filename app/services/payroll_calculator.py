@@ -2,12 +2,16 @@
 Расчет зарплаты и налогов
 """
 import logging
+import time
+from calendar import monthrange
 from decimal import Decimal
 from datetime import date
-from typing import Dict, List
+from typing import Dict, List, Optional, Sequence
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, func, and_
+from sqlalchemy.dialects.postgresql import insert
 
+from ..database import reporting
 from ..database.models import Employee, Shift, Payroll, TaxPayment
 
 logger = logging.getLogger(__name__)
@@ -45,9 +49,6 @@ class PayrollCalculator:
             raise ValueError(f"Employee {employee_id} not found")
 
         # Получить смены за месяц
-        from datetime import datetime
-        from calendar import monthrange
-
         start_date = date(year, month, 1)
         last_day = monthrange(year, month)[1]
         end_date = date(year, month, last_day)
@@ -66,6 +67,18 @@ class PayrollCalculator:
         if not employee.hourly_rate:
             raise ValueError(f"Employee {employee_id} has no hourly rate")
 
+        return self.payroll_from_hours(employee, total_hours, year, month)
+
+    def payroll_from_hours(self, employee, total_hours: Decimal, year: int, month: int) -> Dict:
+        """
+        Расчет зарплаты по отработанным часам (без обращения к БД)
+
+        Args:
+            employee: Сотрудник или строка с id, full_name, hourly_rate
+
+        Returns:
+            Dict с расчетом зарплаты
+        """
         gross_salary = total_hours * Decimal(str(employee.hourly_rate))
 
         # НДФЛ
@@ -75,20 +88,10 @@ class PayrollCalculator:
         net_salary = gross_salary - ndfl
 
         # Страховые взносы (работодатель платит сверх)
-        pension_contrib = (gross_salary * self.PENSION_RATE).quantize(Decimal('0.01'))
-        medical_contrib = (gross_salary * self.MEDICAL_RATE).quantize(Decimal('0.01'))
-        social_contrib = (gross_salary * self.SOCIAL_RATE).quantize(Decimal('0.01'))
-        injury_contrib = (gross_salary * self.INJURY_RATE).quantize(Decimal('0.01'))
-
-        total_contributions = (
-            pension_contrib +
-            medical_contrib +
-            social_contrib +
-            injury_contrib
-        )
+        contributions = self.split_contributions(gross_salary)
 
         return {
-            'employee_id': employee_id,
+            'employee_id': employee.id,
             'employee_name': employee.full_name,
             'period_month': month,
             'period_year': year,
@@ -97,16 +100,39 @@ class PayrollCalculator:
             'gross_salary': gross_salary,
             'ndfl': ndfl,
             'net_salary': net_salary,
-            'contributions': {
-                'pension': pension_contrib,
-                'medical': medical_contrib,
-                'social': social_contrib,
-                'injury': injury_contrib,
-                'total': total_contributions
-            },
-            'total_cost': gross_salary + total_contributions
+            'contributions': contributions,
+            'total_cost': gross_salary + contributions['total']
         }
 
+    def split_contributions(self, gross_salary: Optional[Decimal]) -> Dict:
+        """Страховые взносы с начисления по видам"""
+        gross_salary = gross_salary or Decimal('0')
+
+        contributions = {
+            'pension': (gross_salary * self.PENSION_RATE).quantize(Decimal('0.01')),
+            'medical': (gross_salary * self.MEDICAL_RATE).quantize(Decimal('0.01')),
+            'social': (gross_salary * self.SOCIAL_RATE).quantize(Decimal('0.01')),
+            'injury': (gross_salary * self.INJURY_RATE).quantize(Decimal('0.01'))
+        }
+        contributions['total'] = sum(contributions.values(), Decimal('0'))
+        return contributions
+
+    def report_payrolls(self, payroll_rows: Sequence) -> List[Dict]:
+        """
+        Начисления квартала в формате генератора РСВ
+
+        Args:
+            payroll_rows: Строки из reporting.get_quarter_payroll
+        """
+        return [
+            {
+                'employee_name': row.full_name or 'Unknown',
+                'gross_salary': row.gross_salary,
+                'contributions': self.split_contributions(row.gross_salary)
+            }
+            for row in payroll_rows
+        ]
+
     async def save_payroll(self, payroll_data: Dict) -> Payroll:
         """Сохранить расчет зарплаты в БД"""
 
@@ -155,65 +181,125 @@ class PayrollCalculator:
 
     async def calculate_all_payrolls(self, year: int, month: int) -> List[Dict]:
         """Рассчитать зарплату для всех активных сотрудников за месяц"""
+        run = await self.run_payroll(year, month)
+        return run['payrolls']
+
+    async def run_payroll(self, year: int, month: int) -> Dict:
+        """
+        Расчет и сохранение зарплаты всех активных сотрудников за месяц
+
+        Часы всех сотрудников - один запрос GROUP BY, все начисления
+        сохраняются одним INSERT ... ON CONFLICT в одной транзакции.
+
+        Returns:
+            Dict с расчетами (payrolls), пропущенными сотрудниками
+            без ставки (skipped) и длительностью расчета (duration_ms)
+        """
+        started = time.perf_counter()
+
+        start_date = date(year, month, 1)
+        end_date = date(year, month, monthrange(year, month)[1])
 
         result = await self.session.execute(
-            select(Employee).where(Employee.fire_date.is_(None))
+            select(
+                Employee.id,
+                Employee.full_name,
+                Employee.hourly_rate,
+                func.coalesce(func.sum(Shift.hours_worked), 0).label('total_hours')
+            )
+            .outerjoin(
+                Shift,
+                and_(
+                    Shift.employee_id == Employee.id,
+                    Shift.shift_date >= start_date,
+                    Shift.shift_date <= end_date
+                )
+            )
+            .where(Employee.fire_date.is_(None))
+            .group_by(Employee.id, Employee.full_name, Employee.hourly_rate)
+            .order_by(Employee.id)
         )
-        employees = result.scalars().all()
 
         payrolls = []
-        for employee in employees:
-            if not employee.hourly_rate:
-                logger.warning(f"Skipping employee {employee.id} - no hourly rate")
+        skipped = []
+        for row in result.all():
+            if not row.hourly_rate:
+                logger.warning(f"Skipping employee {row.id} - no hourly rate")
+                skipped.append(row.id)
                 continue
 
-            try:
-                payroll_data = await self.calculate_monthly_payroll(
-                    employee.id,
-                    year,
-                    month
+            payrolls.append(self.payroll_from_hours(row, Decimal(str(row.total_hours)), year, month))
+
+        if payrolls:
+            statement = insert(Payroll).values([
+                {
+                    'employee_id': payroll_data['employee_id'],
+                    'period_month': month,
+                    'period_year': year,
+                    'total_hours': payroll_data['total_hours'],
+                    'gross_salary': payroll_data['gross_salary'],
+                    'ndfl': payroll_data['ndfl'],
+                    'contributions': payroll_data['contributions']['total'],
+                    'net_salary': payroll_data['net_salary'],
+                    'status': 'DRAFT'
+                }
+                for payroll_data in payrolls
+            ])
+            await self.session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=['employee_id', 'period_year', 'period_month'],
+                    set_={
+                        'total_hours': statement.excluded.total_hours,
+                        'gross_salary': statement.excluded.gross_salary,
+                        'ndfl': statement.excluded.ndfl,
+                        'contributions': statement.excluded.contributions,
+                        'net_salary': statement.excluded.net_salary
+                    }
                 )
-                payrolls.append(payroll_data)
-
-                # Сохранить в БД
-                await self.save_payroll(payroll_data)
+            )
+            await self.session.commit()
 
-            except Exception as e:
-                logger.error(f"Error calculating payroll for employee {employee.id}: {e}")
-                continue
+        duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(
+            f"Payroll run {month:02d}/{year}: {len(payrolls)} employees, "
+            f"{len(skipped)} skipped, {duration_ms} ms"
+        )
 
-        return payrolls
+        return {
+            'period_year': year,
+            'period_month': month,
+            'payrolls': payrolls,
+            'skipped': skipped,
+            'duration_ms': duration_ms
+        }
 
-    async def calculate_quarterly_taxes(self, year: int, quarter: int) -> Dict:
+    async def calculate_quarterly_taxes(
+        self,
+        year: int,
+        quarter: int,
+        payroll_rows: Optional[Sequence] = None
+    ) -> Dict:
         """
         Рассчитать налоги за квартал
 
         Args:
             year: Год
             quarter: Квартал (1-4)
+            payroll_rows: Начисления квартала из reporting.get_quarter_payroll,
+                если уже загружены в этом запросе
 
         Returns:
             Dict с расчетом налогов
         """
-        # Определить месяцы квартала
-        month_start = (quarter - 1) * 3 + 1
-        month_end = month_start + 2
+        if payroll_rows is None:
+            payroll_rows = await reporting.get_quarter_payroll(self.session, year, quarter)
 
-        # Получить все зарплаты за квартал
-        result = await self.session.execute(
-            select(Payroll).where(
-                Payroll.period_year == year,
-                Payroll.period_month >= month_start,
-                Payroll.period_month <= month_end,
-                Payroll.status != 'DRAFT'
-            )
-        )
-        payrolls = result.scalars().all()
+        # Учитываются только утвержденные и выплаченные начисления
+        payrolls = reporting.approved_payroll(payroll_rows)
 
         # Суммы
-        total_gross = sum(p.gross_salary or Decimal('0') for p in payrolls)
-        total_ndfl = sum(p.ndfl or Decimal('0') for p in payrolls)
-        total_contributions = sum(p.contributions or Decimal('0') for p in payrolls)
+        total_gross = sum((p.gross_salary or Decimal('0') for p in payrolls), Decimal('0'))
+        total_ndfl = sum((p.ndfl or Decimal('0') for p in payrolls), Decimal('0'))
 
         # Разбивка по типам взносов
         pension = (total_gross * self.PENSION_RATE).quantize(Decimal('0.01'))
@@ -0,0 +1,169 @@
+"""
+Быстрое распознавание чека по фискальному QR-коду
+
+Большинство чеков содержат QR вида t=...&s=...&fn=...&i=...&fp=...
+Если он читается с фото, чек разбирается через ФНС без OCR:
+миллисекунды на декодирование вместо секунд на запрос к Vision API.
+
+Декодирование выполняет OpenCV (opencv-python-headless) в отдельном
+пуле потоков. Без OpenCV быстрый путь просто отключен.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+try:
+    import cv2
+    import numpy as np
+except ImportError:  # pragma: no cover - зависит от окружения
+    cv2 = None
+    np = None
+
+from app.services.fns_receipt import fns_receipt_service
+
+logger = logging.getLogger(__name__)
+
+# Большие фото уменьшаются до этой стороны перед повторной попыткой
+MAX_SIDE = 1600
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="qr-decoder")
+
+_stats = {
+    'attempts': 0,
+    'qr_found': 0,
+    'fiscal': 0,
+    'total_ms': 0.0
+}
+
+
+def is_available() -> bool:
+    """Установлен ли OpenCV"""
+    return cv2 is not None
+
+
+def decode_qr(image_bytes: bytes) -> Optional[str]:
+    """
+    Найти и прочитать QR-код на изображении (синхронно, CPU)
+
+    Returns:
+        Текст QR-кода или None
+    """
+    if cv2 is None:
+        return None
+
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        return None
+
+    detector = cv2.QRCodeDetector()
+    candidates = [image]
+
+    height, width = image.shape[:2]
+    if max(height, width) > MAX_SIDE:
+        scale = MAX_SIDE / max(height, width)
+        candidates.append(cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA))
+
+    for candidate in candidates:
+        try:
+            text, points, _ = detector.detectAndDecode(candidate)
+        except cv2.error as e:
+            logger.debug(f"QR detection failed: {e}")
+            continue
+        if text:
+            return text
+
+    return None
+
+
+def is_fiscal_qr(text: str) -> bool:
+    """Похож ли текст QR на фискальный (чек ККТ)"""
+    return all(f"{key}=" in text for key in ('t', 's', 'fn', 'i', 'fp'))
+
+
+def receipt_to_ocr_data(receipt: Dict) -> Dict:
+    """
+    Данные чека ФНС в формате результата OCR (recognize_receipt)
+
+    Значения приводятся к JSON-совместимым типам: результат хранится
+    в состоянии бота и в Document.ocr_data.
+    """
+    items = [item['name'] for item in receipt.get('items') or [] if item.get('name')]
+
+    return {
+        'date': receipt['purchase_date'].date().isoformat(),
+        'amount': float(receipt['total_amount']),
+        'seller': receipt.get('seller_name'),
+        'seller_inn': receipt.get('seller_inn'),
+        'items': items,
+        'category': 'Прочие расходы',
+        'payment_method': receipt.get('payment_type', 'cash'),
+        'fiscal': {
+            'fn': receipt['fiscal_storage'],
+            'fd': receipt['fiscal_document'],
+            'fp': receipt['fiscal_sign'],
+            'qr_raw': receipt['qr_raw']
+        }
+    }
+
+
+async def recognize_fiscal_qr(image_bytes: bytes) -> Optional[Dict]:
+    """
+    Распознать чек по фискальному QR-коду на фото
+
+    Returns:
+        Данные чека в формате OCR или None, если фискального QR нет
+        (тогда фото идет в обычное распознавание)
+    """
+    if cv2 is None:
+        return None
+
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    _stats['attempts'] += 1
+
+    try:
+        text = await loop.run_in_executor(_executor, decode_qr, image_bytes)
+    except Exception as e:
+        logger.warning(f"QR decoding error: {e}")
+        text = None
+    finally:
+        _stats['total_ms'] += (time.perf_counter() - started) * 1000
+
+    if not text:
+        return None
+
+    _stats['qr_found'] += 1
+
+    if not is_fiscal_qr(text):
+        return None
+
+    receipt = await fns_receipt_service.verify_and_save_receipt(text)
+    if not receipt:
+        return None
+
+    _stats['fiscal'] += 1
+    logger.info(f"Receipt recognized by fiscal QR: fn={receipt['fiscal_storage']}, amount={receipt['total_amount']}")
+
+    return receipt_to_ocr_data(receipt)
+
+
+def get_stats() -> Dict:
+    """Доля фото, распознанных по фискальному QR, и среднее время декодирования"""
+    attempts = _stats['attempts']
+
+    return {
+        'available': is_available(),
+        'attempts': attempts,
+        'qr_found': _stats['qr_found'],
+        'fiscal': _stats['fiscal'],
+        'hit_rate': round(_stats['fiscal'] / attempts, 3) if attempts else 0.0,
+        'avg_decode_ms': round(_stats['total_ms'] / attempts, 1) if attempts else 0.0
+    }
+
+
+def reset_stats():
+    """Сбросить счетчики"""
+    for key in _stats:
+        _stats[key] = 0
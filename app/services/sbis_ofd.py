@@ -9,93 +9,274 @@
 - Уведомления о проблемах
 """
 
+import asyncio
 import logging
+import os
+import time
 import aiohttp
 from datetime import date, datetime, timedelta
-from typing import Optional, Dict, List, Tuple
+from typing import Optional, Dict, List, Tuple, AsyncIterator
 from decimal import Decimal
 
 logger = logging.getLogger(__name__)
 
 
+DEFAULT_BASE_URL = "https://api.sbis.ru/ofd/v1"
+
+# Сколько секунд держать в памяти итоги незакрытой смены
+OPEN_SHIFT_TTL = 60
+
+# Чеков на странице при выгрузке
+RECEIPTS_PAGE_SIZE = 1000
+
+
+class OFDRequestError(Exception):
+    """Не удалось получить данные из СБИС ОФД"""
+
+
 class SbisOFD:
     """
     Клиент для работы с СБИС ОФД API
 
+    Держит одну aiohttp-сессию с пулом keep-alive соединений на все
+    запросы клиента. Сессия создается при первом запросе, закрывается
+    через close().
+
+    Итоги закрытых смен кэшируются в памяти и в таблице ofd_shift_totals
+    (после закрытия смены они не меняются), итоги открытых смен -
+    только в памяти на OPEN_SHIFT_TTL секунд.
+
     Документация API: https://sbis.ru/ofd/api
     """
 
-    def __init__(self, api_token: str, inn: str):
+    def __init__(
+        self,
+        api_token: str,
+        inn: str,
+        base_url: Optional[str] = None,
+        max_connections: int = 10,
+        session_factory=None,
+        open_shift_ttl: float = OPEN_SHIFT_TTL
+    ):
         """
         Args:
             api_token: Токен доступа к СБИС ОФД API
             inn: ИНН организации
+            base_url: Адрес API (по умолчанию SBIS_OFD_URL или боевой адрес)
+            max_connections: Размер пула соединений
+            session_factory: Фабрика сессий БД для кэша закрытых смен
+                (по умолчанию async_session_maker)
+            open_shift_ttl: Время жизни итогов открытой смены в памяти (сек)
         """
         self.api_token = api_token
         self.inn = inn
-        self.base_url = "https://api.sbis.ru/ofd/v1"
+        self.base_url = (base_url or os.getenv("SBIS_OFD_URL") or DEFAULT_BASE_URL).rstrip("/")
         self.timeout = aiohttp.ClientTimeout(total=30)
+        self.max_connections = max_connections
+        self.metrics: Dict[str, Dict] = {}
+        self.session_factory = session_factory
+        self.open_shift_ttl = open_shift_ttl
+        self.cache_stats = {"memory": 0, "db": 0, "ofd": 0}
+
+        # (kkt_number, дата) -> (истекает в, итоги); None - бессрочно
+        self._totals_cache: Dict[Tuple[str, date], Tuple[Optional[float], Dict]] = {}
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Общая сессия клиента (пересоздается, если закрыта или цикл событий сменился)"""
+        loop = asyncio.get_running_loop()
+
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._discard_session()
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_connections,
+                    keepalive_timeout=60
+                ),
+                headers={
+                    "Authorization": f"Bearer {self.api_token}",
+                    "Content-Type": "application/json"
+                }
+            )
+            self._loop = loop
+
+        return self._session
+
+    def _discard_session(self):
+        """
+        Освободить сессию прежнего цикла событий
+
+        Дождаться ее закрытия в новом цикле нельзя: соединения пула
+        закрываются синхронно (в уже закрытом цикле закрывать нечего).
+        """
+        session, self._session, self._loop = self._session, None, None
+
+        if session is None or session.closed:
+            return
+
+        connector = session.connector
+        session.detach()
+        if connector is not None:
+            connector.close()
+
+    async def close(self):
+        """Закрыть сессию и соединения пула"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _record(self, endpoint: str, elapsed_ms: float, ok: bool):
+        """Учесть время запроса в метриках клиента"""
+        stats = self.metrics.setdefault(endpoint, {
+            "requests": 0,
+            "errors": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+            "last_ms": 0.0
+        })
+        stats["requests"] += 1
+        stats["errors"] += 0 if ok else 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        stats["last_ms"] = elapsed_ms
+
+    def get_metrics(self) -> Dict[str, Dict]:
+        """Метрики запросов по endpoint: количество, ошибки, среднее и максимальное время (мс)"""
+        return {
+            endpoint: {
+                "requests": stats["requests"],
+                "errors": stats["errors"],
+                "avg_ms": round(stats["total_ms"] / stats["requests"], 1),
+                "max_ms": round(stats["max_ms"], 1),
+                "last_ms": round(stats["last_ms"], 1)
+            }
+            for endpoint, stats in self.metrics.items()
+        }
 
     async def _request(self, method: str, endpoint: str, params: Dict = None, json_data: Dict = None) -> Dict:
         """Выполнить запрос к API"""
         url = f"{self.base_url}/{endpoint}"
-
-        headers = {
-            "Authorization": f"Bearer {self.api_token}",
-            "Content-Type": "application/json"
-        }
+        started = time.perf_counter()
+        ok = False
 
         try:
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                async with session.request(
-                    method,
-                    url,
-                    headers=headers,
-                    params=params,
-                    json=json_data
-                ) as response:
-
-                    if response.status == 200:
-                        return await response.json()
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"SBIS OFD API error {response.status}: {error_text}")
-                        return None
+            async with self._get_session().request(
+                method,
+                url,
+                params=params,
+                json=json_data
+            ) as response:
+
+                if response.status == 200:
+                    ok = True
+                    return await response.json()
+                else:
+                    error_text = await response.text()
+                    logger.error(f"SBIS OFD API error {response.status}: {error_text}")
+                    return None
 
         except Exception as e:
             logger.error(f"Error calling SBIS OFD API: {e}")
             return None
 
-    async def get_shift_receipts(
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._record(endpoint, elapsed_ms, ok)
+            logger.debug(f"SBIS OFD {method} {endpoint}: {elapsed_ms:.0f} ms")
+
+    async def iter_receipt_pages(
         self,
         shift_date: date,
-        kkt_number: Optional[str] = None
-    ) -> Optional[List[Dict]]:
+        kkt_number: Optional[str] = None,
+        page_size: int = RECEIPTS_PAGE_SIZE
+    ) -> AsyncIterator[List[Dict]]:
         """
-        Получить все чеки за смену
+        Постраничная выгрузка чеков за смену
+
+        Следующая страница запрашивается, пока вызывающий код
+        обрабатывает текущую.
 
         Args:
             shift_date: Дата смены
             kkt_number: Номер ККТ (опционально, если касс несколько)
+            page_size: Количество чеков на странице
 
-        Returns:
-            Список чеков или None при ошибке
+        Yields:
+            Списки чеков по страницам
+
+        Raises:
+            OFDRequestError: Страницу не удалось получить
         """
         params = {
             "inn": self.inn,
             "date_from": shift_date.isoformat(),
-            "date_to": shift_date.isoformat()
+            "date_to": shift_date.isoformat(),
+            "limit": page_size
         }
 
         if kkt_number:
             params["kkt_number"] = kkt_number
 
-        data = await self._request("GET", "receipts", params=params)
-
-        if data and "receipts" in data:
+        async def fetch(offset: int) -> List[Dict]:
+            data = await self._request("GET", "receipts", params={**params, "offset": offset})
+            if not data or "receipts" not in data:
+                raise OFDRequestError(f"Receipts page at offset {offset} is unavailable")
             return data["receipts"]
 
-        return None
+        offset = 0
+        next_page = asyncio.ensure_future(fetch(offset))
+
+        try:
+            while next_page is not None:
+                page = await next_page
+                offset += len(page)
+
+                # Полная страница - за ней может быть еще одна
+                next_page = asyncio.ensure_future(fetch(offset)) if len(page) >= page_size else None
+
+                if page:
+                    yield page
+        finally:
+            if next_page is not None and not next_page.done():
+                next_page.cancel()
+
+    async def get_shift_receipts(
+        self,
+        shift_date: date,
+        kkt_number: Optional[str] = None
+    ) -> Optional[List[Dict]]:
+        """
+        Получить все чеки за смену
+
+        Для больших смен лучше iter_receipt_pages: чеки не держатся в памяти целиком.
+
+        Args:
+            shift_date: Дата смены
+            kkt_number: Номер ККТ (опционально, если касс несколько)
+
+        Returns:
+            Список чеков или None при ошибке
+        """
+        receipts = []
+
+        try:
+            async for page in self.iter_receipt_pages(shift_date, kkt_number):
+                receipts.extend(page)
+        except OFDRequestError as e:
+            logger.error(f"Error loading receipts for {shift_date}: {e}")
+            return None
+
+        return receipts
 
     async def get_shift_totals(
         self,
@@ -105,6 +286,8 @@ class SbisOFD:
         """
         Получить итоги смены (Z-отчет)
 
+        Сначала ищет в кэше: в памяти, затем в БД (для закрытых смен).
+
         Args:
             shift_date: Дата смены
             kkt_number: Номер ККТ
@@ -121,6 +304,80 @@ class SbisOFD:
                 "closed_at": "2025-01-15T20:00:00"
             }
         """
+        key = (kkt_number or "", shift_date)
+
+        cached = self._totals_cache.get(key)
+        if cached and (cached[0] is None or cached[0] > time.monotonic()):
+            self.cache_stats["memory"] += 1
+            return dict(cached[1])
+
+        totals = await self._load_closed_totals(shift_date, kkt_number)
+        if totals:
+            self.cache_stats["db"] += 1
+            self._totals_cache[key] = (None, totals)
+            return dict(totals)
+
+        totals = await self._fetch_shift_totals(shift_date, kkt_number)
+        if not totals:
+            return None
+
+        self.cache_stats["ofd"] += 1
+
+        if totals.get("closed_at") is not None:
+            self._totals_cache[key] = (None, totals)
+            await self._store_closed_totals(shift_date, kkt_number, totals)
+        else:
+            self._totals_cache[key] = (time.monotonic() + self.open_shift_ttl, totals)
+
+        return dict(totals)
+
+    def _get_session_factory(self):
+        """Фабрика сессий БД для кэша закрытых смен"""
+        if self.session_factory is None:
+            from app.database.db import async_session_maker
+            self.session_factory = async_session_maker
+        return self.session_factory
+
+    async def _load_closed_totals(self, shift_date: date, kkt_number: Optional[str]) -> Optional[Dict]:
+        """Итоги закрытой смены из БД (None, если нет или БД недоступна)"""
+        from app.database import crud
+
+        try:
+            async with self._get_session_factory()() as session:
+                row = await crud.get_ofd_shift_totals(session, self.inn, kkt_number, shift_date)
+        except Exception as e:
+            logger.warning(f"OFD shift totals cache unavailable: {e}")
+            return None
+
+        if not row:
+            return None
+
+        return {
+            "cash": Decimal(str(row.cash)),
+            "cashless": Decimal(str(row.cashless)),
+            "total": Decimal(str(row.total)),
+            "receipts_count": row.receipts_count,
+            "shift_number": row.shift_number,
+            "opened_at": row.opened_at,
+            "closed_at": row.closed_at
+        }
+
+    async def _store_closed_totals(self, shift_date: date, kkt_number: Optional[str], totals: Dict):
+        """Сохранить итоги закрытой смены в БД"""
+        from app.database import crud
+
+        try:
+            async with self._get_session_factory()() as session:
+                await crud.save_ofd_shift_totals(session, self.inn, kkt_number, shift_date, totals)
+        except Exception as e:
+            logger.warning(f"Could not cache OFD shift totals for {shift_date}: {e}")
+
+    async def _fetch_shift_totals(
+        self,
+        shift_date: date,
+        kkt_number: Optional[str] = None
+    ) -> Optional[Dict]:
+        """Запросить итоги смены из СБИС ОФД (без кэша)"""
         params = {
             "inn": self.inn,
             "date": shift_date.isoformat()
@@ -148,11 +405,14 @@ class SbisOFD:
     async def get_receipts_by_payment_type(
         self,
         shift_date: date,
-        kkt_number: Optional[str] = None
+        kkt_number: Optional[str] = None,
+        page_size: int = RECEIPTS_PAGE_SIZE
     ) -> Optional[Dict]:
         """
         Получить разбивку чеков по типам оплаты
 
+        Суммы считаются по мере поступления страниц чеков.
+
         Returns:
             {
                 "cash": 15000.00,
@@ -161,39 +421,41 @@ class SbisOFD:
                 "credit": 0.00
             }
         """
-        receipts = await self.get_shift_receipts(shift_date, kkt_number)
+        # Копейки в int: точно для денежных сумм и без Decimal на каждый платеж
+        kopecks = [0, 0, 0, 0]
+        receipts_count = 0
 
-        if not receipts:
+        try:
+            async for page in self.iter_receipt_pages(shift_date, kkt_number, page_size):
+                receipts_count += len(page)
+
+                for receipt in page:
+                    # Тип операции: приход/расход
+                    if receipt.get("operation_type") != "income":
+                        continue
+
+                    # Разбивка по типам оплаты
+                    for payment in receipt.get("payments", ()):
+                        payment_type = payment.get("type")
+                        # 0 - наличные, 1 - безналичные, 2 - предоплата, 3 - кредит
+                        if payment_type in (0, 1, 2, 3):
+                            kopecks[payment_type] += round(float(payment.get("amount", 0)) * 100)
+
+        except OFDRequestError as e:
+            logger.error(f"Error loading receipts for {shift_date}: {e}")
             return None
 
-        totals = {
-            "cash": Decimal("0"),
-            "cashless": Decimal("0"),
-            "prepaid": Decimal("0"),
-            "credit": Decimal("0")
-        }
-
-        for receipt in receipts:
-            # Тип операции: приход/расход
-            if receipt.get("operation_type") != "income":
-                continue
-
-            # Разбивка по типам оплаты
-            payments = receipt.get("payments", [])
-            for payment in payments:
-                payment_type = payment.get("type")
-                amount = Decimal(str(payment.get("amount", 0)))
+        if not receipts_count:
+            return None
 
-                if payment_type == 0:  # Наличные
-                    totals["cash"] += amount
-                elif payment_type == 1:  # Безналичные
-                    totals["cashless"] += amount
-                elif payment_type == 2:  # Предоплата
-                    totals["prepaid"] += amount
-                elif payment_type == 3:  # Кредит
-                    totals["credit"] += amount
+        cash, cashless, prepaid, credit = (Decimal(value) / 100 for value in kopecks)
 
-        return totals
+        return {
+            "cash": cash,
+            "cashless": cashless,
+            "prepaid": prepaid,
+            "credit": credit
+        }
 
     async def check_shift_closed(
         self,
@@ -258,6 +520,27 @@ class ShiftValidator:
         # Получить данные с кассы
         kkt_data = await self.sbis.get_shift_totals(shift_date, kkt_number)
 
+        return self.evaluate(kkt_data, fact_cash, fact_cashless, fact_qr)
+
+    def evaluate(
+        self,
+        kkt_data: Optional[Dict],
+        fact_cash: Decimal,
+        fact_cashless: Decimal,
+        fact_qr: Decimal = Decimal("0")
+    ) -> Dict:
+        """
+        Сравнить факт с уже полученными итогами смены ККТ
+
+        Args:
+            kkt_data: Итоги смены из SbisOFD.get_shift_totals (None - не получены)
+            fact_cash: Фактические наличные
+            fact_cashless: Фактический безнал
+            fact_qr: Фактические QR платежи
+
+        Returns:
+            Результат проверки (см. validate_shift)
+        """
         if not kkt_data:
             return {
                 "status": "error",
@@ -353,9 +636,22 @@ class ShiftValidator:
             shift_date, fact_cash, fact_cashless, fact_qr, kkt_number
         )
 
+        return self.format_report(shift_date, result)
+
+    def format_report(self, shift_date: date, result: Dict) -> str:
+        """
+        Текстовый отчет по результату проверки смены
+
+        Returns:
+            Форматированный текст для отправки в Telegram
+        """
         if result["status"] == "error":
             return f"❌ {result['message']}"
 
+        if "discrepancies" not in result:
+            # Смена на кассе не закрыта - сравнивать не с чем
+            return result["message"]
+
         disc = result["discrepancies"]
 
         report = f"""
@@ -394,6 +690,41 @@ class ShiftValidator:
 
 # ============= INTEGRATION WITH BOT =============
 
+# Общие клиенты по (токен, ИНН): пул соединений живет между вызовами
+_clients: Dict[Tuple[str, str], SbisOFD] = {}
+
+
+def get_ofd_client(api_token: Optional[str] = None, inn: Optional[str] = None) -> Optional[SbisOFD]:
+    """
+    Общий клиент СБИС ОФД
+
+    Args:
+        api_token: Токен СБИС ОФД (из переменных окружения если не указан)
+        inn: ИНН организации (из переменных окружения если не указан)
+
+    Returns:
+        Клиент или None, если СБИС ОФД не настроен
+    """
+    api_token = api_token or os.getenv("SBIS_OFD_TOKEN")
+    inn = inn or os.getenv("COMPANY_INN")
+
+    if not api_token or not inn:
+        return None
+
+    client = _clients.get((api_token, inn))
+    if client is None:
+        client = _clients[(api_token, inn)] = SbisOFD(api_token, inn)
+
+    return client
+
+
+async def close_ofd_clients():
+    """Закрыть соединения всех общих клиентов (при остановке приложения)"""
+    for client in _clients.values():
+        await client.close()
+    _clients.clear()
+
+
 async def validate_shift_with_ofd(
     shift_date: date,
     fact_cash: float,
@@ -420,24 +751,15 @@ async def validate_shift_with_ofd(
     Returns:
         Результат валидации
     """
-    import os
-
-    # Получить настройки из переменных окружения
-    if not api_token:
-        api_token = os.getenv("SBIS_OFD_TOKEN")
-
-    if not inn:
-        inn = os.getenv("COMPANY_INN")
+    sbis = get_ofd_client(api_token, inn)
 
-    if not api_token or not inn:
+    if not sbis:
         logger.error("SBIS OFD credentials not configured")
         return {
             "status": "error",
             "message": "СБИС ОФД не настроен. Добавьте SBIS_OFD_TOKEN и COMPANY_INN в .env"
         }
 
-    # Создать клиентов
-    sbis = SbisOFD(api_token, inn)
     validator = ShiftValidator(sbis)
 
     # Проверить смену
@@ -452,6 +774,58 @@ async def validate_shift_with_ofd(
     return result
 
 
+async def validate_shifts_with_ofd(
+    shifts: List[Dict],
+    max_concurrency: int = 7,
+    api_token: Optional[str] = None,
+    inn: Optional[str] = None
+) -> List[Dict]:
+    """
+    Проверить несколько смен параллельно
+
+    Запросы к ОФД идут одновременно (не больше max_concurrency)
+    через общий пул соединений.
+
+    Args:
+        shifts: Смены - словари с ключами shift_date, fact_cash,
+            fact_cashless, fact_qr и (опционально) kkt_number
+        max_concurrency: Максимум одновременных запросов к ОФД
+
+    Returns:
+        Результаты валидации в порядке смен
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def validate(shift: Dict) -> Dict:
+        async with semaphore:
+            return await validate_shift_with_ofd(api_token=api_token, inn=inn, **shift)
+
+    return await asyncio.gather(*(validate(shift) for shift in shifts))
+
+
+async def get_shift_validation(
+    shift_date: date,
+    fact_cash: float,
+    fact_cashless: float,
+    fact_qr: float = 0.0,
+    api_token: Optional[str] = None,
+    inn: Optional[str] = None,
+    kkt_number: Optional[str] = None
+) -> Tuple[Dict, str]:
+    """
+    Результат проверки смены и текстовый отчет по одному запросу к ОФД
+
+    Returns:
+        (результат валидации, форматированный текст для Telegram)
+    """
+    validation = await validate_shift_with_ofd(
+        shift_date, fact_cash, fact_cashless, fact_qr, api_token, inn, kkt_number
+    )
+
+    validator = ShiftValidator(get_ofd_client(api_token, inn))
+    return validation, validator.format_report(shift_date, validation)
+
+
 async def get_shift_validation_report(
     shift_date: date,
     fact_cash: float,
@@ -467,18 +841,11 @@ async def get_shift_validation_report(
     Returns:
         Форматированный текст для Telegram
     """
-    import os
-
-    if not api_token:
-        api_token = os.getenv("SBIS_OFD_TOKEN")
+    sbis = get_ofd_client(api_token, inn)
 
-    if not inn:
-        inn = os.getenv("COMPANY_INN")
-
-    if not api_token or not inn:
+    if not sbis:
         return "❌ СБИС ОФД не настроен"
 
-    sbis = SbisOFD(api_token, inn)
     validator = ShiftValidator(sbis)
 
     report = await validator.get_validation_report(
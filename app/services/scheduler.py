@@ -7,9 +7,11 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..config import settings
 from ..database.db import async_session
-from .shift_importer import ShiftImporter
+from .bot_claude_watcher import bot_claude_watcher
 from .reminder_service import ReminderService
+from .cash_control import scan_cash_limit
 
 logger = logging.getLogger(__name__)
 
@@ -20,18 +22,11 @@ scheduler = AsyncIOScheduler()
 async def import_shifts_daily():
     """Импорт смен каждую ночь в 02:00"""
     try:
-        async with async_session() as session:
-            importer = ShiftImporter(session)
-
-            # Импортировать вчерашний день
-            yesterday = date.today() - timedelta(days=1)
-            stats = await importer.import_shifts(yesterday, yesterday)
-
-            logger.info(f"Daily shift import completed: {stats}")
-
-            # Также импортировать отчеты о сменах
-            reports_count = await importer.import_shift_reports(yesterday, yesterday)
-            logger.info(f"Imported {reports_count} shift reports")
+        # Все строки Bot_Claude после водяного знака: пропущенные ночи
+        # и исправления задним числом тоже попадают в импорт. Запуск
+        # через наблюдатель - не параллельно с импортом по изменениям
+        stats = await bot_claude_watcher.run_import()
+        logger.info(f"Daily shift import completed: {stats}")
 
     except Exception as e:
         logger.error(f"Error in daily shift import: {e}", exc_info=True)
@@ -59,6 +54,50 @@ async def check_tax_deadlines_weekly():
         logger.error(f"Error checking tax deadlines: {e}", exc_info=True)
 
 
+async def check_cash_limit_daily():
+    """Проверка лимита остатка кассы каждое утро в 09:05"""
+    from aiogram import Bot
+
+    try:
+        today = date.today()
+        async with async_session() as session:
+            scan = await scan_cash_limit(
+                session,
+                today - timedelta(days=settings.CASH_LIMIT_WINDOW_DAYS),
+                today
+            )
+
+        # Сообщаем только о свежих превышениях (вчера или сегодня)
+        recent = [v for v in scan['violations'] if v['date'] >= (today - timedelta(days=1)).isoformat()]
+        if not recent:
+            logger.info(f"Cash limit check: {scan['violation_days']} violations, none recent")
+            return
+
+        latest = recent[-1]
+        streak = scan['longest_streak']
+        peak = scan['peak']
+
+        text = (
+            f"💰 *Превышен лимит остатка кассы*\n\n"
+            f"📅 {latest['date']}: {latest['balance']:,.2f} ₽ "
+            f"(лимит {scan['limit']:,.2f} ₽, превышение {latest['excess']:,.2f} ₽)\n\n"
+            f"За {settings.CASH_LIMIT_WINDOW_DAYS} дней: дней с превышением - {scan['violation_days']}\n"
+            f"Самая длинная серия: {streak['days']} дн. ({streak['start']} - {streak['end']})\n"
+            f"Пик: {peak['excess']:,.2f} ₽ ({peak['date']})"
+        )
+
+        bot = Bot(token=settings.BOT_TOKEN)
+        try:
+            await bot.send_message(chat_id=settings.ADMIN_CHAT_ID, text=text, parse_mode="Markdown")
+        finally:
+            await bot.session.close()
+
+        logger.info(f"Cash limit alert sent: {latest['date']}")
+
+    except Exception as e:
+        logger.error(f"Error checking cash limit: {e}", exc_info=True)
+
+
 def setup_scheduler():
     """Настройка планировщика задач"""
 
@@ -80,6 +119,15 @@ def setup_scheduler():
         replace_existing=True
     )
 
+    # Проверка лимита остатка кассы каждое утро в 09:05
+    scheduler.add_job(
+        check_cash_limit_daily,
+        CronTrigger(hour=9, minute=5),
+        id='check_cash_limit_daily',
+        name='Check cash limit',
+        replace_existing=True
+    )
+
     # Проверка налоговых сроков каждый понедельник в 10:00
     scheduler.add_job(
         check_tax_deadlines_weekly,
@@ -1,24 +1,45 @@
 """
 Импорт смен из Bot_Claude
 """
+import asyncio
 import logging
 from datetime import date, datetime
-from typing import List, Dict
+from decimal import Decimal
+from typing import List, Dict, AsyncIterator, Iterator, Optional, Set, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects.postgresql import insert
 
+from ..database import crud, artifacts, cash_ledger
 from ..database.models import Employee, Shift, ShiftReport, Transaction, Category
 from .bot_claude_sync import BotClaudeSync
 
 logger = logging.getLogger(__name__)
 
+# Строк в одном INSERT / значений в одном IN (...)
+BATCH_SIZE = 500
+
+# Строк Bot_Claude в одной пачке синхронизации (одна пачка - один коммит)
+SYNC_BATCH_SIZE = 1000
+
+
+def _batches(rows: List, size: int = BATCH_SIZE) -> Iterator[List]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
 
 class ShiftImporter:
-    """Импорт смен из Bot_Claude в БД бухгалтерии"""
+    """
+    Импорт смен из Bot_Claude в БД бухгалтерии
 
-    def __init__(self, session: AsyncSession):
+    Импорт пакетный: уже загруженные смены и отчеты, сотрудники и
+    категория дохода выбираются заранее по одному запросу, новые
+    записи вставляются пачками INSERT ... ON CONFLICT DO NOTHING.
+    """
+
+    def __init__(self, session: AsyncSession, sync: Optional[BotClaudeSync] = None):
         self.session = session
-        self.sync = BotClaudeSync()
+        self.sync = sync or BotClaudeSync()
 
     async def import_shifts(self, start_date: date, end_date: date) -> Dict[str, int]:
         """
@@ -27,65 +48,100 @@ class ShiftImporter:
         Returns:
             Dict с количеством импортированных/обновленных записей
         """
-        stats = {
-            'shifts_imported': 0,
-            'shifts_skipped': 0,
-            'employees_created': 0,
-            'transactions_created': 0
-        }
-
         if not self.sync.is_available():
             logger.warning("Bot_Claude database not available, skipping import")
-            return stats
+            return self._empty_stats()
 
         # Получить смены из Bot_Claude
         shifts_data = self.sync.fetch_shifts(start_date, end_date)
+        return await self.save_shifts(shifts_data)
+
+    async def save_shifts(self, shifts_data: List[Dict], update_existing: bool = False) -> Dict[str, int]:
+        """
+        Сохранить смены Bot_Claude (формат BotClaudeSync.fetch_shifts)
+
+        Args:
+            update_existing: Обновить уже импортированные смены данными
+                источника (исправления задним числом) вместе с их
+                транзакциями дохода
 
+        Returns:
+            Dict с количеством импортированных/пропущенных записей
+        """
+        stats = self._empty_stats()
+
+        # Уже импортированные смены: bot_shift_id -> id
+        bot_ids = list({s['bot_shift_id'] for s in shifts_data if s.get('bot_shift_id') is not None})
+        existing = {}
+        for batch in _batches(bot_ids):
+            result = await self.session.execute(
+                select(Shift.bot_shift_id, Shift.id).where(Shift.bot_shift_id.in_(batch))
+            )
+            existing.update(result.all())
+
+        new_shifts = []
+        changed_shifts = []
+        seen = set()
         for shift_data in shifts_data:
-            # Проверить, не импортирована ли уже эта смена
             bot_shift_id = shift_data.get('bot_shift_id')
-            existing = await self.session.execute(
-                select(Shift).where(Shift.bot_shift_id == bot_shift_id)
-            )
-            if existing.scalar_one_or_none():
+            if bot_shift_id is not None and bot_shift_id in seen:
                 stats['shifts_skipped'] += 1
                 continue
+            seen.add(bot_shift_id)
+
+            if bot_shift_id is not None and bot_shift_id in existing:
+                if update_existing:
+                    changed_shifts.append(shift_data)
+                else:
+                    stats['shifts_skipped'] += 1
+                continue
+            new_shifts.append(shift_data)
+
+        if not new_shifts and not changed_shifts:
+            logger.info(f"Import completed: {stats}")
+            return stats
 
-            # Найти или создать сотрудника
-            employee = await self._get_or_create_employee(shift_data['employee_name'])
-            if employee and not await self.session.get(Employee, employee.id):
-                stats['employees_created'] += 1
-
-            # Создать запись о смене
-            shift = Shift(
-                employee_id=employee.id if employee else None,
-                shift_date=shift_data['shift_date'],
-                hours_worked=shift_data.get('hours_worked'),
-                revenue=shift_data.get('revenue'),
-                expenses=shift_data.get('expenses'),
-                notes=shift_data.get('notes'),
-                imported_from_bot=True,
-                bot_shift_id=bot_shift_id
+        # Сотрудники по имени (недостающие создаются)
+        employees = await self._get_or_create_employees(
+            {s['employee_name'] for s in new_shifts + changed_shifts if s.get('employee_name')},
+            stats
+        )
+
+        updated = []
+
+        if changed_shifts:
+            changed_rows = [
+                {'id': existing[shift_data['bot_shift_id']], **self._shift_values(shift_data, employees)}
+                for shift_data in changed_shifts
+            ]
+            await self.session.execute(update(Shift), changed_rows)
+            stats['shifts_updated'] = len(changed_rows)
+            updated = [(row['id'], row['shift_date'], row['revenue']) for row in changed_rows]
+
+        rows = [
+            {
+                **self._shift_values(shift_data, employees),
+                'imported_from_bot': True,
+                'bot_shift_id': shift_data.get('bot_shift_id')
+            }
+            for shift_data in new_shifts
+        ]
+
+        # Смены, вставленные параллельным импортом, пропускаются конфликтом
+        inserted = []
+        for batch in _batches(rows):
+            result = await self.session.execute(
+                insert(Shift)
+                .values(batch)
+                .on_conflict_do_nothing()
+                .returning(Shift.id, Shift.shift_date, Shift.revenue)
             )
-            self.session.add(shift)
-            stats['shifts_imported'] += 1
-
-            # Создать транзакцию дохода, если есть выручка
-            if shift_data.get('revenue') and shift_data['revenue'] > 0:
-                income_category = await self._get_income_category()
-                if income_category:
-                    transaction = Transaction(
-                        date=shift_data['shift_date'],
-                        type='income',
-                        amount=shift_data['revenue'],
-                        category_id=income_category.id,
-                        description=f"Доход за смену {shift_data['shift_date']}",
-                        source='bot_claude_import',
-                        is_confirmed=True,
-                        is_kudir_included=True
-                    )
-                    self.session.add(transaction)
-                    stats['transactions_created'] += 1
+            inserted.extend(result.all())
+
+        stats['shifts_imported'] = len(inserted)
+        stats['shifts_skipped'] += len(rows) - len(inserted)
+
+        await self._save_income(inserted, updated, stats)
 
         await self.session.commit()
         logger.info(f"Import completed: {stats}")
@@ -102,59 +158,380 @@ class ShiftImporter:
             return 0
 
         reports_data = self.sync.get_shift_reports(start_date, end_date)
-        imported = 0
+        return await self.save_shift_reports(reports_data)
 
-        for report_data in reports_data:
-            # Проверить, есть ли уже такой отчет
-            existing = await self.session.execute(
-                select(ShiftReport).where(
-                    ShiftReport.date == report_data['date'],
-                    ShiftReport.shift == report_data['shift']
-                )
+    async def save_shift_reports(self, reports_data: List[Dict], update_existing: bool = False) -> int:
+        """
+        Сохранить отчеты о сменах Bot_Claude (формат BotClaudeSync.get_shift_reports)
+
+        Args:
+            update_existing: Обновить уже загруженные отчеты данными источника
+
+        Returns:
+            Количество импортированных отчетов
+        """
+        if not reports_data:
+            return 0
+
+        # Уже загруженные отчеты за период: (дата, смена) -> id
+        result = await self.session.execute(
+            select(ShiftReport.date, ShiftReport.shift, ShiftReport.id).where(
+                ShiftReport.date >= min(r['date'] for r in reports_data),
+                ShiftReport.date <= max(r['date'] for r in reports_data)
             )
-            if existing.scalar_one_or_none():
+        )
+        existing = {(row.date, row.shift): row.id for row in result.all()}
+
+        rows = []
+        changed = []
+        seen = set()
+        for report_data in reports_data:
+            key = (report_data['date'], report_data['shift'])
+            if key in seen:
                 continue
+            seen.add(key)
+
+            values = {
+                'cash_fact': report_data.get('cash_fact'),
+                'cash_plan': report_data.get('cash_plan'),
+                'cashless_fact': report_data.get('cashless_fact'),
+                'qr_payments': report_data.get('qr_payments'),
+                'safe': report_data.get('safe'),
+                'expenses': report_data.get('expenses'),
+                'workers': report_data.get('workers', []),
+                'equipment_issues': report_data.get('equipment_issues', [])
+            }
 
-            # Создать отчет
-            report = ShiftReport(
-                date=report_data['date'],
-                shift=report_data['shift'],
-                cash_fact=report_data.get('cash_fact'),
-                cash_plan=report_data.get('cash_plan'),
-                cashless_fact=report_data.get('cashless_fact'),
-                qr_payments=report_data.get('qr_payments'),
-                safe=report_data.get('safe'),
-                expenses=report_data.get('expenses'),
-                workers=report_data.get('workers', []),
-                equipment_issues=report_data.get('equipment_issues', []),
-                processed=True
+            if key in existing:
+                if update_existing:
+                    changed.append({'id': existing[key], **values})
+                continue
+
+            rows.append({
+                'date': report_data['date'],
+                'shift': report_data['shift'],
+                **values,
+                'processed': True
+            })
+
+        if changed:
+            await self.session.execute(update(ShiftReport), changed)
+            logger.info(f"Updated {len(changed)} shift reports")
+
+        imported = 0
+        for batch in _batches(rows):
+            result = await self.session.execute(
+                insert(ShiftReport)
+                .values(batch)
+                .on_conflict_do_nothing()
+                .returning(ShiftReport.id)
             )
-            self.session.add(report)
-            imported += 1
+            imported += len(result.all())
 
         await self.session.commit()
         logger.info(f"Imported {imported} shift reports")
         return imported
 
-    async def _get_or_create_employee(self, name: str) -> Employee:
-        """Найти или создать сотрудника по имени"""
-        # Поиск существующего
+    async def sync_shifts(self, batch_size: int = SYNC_BATCH_SIZE) -> Dict[str, int]:
+        """
+        Загрузить смены Bot_Claude после водяного знака
+
+        Возвращает то же, что import_shifts, за все загруженные пачки.
+        """
+        stats = self._empty_stats()
+
+        async for rows in self._sync_batches('shifts', batch_size):
+            batch_stats = await self.save_shifts(rows, update_existing=True)
+            for key, value in batch_stats.items():
+                stats[key] += value
+
+        logger.info(f"Shift sync completed: {stats}")
+        return stats
+
+    async def sync_shift_reports(self, batch_size: int = SYNC_BATCH_SIZE) -> int:
+        """
+        Загрузить отчеты о сменах Bot_Claude после водяного знака
+
+        Returns:
+            Количество новых отчетов
+        """
+        imported = 0
+
+        async for rows in self._sync_batches('shift_reports', batch_size):
+            imported += await self.save_shift_reports(rows, update_existing=True)
+
+        return imported
+
+    async def _sync_batches(self, table: str, batch_size: int) -> AsyncIterator[List[Dict]]:
+        """
+        Пачки строк таблицы Bot_Claude после водяного знака
+
+        Чтение SQLite идет в отдельном потоке. Новый знак записывается
+        в сессию до выдачи пачки и коммитится вместе с ней (save_shifts /
+        save_shift_reports), поэтому после сбоя загрузка продолжается
+        с первой незафиксированной пачки.
+        """
+        if not self.sync.is_available():
+            logger.warning("Bot_Claude database not available, skipping sync")
+            return
+
+        source = f"bot_claude.{table}"
+        cursor = await crud.get_sync_cursor(self.session, source)
+
+        while True:
+            rows, next_cursor = await asyncio.to_thread(self.sync.fetch_since, table, cursor, batch_size)
+            if not rows:
+                break
+
+            await crud.save_sync_cursor(self.session, source, next_cursor, len(rows))
+            yield rows
+            await self.session.commit()
+
+            logger.info(f"Synced {len(rows)} rows from {source} up to rowid {next_cursor['rowid']}")
+            cursor = next_cursor
+
+            if len(rows) < batch_size:
+                break
+
+    async def _save_income(
+        self,
+        inserted: List[Tuple[int, date, Optional[float]]],
+        updated: List[Tuple[int, date, Optional[float]]],
+        stats: Dict[str, int]
+    ):
+        """
+        Транзакции дохода за смены: по одной на смену с выручкой
+
+        Выручка смены создает транзакцию, измененная выручка или дата
+        меняет ее, нулевая - удаляет. Разница по наличным проводится через
+        кассовую книгу. Коммит остается за вызывающим кодом.
+
+        Обновленная смена без связанной транзакции сначала забирает
+        непривязанный доход прежнего импорта за ту же дату, чтобы доход
+        не задвоился.
+
+        Args:
+            inserted: (id, дата, выручка) новых смен
+            updated: (id, дата, выручка) обновленных смен
+        """
+        # Текущие транзакции дохода обновленных смен
+        current = {}
+        for batch in _batches([shift_id for shift_id, _, _ in updated]):
+            result = await self.session.execute(
+                select(
+                    Transaction.id,
+                    Transaction.shift_id,
+                    Transaction.date,
+                    Transaction.type,
+                    Transaction.amount,
+                    Transaction.payment_method,
+                    Transaction.is_confirmed
+                ).where(Transaction.shift_id.in_(batch))
+            )
+            current.update({row.shift_id: row for row in result.all()})
+
+        shifts = [
+            (shift_id, shift_date, Decimal(str(revenue or 0)).quantize(Decimal('0.01')))
+            for shift_id, shift_date, revenue in [*inserted, *updated]
+        ]
+
+        updated_ids = {shift_id for shift_id, _, _ in updated}
+        unlinked = [
+            (shift_id, shift_date, revenue) for shift_id, shift_date, revenue in shifts
+            if shift_id in updated_ids and shift_id not in current and revenue > 0
+        ]
+        if unlinked:
+            current.update(await self._adopt_legacy_income(unlinked))
+
+        created = []
+        changed = []
+        removed = []
+        for shift_id, shift_date, revenue in shifts:
+            transaction = current.get(shift_id)
+            has_revenue = revenue > 0
+
+            if transaction is None:
+                if has_revenue:
+                    created.append((shift_id, shift_date, revenue))
+            elif not has_revenue:
+                removed.append(transaction)
+            elif transaction.amount != revenue or transaction.date != shift_date:
+                changed.append((transaction, shift_date, revenue))
+
+        income_category = await self._get_income_category() if created else None
+        if income_category:
+            transactions = [
+                {
+                    'date': shift_date,
+                    'type': 'income',
+                    'amount': revenue,
+                    'category_id': income_category.id,
+                    'description': f"Доход за смену {shift_date}",
+                    'source': 'bot_claude_import',
+                    'is_confirmed': True,
+                    'is_kudir_included': True,
+                    'shift_id': shift_id
+                }
+                for shift_id, shift_date, revenue in created
+            ]
+            for batch in _batches(transactions):
+                await self.session.execute(insert(Transaction).values(batch))
+            stats['transactions_created'] += len(transactions)
+
+        if changed:
+            await self.session.execute(
+                update(Transaction),
+                [
+                    {
+                        'id': transaction.id,
+                        'date': shift_date,
+                        'amount': revenue,
+                        'description': f"Доход за смену {shift_date}"
+                    }
+                    for transaction, shift_date, revenue in changed
+                ]
+            )
+            stats['transactions_updated'] += len(changed)
+
+        if removed:
+            await self.session.execute(
+                delete(Transaction).where(Transaction.id.in_([transaction.id for transaction in removed]))
+            )
+            stats['transactions_deleted'] += len(removed)
+
+        # Прежние суммы снимаются, новые проводятся
+        affected_dates = set()
+        for transaction in removed:
+            await cash_ledger.apply_transaction(self.session, transaction, sign=-1)
+            affected_dates.add(transaction.date)
+
+        for transaction, shift_date, revenue in changed:
+            await cash_ledger.apply_transaction(self.session, transaction, sign=-1)
+            await cash_ledger.apply_transaction(self.session, Transaction(
+                date=shift_date,
+                type=transaction.type,
+                amount=revenue,
+                payment_method=transaction.payment_method,
+                is_confirmed=transaction.is_confirmed
+            ))
+            affected_dates.update((transaction.date, shift_date))
+
+        # Сгенерированные отчеты за измененные периоды устарели
+        for affected_date in sorted(affected_dates):
+            await artifacts.invalidate_artifacts(self.session, affected_date)
+
+    async def _adopt_legacy_income(self, shifts: List[Tuple[int, date, Decimal]]) -> Dict:
+        """
+        Привязать к сменам доход, импортированный до связи транзакций со сменами
+
+        Непривязанные транзакции bot_claude_import за дату смены
+        распределяются по одной на смену: сначала с той же суммой, затем
+        оставшиеся по порядку id (их сумму исправит обновление смены).
+
+        Returns:
+            {id смены: транзакция}
+        """
+        candidates = {}
+        for batch in _batches(sorted({shift_date for _, shift_date, _ in shifts})):
+            result = await self.session.execute(
+                select(
+                    Transaction.id,
+                    Transaction.shift_id,
+                    Transaction.date,
+                    Transaction.type,
+                    Transaction.amount,
+                    Transaction.payment_method,
+                    Transaction.is_confirmed
+                )
+                .where(
+                    Transaction.source == 'bot_claude_import',
+                    Transaction.shift_id.is_(None),
+                    Transaction.date.in_(batch)
+                )
+                .order_by(Transaction.id)
+            )
+            for row in result.all():
+                candidates.setdefault(row.date, []).append(row)
+
+        adopted = {}
+        pending = []
+        for shift_id, shift_date, revenue in shifts:
+            same_day = candidates.get(shift_date, [])
+            match = next((row for row in same_day if row.amount == revenue), None)
+            if match:
+                same_day.remove(match)
+                adopted[shift_id] = match
+            else:
+                pending.append((shift_id, shift_date))
+
+        for shift_id, shift_date in pending:
+            same_day = candidates.get(shift_date)
+            if same_day:
+                adopted[shift_id] = same_day.pop(0)
+
+        if adopted:
+            await self.session.execute(
+                update(Transaction),
+                [{'id': row.id, 'shift_id': shift_id} for shift_id, row in adopted.items()]
+            )
+            logger.info(f"Linked {len(adopted)} previously imported income transactions to shifts")
+
+        return adopted
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, int]:
+        return {
+            'shifts_imported': 0,
+            'shifts_updated': 0,
+            'shifts_skipped': 0,
+            'employees_created': 0,
+            'transactions_created': 0,
+            'transactions_updated': 0,
+            'transactions_deleted': 0
+        }
+
+    @staticmethod
+    def _shift_values(shift_data: Dict, employees: Dict[str, int]) -> Dict:
+        return {
+            'employee_id': employees.get(shift_data.get('employee_name')),
+            'shift_date': shift_data['shift_date'],
+            'hours_worked': shift_data.get('hours_worked'),
+            'revenue': shift_data.get('revenue'),
+            'expenses': shift_data.get('expenses'),
+            'notes': shift_data.get('notes')
+        }
+
+    async def _get_or_create_employees(self, names: Set[str], stats: Dict[str, int]) -> Dict[str, int]:
+        """
+        Найти или создать сотрудников по имени
+
+        Returns:
+            {имя: id сотрудника}
+        """
+        if not names:
+            return {}
+
         result = await self.session.execute(
-            select(Employee).where(Employee.full_name == name)
+            select(Employee.id, Employee.full_name)
+            .where(Employee.full_name.in_(names))
+            .order_by(Employee.id)
         )
-        employee = result.scalar_one_or_none()
+        employees = {}
+        for employee_id, name in result.all():
+            employees.setdefault(name, employee_id)
 
-        if not employee:
-            # Создать нового
-            employee = Employee(
-                full_name=name,
-                employment_type='OFFER'  # По умолчанию оферта
+        missing = sorted(names - employees.keys())
+        if missing:
+            result = await self.session.execute(
+                insert(Employee)
+                .values([{'full_name': name, 'employment_type': 'OFFER'} for name in missing])  # По умолчанию оферта
+                .returning(Employee.id, Employee.full_name)
             )
-            self.session.add(employee)
-            await self.session.flush()
-            logger.info(f"Created new employee: {name}")
+            employees.update({name: employee_id for employee_id, name in result.all()})
+            stats['employees_created'] = len(missing)
+            logger.info(f"Created {len(missing)} new employees: {', '.join(missing)}")
 
-        return employee
+        return employees
 
     async def _get_income_category(self) -> Category:
         """Получить категорию доходов от услуг клуба"""
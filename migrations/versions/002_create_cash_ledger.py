@@ -0,0 +1,59 @@
+"""Create cash ledger
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '002'
+down_revision: Union[str, None] = '001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Daily cash flows with a running closing balance
+SEED_CASH_LEDGER = """
+INSERT INTO cash_ledger (date, opening_balance, inflow, outflow, closing_balance)
+SELECT date, closing_balance - inflow + outflow, inflow, outflow, closing_balance
+FROM (
+    SELECT date, inflow, outflow,
+           SUM(inflow - outflow) OVER (ORDER BY date) AS closing_balance
+    FROM (
+        SELECT date,
+               COALESCE(SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END), 0) AS inflow,
+               COALESCE(SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END), 0) AS outflow
+        FROM transactions
+        WHERE is_confirmed = true AND payment_method = 'cash'
+        GROUP BY date
+    ) AS flows
+) AS ledger
+"""
+
+
+def upgrade() -> None:
+    # Cash ledger
+    op.create_table(
+        'cash_ledger',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('opening_balance', sa.Numeric(precision=12, scale=2), server_default='0', nullable=False),
+        sa.Column('inflow', sa.Numeric(precision=12, scale=2), server_default='0', nullable=False),
+        sa.Column('outflow', sa.Numeric(precision=12, scale=2), server_default='0', nullable=False),
+        sa.Column('closing_balance', sa.Numeric(precision=12, scale=2), server_default='0', nullable=False),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('date')
+    )
+
+    # Seed from confirmed cash transactions
+    op.execute(SEED_CASH_LEDGER)
+
+
+def downgrade() -> None:
+    op.drop_table('cash_ledger')
@@ -0,0 +1,43 @@
+"""Create OFD shift totals cache
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '004'
+down_revision: Union[str, None] = '003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Closed KKT shift totals from SBIS OFD
+    op.create_table(
+        'ofd_shift_totals',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('inn', sa.String(length=12), nullable=False),
+        sa.Column('kkt_number', sa.String(length=50), server_default='', nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('cash', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('cashless', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('total', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('receipts_count', sa.Integer(), nullable=True),
+        sa.Column('shift_number', sa.Integer(), nullable=True),
+        sa.Column('opened_at', sa.String(length=32), nullable=True),
+        sa.Column('closed_at', sa.String(length=32), nullable=False),
+        sa.Column('fetched_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('inn', 'kkt_number', 'date', name='uq_ofd_shift_totals')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('ofd_shift_totals')
@@ -0,0 +1,41 @@
+"""Create OCR cache
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '005'
+down_revision: Union[str, None] = '004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Receipt OCR results by image hash
+    op.create_table(
+        'ocr_cache',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('file_unique_id', sa.String(length=100), nullable=True),
+        sa.Column('ocr_data', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('hits', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.Column('last_used_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('content_hash'),
+        sa.UniqueConstraint('file_unique_id')
+    )
+    op.create_index('idx_ocr_cache_last_used', 'ocr_cache', ['last_used_at'])
+
+
+def downgrade() -> None:
+    op.drop_table('ocr_cache')
@@ -0,0 +1,38 @@
+"""Create FNS receipt cache
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '006'
+down_revision: Union[str, None] = '005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Raw FNS API responses by fiscal document
+    op.create_table(
+        'fns_receipt_cache',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('fiscal_storage', sa.String(length=50), nullable=False),
+        sa.Column('fiscal_document', sa.String(length=50), nullable=False),
+        sa.Column('fiscal_sign', sa.String(length=50), nullable=False),
+        sa.Column('response', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('fetched_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('fiscal_storage', 'fiscal_document', 'fiscal_sign', name='uq_fns_receipt_cache')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('fns_receipt_cache')
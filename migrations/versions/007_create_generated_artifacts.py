@@ -0,0 +1,44 @@
+"""Create generated artifacts cache
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '007'
+down_revision: Union[str, None] = '006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Generated report files by (type, period, data version)
+    op.create_table(
+        'generated_artifacts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('report_type', sa.String(length=50), nullable=False),
+        sa.Column('period_start', sa.Date(), nullable=False),
+        sa.Column('period_end', sa.Date(), nullable=False),
+        sa.Column('data_version', sa.String(length=64), nullable=False),
+        sa.Column('file_path', sa.String(length=500), nullable=False),
+        sa.Column('file_size', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('telegram_file_id', sa.String(length=255), nullable=True),
+        sa.Column('hits', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.Column('last_used_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('report_type', 'period_start', 'period_end', 'data_version', name='uq_generated_artifact')
+    )
+    op.create_index('idx_generated_artifacts_period', 'generated_artifacts', ['period_start', 'period_end'])
+    op.create_index('idx_generated_artifacts_last_used', 'generated_artifacts', ['last_used_at'])
+
+
+def downgrade() -> None:
+    op.drop_table('generated_artifacts')
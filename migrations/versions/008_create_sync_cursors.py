@@ -0,0 +1,37 @@
+"""Create sync cursors
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '008'
+down_revision: Union[str, None] = '007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Incremental sync watermarks per source table
+    op.create_table(
+        'sync_cursors',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('source', sa.String(length=100), nullable=False),
+        sa.Column('last_rowid', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('last_updated_at', sa.String(length=32), nullable=True),
+        sa.Column('rows_synced', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('source')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('sync_cursors')
@@ -0,0 +1,61 @@
+"""Add shift link to income transactions
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '009'
+down_revision: Union[str, None] = '008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Equal (date, amount) pairs are matched in id order on both sides
+LINK_SHIFT_INCOME = """
+WITH income AS (
+    SELECT id, date, amount,
+           row_number() OVER (PARTITION BY date, amount ORDER BY id) AS n
+    FROM transactions
+    WHERE source = 'bot_claude_import' AND shift_id IS NULL
+),
+imported AS (
+    SELECT id, shift_date, revenue,
+           row_number() OVER (PARTITION BY shift_date, revenue ORDER BY id) AS n
+    FROM shifts
+    WHERE imported_from_bot = true AND revenue > 0
+)
+UPDATE transactions
+SET shift_id = imported.id
+FROM income
+JOIN imported
+  ON imported.shift_date = income.date
+ AND imported.revenue = income.amount
+ AND imported.n = income.n
+WHERE transactions.id = income.id
+"""
+
+
+def upgrade() -> None:
+    # Income transaction of an imported shift
+    op.add_column('transactions', sa.Column('shift_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        'fk_transactions_shift', 'transactions', 'shifts', ['shift_id'], ['id'], ondelete='SET NULL'
+    )
+
+    # Link existing imported income to shifts one-to-one by date and amount
+    op.execute(LINK_SHIFT_INCOME)
+
+    op.create_index('idx_transactions_shift', 'transactions', ['shift_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_transactions_shift', table_name='transactions')
+    op.drop_constraint('fk_transactions_shift', 'transactions', type_='foreignkey')
+    op.drop_column('transactions', 'shift_id')
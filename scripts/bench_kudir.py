@@ -0,0 +1,123 @@
+"""
+Бенчмарк генерации КУДиР
+========================
+
+Сравнивает обычную генерацию (все транзакции года в памяти, стиль
+каждой ячейки отдельно) с потоковой (курсор + write-only книга).
+Данные пишутся во временную SQLite-базу (нужен aiosqlite) или в базу
+из --db-url.
+
+Запуск:
+    python scripts/bench_kudir.py --rows 10000 100000 1000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import delete, insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database.models import Base, Category, Transaction  # noqa: E402
+from app.services import kudir_generator  # noqa: E402
+
+YEAR = 2024
+INSERT_CHUNK = 10000
+
+
+async def fill(engine, count: int):
+    """Подтвержденные операции года: доходы и расходы по двум категориям"""
+    rnd = random.Random(42)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[Category.__table__, Transaction.__table__])
+        await conn.execute(delete(Transaction))
+        await conn.execute(delete(Category))
+        await conn.execute(insert(Category), [
+            {"id": 1, "name": "Аренда", "type": "expense", "tax_deductible": True},
+            {"id": 2, "name": "Штрафы", "type": "expense", "tax_deductible": False},
+        ])
+
+        created = datetime(YEAR, 1, 1)
+        for offset in range(0, count, INSERT_CHUNK):
+            rows = []
+            for i in range(offset, min(offset + INSERT_CHUNK, count)):
+                kind = rnd.random()
+                rows.append({
+                    "date": date(YEAR, 1, 1) + timedelta(days=rnd.randrange(365)),
+                    "type": "income" if kind < 0.6 else "expense",
+                    "amount": Decimal(rnd.randrange(100, 500000)) / 100,
+                    "category_id": None if kind < 0.6 else (1 if kind < 0.9 else 2),
+                    "counterparty": f"Контрагент {rnd.randrange(500)}",
+                    "description": "Оплата по договору",
+                    "document_number": str(i),
+                    "is_confirmed": True,
+                    "created_at": created + timedelta(seconds=i)
+                })
+            await conn.execute(insert(Transaction), rows)
+
+
+async def regular(session_maker, path: str):
+    async with session_maker() as session:
+        workbook = await kudir_generator.generate_kudir(session, YEAR)
+    workbook.save(path)
+
+
+async def streamed(session_maker, path: str):
+    async with session_maker() as session:
+        await kudir_generator.stream_kudir_file(session, YEAR, output_path=path)
+
+
+async def measure(label: str, coro_factory, trace: bool):
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await coro_factory()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] if trace else 0
+    if trace:
+        tracemalloc.stop()
+    memory = f"peak {peak / 1024 / 1024:>7.1f} MB" if trace else ""
+    print(f"  {label:<12} {elapsed:>8.2f} s   {memory}")
+
+
+async def main(sizes, db_url: str, regular_limit: int, trace: bool):
+    workdir = tempfile.mkdtemp(prefix="bench_kudir_")
+    db_url = db_url or f"sqlite+aiosqlite:///{workdir}/bench.db"
+    engine = create_async_engine(db_url)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+
+    try:
+        for count in sizes:
+            await fill(engine, count)
+            print(f"Строк: {count}")
+
+            if count <= regular_limit:
+                await measure("обычная", lambda: regular(session_maker, f"{workdir}/regular.xlsx"), trace)
+            else:
+                print(f"  {'обычная':<12} пропущена (больше --regular-limit)")
+
+            await measure("потоковая", lambda: streamed(session_maker, f"{workdir}/streamed.xlsx"), trace)
+            print()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--db-url", help="URL базы (по умолчанию временная SQLite)")
+    parser.add_argument("--regular-limit", type=int, default=100000,
+                        help="не запускать обычную генерацию на большем числе строк")
+    parser.add_argument("--no-trace", action="store_true", help="без tracemalloc (быстрее, без замера памяти)")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.rows, args.db_url, args.regular_limit, not args.no_trace))
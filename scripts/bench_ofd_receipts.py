@@ -0,0 +1,126 @@
+"""
+Бенчмарк выгрузки чеков СБИС ОФД
+================================
+
+Сравнивает разбивку по типам оплаты при загрузке всех чеков дня одним
+списком и при постраничной выгрузке с агрегацией по мере поступления.
+ОФД эмулируется локальным aiohttp-сервером.
+
+Запуск:
+    python scripts/bench_ofd_receipts.py --receipts 50000 --page-size 1000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date
+from decimal import Decimal
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.sbis_ofd import SbisOFD  # noqa: E402
+
+
+def make_receipts(count: int) -> list:
+    """Чеки дня: приход/возврат, 1-2 платежа разных типов"""
+    rnd = random.Random(42)
+    receipts = []
+    for i in range(count):
+        payments = [{"type": rnd.choice((0, 1, 1, 2)), "amount": round(rnd.uniform(50, 3000), 2)}]
+        if rnd.random() < 0.2:
+            payments.append({"type": 0, "amount": round(rnd.uniform(10, 500), 2)})
+        receipts.append({
+            "id": i,
+            "operation_type": "income" if rnd.random() < 0.97 else "refund",
+            "payments": payments
+        })
+    return receipts
+
+
+async def start_stub(receipts: list, latency: float):
+    """Заглушка endpoint receipts с limit/offset"""
+
+    async def handler(request):
+        await asyncio.sleep(latency)
+        offset = int(request.query.get("offset", 0))
+        limit = int(request.query.get("limit", len(receipts)))
+        return web.json_response({"receipts": receipts[offset:offset + limit]})
+
+    app = web.Application()
+    app.router.add_get("/receipts", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def totals_from_full_list(client: SbisOFD, shift_date: date, count: int) -> dict:
+    """Прежний способ: весь список чеков в памяти, Decimal на каждый платеж"""
+    receipts = []
+    async for page in client.iter_receipt_pages(shift_date, page_size=count):
+        receipts.extend(page)
+
+    totals = {"cash": Decimal("0"), "cashless": Decimal("0"), "prepaid": Decimal("0"), "credit": Decimal("0")}
+    names = {0: "cash", 1: "cashless", 2: "prepaid", 3: "credit"}
+    for receipt in receipts:
+        if receipt.get("operation_type") != "income":
+            continue
+        for payment in receipt.get("payments", []):
+            name = names.get(payment.get("type"))
+            if name:
+                totals[name] += Decimal(str(payment.get("amount", 0)))
+    return totals
+
+
+async def measure(label: str, coro_factory):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = await coro_factory()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<22} {elapsed * 1000:>9.0f} ms   peak {peak / 1024 / 1024:>7.1f} MB")
+    return result
+
+
+async def main(count: int, page_size: int, latency: float):
+    receipts = make_receipts(count)
+    runner, url = await start_stub(receipts, latency)
+    shift_date = date.today()
+
+    client = SbisOFD("token", "0000000000", base_url=url)
+    try:
+        print(f"Чеков: {count}, страница: {page_size}, задержка ответа: {latency * 1000:.0f} мс\n")
+
+        full = await measure(
+            "весь список",
+            lambda: totals_from_full_list(client, shift_date, count)
+        )
+
+        streamed = await measure(
+            "постранично",
+            lambda: client.get_receipts_by_payment_type(shift_date, page_size=page_size)
+        )
+
+        assert full == streamed, (full, streamed)
+        print("\nИтоги совпадают:", {k: str(v) for k, v in streamed.items()})
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--receipts", type=int, default=50000)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.01, help="задержка ответа заглушки, сек")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.receipts, args.page_size, args.latency))
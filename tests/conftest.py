@@ -0,0 +1,139 @@
+"""
+Общие фикстуры тестов
+
+Запросы проверяются на SQLite в памяти: PostgreSQL-типы (JSONB, ARRAY)
+компилируются и передаются как JSON, а асинхронный API сессии
+эмулируется поверх синхронной сессии SQLAlchemy.
+"""
+import pytest
+from sqlalchemy import create_engine, event, types
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from app.database.models import Base
+from app.services.bot_claude_reconcile import row_digest
+from app.services.bot_claude_sync import row_digest as python_row_digest
+
+
+@compiles(JSONB, 'sqlite')
+@compiles(types.ARRAY, 'sqlite')
+def _compile_json_on_sqlite(type_, compiler, **kw):
+    return 'JSON'
+
+
+# Значения ARRAY-колонок сериализуются в JSON, как и колонки JSONB
+sqlite.dialect.colspecs[types.ARRAY] = sqlite.JSON
+
+
+@compiles(row_digest, 'sqlite')
+def _compile_row_digest_on_sqlite(element, compiler, **kw):
+    # Функция регистрируется в db_engine, как в BotClaudeSync.fingerprints
+    return 'row_digest(%s)' % compiler.process(element.clauses, **kw)
+
+
+class _AsyncTransaction:
+    """async with для синхронной точки сохранения"""
+
+    def __init__(self, transaction):
+        self.transaction = transaction
+
+    async def __aenter__(self):
+        return self.transaction.__enter__()
+
+    async def __aexit__(self, *exc_info):
+        return self.transaction.__exit__(*exc_info)
+
+
+class _AsyncStreamResult:
+    """Результат session.stream(): асинхронная выдача пачек строк"""
+
+    def __init__(self, result):
+        self.result = result
+
+    async def partitions(self, size=None):
+        for partition in self.result.partitions(size):
+            yield partition
+
+
+class AsyncSessionAdapter:
+    """Асинхронная обертка над синхронной Session (только то, что нужно сервисам)"""
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, statement, params=None):
+        return self.sync_session.execute(statement, params)
+
+    async def stream(self, statement, params=None):
+        return _AsyncStreamResult(self.sync_session.execute(statement, params))
+
+    async def scalar(self, statement, params=None):
+        return self.sync_session.scalar(statement, params)
+
+    async def get(self, entity, ident):
+        return self.sync_session.get(entity, ident)
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def delete(self, instance):
+        self.sync_session.delete(instance)
+
+    def begin_nested(self):
+        return _AsyncTransaction(self.sync_session.begin_nested())
+
+    async def flush(self):
+        self.sync_session.flush()
+
+    async def commit(self):
+        self.sync_session.commit()
+
+    async def rollback(self):
+        self.sync_session.rollback()
+
+    async def refresh(self, instance):
+        self.sync_session.refresh(instance)
+
+
+@pytest.fixture
+def db_engine():
+    """SQLite в памяти со всеми таблицами"""
+    engine = create_engine('sqlite://')
+
+    @event.listens_for(engine, 'connect')
+    def register_functions(dbapi_connection, connection_record):
+        dbapi_connection.create_function('row_digest', -1, python_row_digest, deterministic=True)
+
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db_session(db_engine):
+    """Синхронная сессия для подготовки данных"""
+    with Session(db_engine, expire_on_commit=False) as session:
+        yield session
+
+
+@pytest.fixture
+def async_session(db_session):
+    """Та же сессия с асинхронным интерфейсом"""
+    return AsyncSessionAdapter(db_session)
+
+
+
+@pytest.fixture
+def session_factory(async_session):
+    """Фабрика сессий для кода, открывающего сессию сам (async with factory() as session)"""
+    return lambda: async_session
@@ -0,0 +1,123 @@
+"""
+Тесты агрегаций по транзакциям (SQL против расчета в Python)
+"""
+import asyncio
+import pytest
+from decimal import Decimal
+from datetime import date
+from sqlalchemy import select, and_
+from sqlalchemy.orm import selectinload
+from app.database.aggregations import get_period_totals, fold_period_totals
+from app.database.models import Transaction, Category
+from app.database import crud
+from app.services.calculator import calculate_usn_tax
+
+
+def python_period_totals(session, start_date, end_date):
+    """Прежний расчет: загрузка всех транзакций и суммирование в Python"""
+    transactions = session.execute(
+        select(Transaction)
+        .where(
+            and_(
+                Transaction.date >= start_date,
+                Transaction.date <= end_date,
+                Transaction.is_confirmed == True
+            )
+        )
+        .options(selectinload(Transaction.category))
+    ).scalars().all()
+
+    incomes = [t for t in transactions if t.type == 'income']
+    expenses = [t for t in transactions if t.type == 'expense']
+    deductible = [t for t in expenses if t.category and t.category.tax_deductible]
+
+    return {
+        'total_income': sum((t.amount for t in incomes), Decimal('0')),
+        'total_expense': sum((t.amount for t in expenses), Decimal('0')),
+        'deductible_expense': sum((t.amount for t in deductible), Decimal('0')),
+        'income_count': len(incomes),
+        'expense_count': len(expenses),
+        'deductible_count': len(deductible)
+    }
+
+
+@pytest.fixture
+def transactions(db_session):
+    """Набор транзакций: разные типы, категории, статусы и даты"""
+    rent = Category(name='Аренда помещений', type='expense', tax_deductible=True)
+    fines = Category(name='Штрафы и пени', type='expense', tax_deductible=False)
+    club = Category(name='Услуги компьютерного клуба', type='income', tax_deductible=True)
+    db_session.add_all([rent, fines, club])
+    db_session.flush()
+
+    rows = [
+        (date(2024, 1, 10), 'income', '15000.50', club.id, True),
+        (date(2024, 1, 11), 'income', '8000.00', None, True),
+        (date(2024, 2, 1), 'expense', '30000.00', rent.id, True),
+        (date(2024, 2, 2), 'expense', '1500.00', fines.id, True),
+        (date(2024, 2, 3), 'expense', '700.50', None, True),
+        (date(2024, 3, 5), 'expense', '999.00', rent.id, False),
+        (date(2024, 3, 31), 'income', '42000.00', club.id, True),
+        (date(2024, 4, 1), 'income', '100000.00', club.id, True),
+    ]
+    for date_, type_, amount, category_id, confirmed in rows:
+        db_session.add(Transaction(
+            date=date_,
+            type=type_,
+            amount=Decimal(amount),
+            category_id=category_id,
+            is_confirmed=confirmed
+        ))
+    db_session.commit()
+
+
+class TestPeriodTotals:
+    """Итоги периода одним запросом совпадают с расчетом в Python"""
+
+    @pytest.mark.parametrize('start_date, end_date', [
+        (date(2024, 1, 1), date(2024, 3, 31)),
+        (date(2024, 1, 1), date(2024, 12, 31)),
+        (date(2024, 2, 1), date(2024, 2, 29)),
+        (date(2023, 1, 1), date(2023, 12, 31)),
+    ])
+    def test_parity_with_python_path(self, db_session, async_session, transactions, start_date, end_date):
+        expected = python_period_totals(db_session, start_date, end_date)
+        actual = asyncio.run(get_period_totals(async_session, start_date, end_date))
+        assert actual == expected
+
+    def test_statistics_parity(self, db_session, async_session, transactions):
+        """get_period_statistics отдает те же значения, что и раньше"""
+        start_date, end_date = date(2024, 1, 1), date(2024, 3, 31)
+        expected = python_period_totals(db_session, start_date, end_date)
+
+        stats = asyncio.run(crud.get_period_statistics(async_session, start_date, end_date))
+
+        assert stats['total_income'] == float(expected['total_income'])
+        assert stats['total_expense'] == float(expected['total_expense'])
+        assert stats['deductible_expense'] == float(expected['deductible_expense'])
+        assert stats['income_count'] == expected['income_count']
+        assert stats['expense_count'] == expected['expense_count']
+        assert stats['balance'] == float(expected['total_income'] - expected['total_expense'])
+
+    def test_usn_tax_parity(self, db_session, async_session, transactions):
+        """calculate_usn_tax считает базу по учитываемым расходам"""
+        expected = python_period_totals(db_session, date(2024, 1, 1), date(2024, 3, 31))
+
+        tax_data = asyncio.run(calculate_usn_tax(async_session, 2024, 1))
+
+        assert tax_data['incomes'] == float(expected['total_income'])
+        assert tax_data['expenses'] == float(expected['deductible_expense'])
+        assert tax_data['income_count'] == expected['income_count']
+        assert tax_data['expense_count'] == expected['deductible_count']
+
+    def test_fold_ignores_non_deductible(self):
+        rows = [
+            ('expense', None, 2, Decimal('100')),
+            ('expense', False, 1, Decimal('50')),
+            ('expense', True, 3, Decimal('300')),
+        ]
+        totals = fold_period_totals(rows)
+        assert totals['total_expense'] == Decimal('450')
+        assert totals['deductible_expense'] == Decimal('300')
+        assert totals['expense_count'] == 6
+        assert totals['deductible_count'] == 3
@@ -0,0 +1,145 @@
+"""
+Тесты кэша сгенерированных отчетов
+"""
+import asyncio
+import os
+import pytest
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from app.config import settings
+from app.database import crud, artifacts
+from app.database.models import GeneratedArtifact
+from app.services import kudir_generator
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture(autouse=True)
+def artifacts_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'ARTIFACTS_PATH', str(tmp_path / 'generated'))
+    return tmp_path / 'generated'
+
+
+@pytest.fixture
+def generations(monkeypatch):
+    """Счетчик реальных генераций КУДиР"""
+    calls = []
+    original = kudir_generator.generate_kudir_file
+
+    async def counting(*args, **kwargs):
+        calls.append(args[1:])
+        return await original(*args, **kwargs)
+
+    monkeypatch.setattr(kudir_generator, 'generate_kudir_file', counting)
+    return calls
+
+
+def income(async_session, day, amount, confirmed=True):
+    return run(crud.create_transaction(async_session, {
+        'date': day,
+        'type': 'income',
+        'amount': Decimal(amount),
+        'payment_method': 'card',
+        'is_confirmed': confirmed
+    }))
+
+
+class TestKudirArtifact:
+
+    def test_reused_until_data_changes(self, async_session, generations):
+        income(async_session, date(2024, 3, 1), '1000')
+
+        first = run(kudir_generator.get_kudir_artifact(async_session, 2024))
+        second = run(kudir_generator.get_kudir_artifact(async_session, 2024))
+
+        assert len(generations) == 1
+        assert second.id == first.id
+        assert os.path.exists(first.file_path)
+
+        # Неподтвержденная транзакция книгу не меняет
+        pending = income(async_session, date(2024, 4, 1), '500', confirmed=False)
+        run(kudir_generator.get_kudir_artifact(async_session, 2024))
+        assert len(generations) == 1
+
+        # Подтверждение сбрасывает кэш периода
+        run(crud.confirm_transaction(async_session, pending.id, user_id=1))
+        assert not os.path.exists(first.file_path)
+
+        third = run(kudir_generator.get_kudir_artifact(async_session, 2024))
+        assert len(generations) == 2
+        assert third.data_version != first.data_version
+
+    def test_cached_file_has_no_generation_date(self, async_session):
+        import openpyxl
+
+        income(async_session, date(2024, 3, 1), '1000')
+        artifact = run(kudir_generator.get_kudir_artifact(async_session, 2024))
+
+        values = [
+            cell for row in openpyxl.load_workbook(artifact.file_path).active.iter_rows(values_only=True)
+            for cell in row if isinstance(cell, str)
+        ]
+        assert kudir_generator.SIGNATURE_DATE in values
+        assert not any(date.today().strftime('%d.%m.%Y') in value for value in values)
+
+    def test_delete_invalidates(self, async_session, generations):
+        transaction = income(async_session, date(2024, 3, 1), '1000')
+        artifact = run(kudir_generator.get_kudir_artifact(async_session, 2024))
+        quarter = run(kudir_generator.get_kudir_artifact(async_session, 2024, 1))
+        other = run(kudir_generator.get_kudir_artifact(async_session, 2024, 2))
+
+        run(crud.delete_transaction(async_session, transaction.id))
+
+        assert not os.path.exists(artifact.file_path)
+        assert not os.path.exists(quarter.file_path)
+        assert os.path.exists(other.file_path)
+
+    def test_missing_file_is_regenerated(self, async_session, generations):
+        artifact = run(kudir_generator.get_kudir_artifact(async_session, 2024))
+        os.remove(artifact.file_path)
+
+        again = run(kudir_generator.get_kudir_artifact(async_session, 2024))
+        assert len(generations) == 2
+        assert os.path.exists(again.file_path)
+
+    def test_telegram_file_id(self, async_session):
+        artifact = run(kudir_generator.get_kudir_artifact(async_session, 2024))
+        run(artifacts.set_telegram_file_id(async_session, artifact.id, 'BQACAgIAAx'))
+
+        cached = run(kudir_generator.get_kudir_artifact(async_session, 2024))
+        assert cached.telegram_file_id == 'BQACAgIAAx'
+
+
+class TestEviction:
+
+    def make(self, async_session, artifacts_path, name, size):
+        os.makedirs(artifacts_path, exist_ok=True)
+        path = str(artifacts_path / name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        return run(artifacts.save_artifact(
+            async_session, name, date(2024, 1, 1), date(2024, 12, 31), 'v1', path
+        ))
+
+    def test_evicts_by_size_and_age(self, db_session, async_session, artifacts_path):
+        old = self.make(async_session, artifacts_path, 'old', 10)
+        first = self.make(async_session, artifacts_path, 'first', 100)
+        second = self.make(async_session, artifacts_path, 'second', 100)
+
+        db_session.query(GeneratedArtifact).filter_by(id=old.id).update(
+            {'created_at': datetime.now() - timedelta(days=60)}
+        )
+        db_session.query(GeneratedArtifact).filter_by(id=first.id).update(
+            {'last_used_at': datetime.now() - timedelta(hours=1)}
+        )
+        db_session.commit()
+
+        evicted = run(artifacts.evict_artifacts(async_session, max_age_days=30, max_bytes=150))
+
+        assert evicted == 2
+        assert [a.report_type for a in db_session.query(GeneratedArtifact).all()] == ['second']
+        assert not os.path.exists(old.file_path)
+        assert not os.path.exists(first.file_path)
+        assert os.path.exists(second.file_path)
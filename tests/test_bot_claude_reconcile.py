@@ -0,0 +1,178 @@
+"""
+Тесты сверки смен с Bot_Claude
+"""
+import asyncio
+import sqlite3
+import pytest
+from decimal import Decimal
+from datetime import date, timedelta
+from sqlalchemy import event, select
+from app.database.models import Category, Shift
+from app.services.bot_claude_sync import BotClaudeSync
+from app.services.bot_claude_reconcile import BotClaudeReconciler
+from app.services.shift_importer import ShiftImporter
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+START = date(2024, 1, 1)
+DAYS = 120
+
+
+@pytest.fixture
+def source(tmp_path):
+    """БД Bot_Claude за 4 месяца: две смены и два отчета в день"""
+    path = tmp_path / 'knowledge.db'
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE shifts (
+            id INTEGER PRIMARY KEY, date TEXT, shift_type TEXT, employee_name TEXT,
+            hours_worked REAL, revenue_cash REAL, revenue_cashless REAL, revenue_qr REAL,
+            expenses REAL, notes TEXT
+        );
+        CREATE TABLE shift_reports (
+            date TEXT, shift_type TEXT, cash_fact REAL, cash_plan REAL, cashless_fact REAL,
+            qr_payments REAL, safe REAL, expenses_json TEXT, workers_list TEXT, equipment_issues TEXT
+        );
+    """)
+    for day in range(DAYS):
+        date_ = (START + timedelta(days=day)).isoformat()
+        for index, shift in enumerate(('morning', 'evening')):
+            conn.execute(
+                "INSERT INTO shifts VALUES (?, ?, ?, ?, 12, ?, 250.5, 0, ?, ?)",
+                (day * 2 + index + 1, date_, shift, ('Иванов Иван', 'Петров Петр')[index],
+                 1000 + day * 3 + index, 100 if day % 5 == 0 else None, 'ночь' if index else None)
+            )
+            conn.execute(
+                "INSERT INTO shift_reports VALUES (?, ?, ?, 1000, 500.25, 0, 300, NULL, NULL, NULL)",
+                (date_, shift, 1000 + day)
+            )
+    conn.commit()
+    conn.close()
+    return BotClaudeSync(str(path))
+
+
+@pytest.fixture
+def imported(db_session, async_session, source):
+    """Данные Bot_Claude, загруженные в бухгалтерию"""
+    db_session.add(Category(name='Услуги компьютерного клуба', type='income'))
+    db_session.commit()
+
+    importer = ShiftImporter(async_session, source)
+    run(importer.sync_shifts())
+    run(importer.sync_shift_reports())
+
+
+@pytest.fixture
+def statements(db_engine):
+    executed = []
+
+    def record(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    event.listen(db_engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(db_engine, 'before_cursor_execute', record)
+
+
+def source_execute(sync, sql, params=()):
+    conn = sqlite3.connect(sync.db_path)
+    conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+
+
+class TestReconcile:
+
+    @pytest.mark.parametrize('table', ['shifts', 'shift_reports'])
+    def test_consistent_history_reads_no_rows(self, async_session, source, imported, statements, table):
+        report = run(BotClaudeReconciler(async_session, source).reconcile(table))
+
+        assert report['consistent'] is True
+        assert report['months_checked'] == 4
+        assert report['months_differ'] == 0
+        assert report['days_checked'] == 0
+        assert report['rows_compared'] == 0
+        assert len(statements) == 1  # отпечатки месяцев
+
+    def test_shift_differences(self, db_session, async_session, source, imported):
+        shifts = {s.bot_shift_id: s for s in db_session.execute(select(Shift)).scalars().all()}
+
+        shifts[11].revenue += Decimal('0.01')                       # changed
+        db_session.delete(shifts[101])                              # missing
+        db_session.add(Shift(shift_date=date(2024, 3, 5), bot_shift_id=9999, revenue=Decimal('10')))  # extra
+        # Выручки двух смен одного дня поменялись местами - суммы дня те же
+        shifts[201].revenue, shifts[202].revenue = shifts[202].revenue, shifts[201].revenue
+        db_session.commit()
+
+        report = run(BotClaudeReconciler(async_session, source).reconcile('shifts'))
+
+        assert report['consistent'] is False
+        assert report['months_differ'] == 4
+        assert report['days_differ'] == 4
+        assert report['rows_compared'] == 9
+        assert [row['key'] for row in report['missing']] == [101]
+        assert [row['key'] for row in report['extra']] == [9999]
+        assert {row['key'] for row in report['changed']} == {11, 201, 202}
+
+        changed = next(row for row in report['changed'] if row['key'] == 11)
+        assert changed['fields'] == {'revenue': {'source': 126550, 'accounting': 126551}}
+
+    def test_swapped_names_and_same_length_notes(self, async_session, source, imported):
+        # Сотрудники двух смен поменялись местами, примечание заменено
+        # текстом той же длины - количества и суммы периода не меняются
+        source_execute(source, "UPDATE shifts SET employee_name = 'Петров Петр' WHERE id = 1")
+        source_execute(source, "UPDATE shifts SET employee_name = 'Иванов Иван' WHERE id = 2")
+        source_execute(source, "UPDATE shifts SET notes = 'день' WHERE id = 4")
+
+        report = run(BotClaudeReconciler(async_session, source).reconcile('shifts'))
+
+        assert report['consistent'] is False
+        assert report['months_differ'] == 1
+        assert report['days_differ'] == 2
+        assert report['changed'] == [
+            {'key': 1, 'fields': {'employee_name': {'source': 'Петров Петр', 'accounting': 'Иванов Иван'}}},
+            {'key': 2, 'fields': {'employee_name': {'source': 'Иванов Иван', 'accounting': 'Петров Петр'}}},
+            {'key': 4, 'fields': {'notes': {'source': 'день', 'accounting': 'ночь'}}},
+        ]
+
+    def test_source_edits_and_period_bounds(self, async_session, source, imported):
+        source_execute(source, "UPDATE shift_reports SET safe = 301 WHERE date = '2024-02-10' AND shift_type = 'evening'")
+        source_execute(source, "DELETE FROM shift_reports WHERE date = '2024-04-20'")
+
+        reconciler = BotClaudeReconciler(async_session, source)
+        report = run(reconciler.reconcile('shift_reports'))
+
+        assert report['months_differ'] == 2
+        assert report['days_differ'] == 2
+        assert report['changed'] == [{
+            'key': ('2024-02-10', 'evening'),
+            'fields': {'safe': {'source': 30100, 'accounting': 30000}}
+        }]
+        assert [row['key'] for row in report['extra']] == [('2024-04-20', 'evening'), ('2024-04-20', 'morning')]
+        assert report['missing'] == []
+
+        february = run(reconciler.reconcile('shift_reports', date(2024, 2, 1), date(2024, 2, 29)))
+        assert february['months_checked'] == 1
+        assert february['days_checked'] == 29
+        assert [row['key'] for row in february['changed']] == [('2024-02-10', 'evening')]
+        assert february['extra'] == []
+
+    def test_duplicate_source_rows(self, async_session, source, imported):
+        source_execute(
+            source,
+            "INSERT INTO shift_reports SELECT * FROM shift_reports WHERE date = '2024-03-15' AND shift_type = 'morning'"
+        )
+
+        report = run(BotClaudeReconciler(async_session, source).reconcile('shift_reports'))
+
+        assert report['days_differ'] == 1
+        assert (report['missing'], report['extra'], report['changed']) == ([], [], [])
+        assert report['duplicates'] == [{'key': ('2024-03-15', 'morning'), 'source': 2, 'accounting': 1}]
+        assert report['consistent'] is False
+
+    def test_unknown_table(self, async_session, source):
+        with pytest.raises(ValueError):
+            run(BotClaudeReconciler(async_session, source).reconcile('employees'))
@@ -0,0 +1,145 @@
+"""
+Тесты наблюдателя за БД Bot_Claude
+"""
+import asyncio
+import sqlite3
+import pytest
+from app.services import bot_claude_watcher as watcher_module
+from app.services.bot_claude_watcher import BotClaudeWatcher
+
+
+class ImportRecorder:
+    """Импорт-заглушка: считает запуски и их пересечения"""
+
+    def __init__(self, duration=0.0):
+        self.duration = duration
+        self.runs = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def __call__(self):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.duration)
+        self.active -= 1
+        self.runs += 1
+        return {'shifts_imported': 0}
+
+
+@pytest.fixture
+def knowledge_db(tmp_path):
+    path = tmp_path / 'knowledge.db'
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE shifts (id INTEGER PRIMARY KEY, date TEXT)")
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def write_burst(path, count):
+    conn = sqlite3.connect(path)
+    for day in range(count):
+        conn.execute("INSERT INTO shifts (date) VALUES (?)", (f"2024-01-{day % 28 + 1:02d}",))
+        conn.commit()
+    conn.close()
+
+
+async def wait_for(predicate, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            return False
+        await asyncio.sleep(0.02)
+    return True
+
+
+MODES = [
+    pytest.param(False, id='polling'),
+    pytest.param(True, id='inotify', marks=pytest.mark.skipif(
+        watcher_module.awatch is None, reason="watchfiles не установлен"
+    )),
+]
+
+
+@pytest.mark.parametrize('use_inotify', MODES)
+def test_burst_collapses_into_one_import(knowledge_db, use_inotify):
+    recorder = ImportRecorder()
+
+    async def scenario():
+        watcher = BotClaudeWatcher(
+            knowledge_db, import_func=recorder,
+            debounce=0.3, poll_interval=0.05, use_inotify=use_inotify
+        )
+        watcher.start()
+        await asyncio.sleep(0.2)
+
+        for _ in range(10):
+            await asyncio.to_thread(write_burst, knowledge_db, 5)
+            await asyncio.sleep(0.02)
+
+        imported = await wait_for(lambda: recorder.runs >= 1)
+        await asyncio.sleep(0.6)
+        await watcher.stop()
+        return imported, watcher
+
+    imported, watcher = asyncio.run(scenario())
+
+    assert imported
+    assert watcher.changes >= 1
+    assert recorder.runs == 1
+    assert watcher.get_metrics()['mode'] == ('inotify' if use_inotify else 'polling')
+
+
+def test_changes_during_import_trigger_one_rerun(knowledge_db):
+    recorder = ImportRecorder(duration=0.3)
+
+    async def scenario():
+        watcher = BotClaudeWatcher(knowledge_db, import_func=recorder, debounce=0.05, use_inotify=False)
+        watcher.start()
+
+        watcher.notify()
+        await wait_for(lambda: recorder.active == 1)
+        for _ in range(20):
+            watcher.notify()
+            await asyncio.sleep(0.005)
+
+        await wait_for(lambda: recorder.runs == 2)
+        await asyncio.sleep(0.3)
+        await watcher.stop()
+
+    asyncio.run(scenario())
+
+    assert recorder.runs == 2
+    assert recorder.max_active == 1
+
+
+def test_continuous_writes_import_within_max_delay(knowledge_db):
+    recorder = ImportRecorder()
+
+    async def scenario():
+        watcher = BotClaudeWatcher(knowledge_db, import_func=recorder, debounce=0.2, max_delay=0.5, use_inotify=False)
+        watcher.start()
+
+        started = asyncio.get_running_loop().time()
+        while recorder.runs == 0 and asyncio.get_running_loop().time() - started < 3:
+            watcher.notify()
+            await asyncio.sleep(0.05)
+        elapsed = asyncio.get_running_loop().time() - started
+        await watcher.stop()
+        return elapsed
+
+    assert asyncio.run(scenario()) < 1.0
+
+
+def test_manual_run_waits_for_watcher_import(knowledge_db):
+    recorder = ImportRecorder(duration=0.2)
+
+    async def scenario():
+        watcher = BotClaudeWatcher(knowledge_db, import_func=recorder, use_inotify=False)
+        return await asyncio.gather(watcher.run_import(), watcher.run_import())
+
+    results = asyncio.run(scenario())
+
+    assert results == [{'shifts_imported': 0}, {'shifts_imported': 0}]
+    assert recorder.max_active == 1
@@ -0,0 +1,167 @@
+"""
+Тесты контроля кассовой дисциплины (проверка за период против проверки по дням)
+"""
+import asyncio
+import pytest
+from decimal import Decimal
+from datetime import date, timedelta
+from sqlalchemy import event
+from app.database.models import CashBalance, Document, Transaction
+from app.database import crud
+from app.services import cash_control
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def python_daily_check(session, date_):
+    """Прежний расчет: баланс и транзакции дня, документы через ORM-связь"""
+    balance = await crud.get_cash_balance_by_date(session, date_)
+    transactions = await crud.get_transactions_by_date(session, date_, confirmed_only=False)
+
+    unconfirmed = [t for t in transactions if not t.is_confirmed]
+    no_documents = [t for t in transactions if t.is_confirmed and not t.documents and t.amount > 1000]
+
+    return cash_control.evaluate_cash_day(date_, balance, len(unconfirmed), len(no_documents))
+
+
+START = date(2024, 1, 1)
+END = date(2024, 3, 31)
+
+
+@pytest.fixture
+def cash_days(db_session):
+    """Квартал: балансы не на все дни, транзакции с документами и без"""
+    day = START
+    number = 0
+    while day <= END:
+        number += 1
+
+        if number % 7 != 0:  # раз в неделю записи баланса нет
+            closing = Decimal(1000 * (number % 5) - 1500)
+            calculated = None if number % 4 == 0 else closing + Decimal(number % 3 * 90)
+            db_session.add(CashBalance(
+                date=day,
+                opening_balance=Decimal('0'),
+                closing_balance=closing,
+                calculated_balance=calculated,
+                is_reconciled=number % 2 == 0
+            ))
+
+        for index, amount in enumerate(('500', '1500', '2500')[:number % 4]):
+            transaction = Transaction(
+                date=day,
+                type='expense',
+                amount=Decimal(amount),
+                payment_method='cash',
+                is_confirmed=(number + index) % 3 != 0
+            )
+            if (number + index) % 2 == 0:
+                transaction.documents = [Document(file_type='receipt'), Document(file_type='act')]
+            db_session.add(transaction)
+
+        day += timedelta(days=1)
+
+    db_session.commit()
+
+
+@pytest.fixture
+def statements(db_engine):
+    """Счетчик SQL-запросов к БД"""
+    executed = []
+
+    def record(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    event.listen(db_engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(db_engine, 'before_cursor_execute', record)
+
+
+class TestCashDiscipline:
+    """Проверка за период совпадает с проверкой по дням"""
+
+    def test_range_matches_daily_checks(self, async_session, cash_days):
+        checks = run(cash_control.check_cash_discipline_range(async_session, START, END))
+
+        assert len(checks) == (END - START).days + 1
+        for check in checks:
+            expected = run(python_daily_check(async_session, date.fromisoformat(check['date'])))
+            assert check == expected
+
+        statuses = {check['status'] for check in checks}
+        assert statuses == {'ok', 'warning', 'error'}
+        assert any(check.get('no_documents_count') for check in checks)
+        assert any(check.get('unconfirmed_count') for check in checks)
+
+    def test_report_uses_constant_queries(self, async_session, cash_days, statements):
+        report = run(cash_control.get_cash_discipline_report(async_session, START, END))
+
+        assert len(statements) == 2
+        assert report['total_days'] == 91
+        assert report['ok_days'] + report['warning_days'] + report['error_days'] == 91
+        assert report['compliance_rate'] == report['ok_days'] / 91 * 100
+
+    def test_single_day(self, async_session, cash_days):
+        check = run(cash_control.check_cash_discipline(async_session, date(2024, 2, 10)))
+
+        assert check == run(python_daily_check(async_session, date(2024, 2, 10)))
+
+    def test_limit_violations(self, db_session, async_session):
+        today = date.today()
+        for days_ago, closing in ((1, '150000'), (2, '90000'), (40, '200000')):
+            db_session.add(CashBalance(date=today - timedelta(days=days_ago), closing_balance=Decimal(closing)))
+        db_session.commit()
+
+        scan = run(cash_control.scan_cash_limit(async_session, today - timedelta(days=30), today))
+
+        assert scan['violations'] == [{
+            'date': (today - timedelta(days=1)).isoformat(),
+            'balance': 150000.0,
+            'limit': 100000.0,
+            'excess': 50000.0
+        }]
+
+
+class TestCashLimitScan:
+    """Превышения лимита, серии и пик за произвольный период"""
+
+    @pytest.fixture
+    def balances(self, db_session):
+        closing = {
+            date(2024, 1, 3): '120000',
+            date(2024, 1, 4): '130000',
+            date(2024, 1, 5): '90000',
+            date(2024, 1, 6): '105000',
+            date(2024, 1, 7): '140000',
+            date(2024, 1, 8): '101000',
+            date(2024, 1, 10): '250000',  # 9-го записи нет - серия прерывается
+            date(2024, 6, 1): '100000',   # ровно лимит - не превышение
+        }
+        for date_, amount in closing.items():
+            db_session.add(CashBalance(date=date_, closing_balance=Decimal(amount)))
+        db_session.commit()
+
+    def test_streak_and_peak(self, async_session, balances):
+        scan = run(cash_control.scan_cash_limit(async_session, date(2024, 1, 1), date(2024, 12, 31), Decimal('100000')))
+
+        assert scan['violation_days'] == 6
+        assert [v['date'] for v in scan['violations']] == [
+            '2024-01-03', '2024-01-04', '2024-01-06', '2024-01-07', '2024-01-08', '2024-01-10'
+        ]
+        assert scan['longest_streak'] == {'start': '2024-01-06', 'end': '2024-01-08', 'days': 3}
+        assert scan['peak'] == {'date': '2024-01-10', 'balance': 250000.0, 'limit': 100000.0, 'excess': 150000.0}
+
+    def test_year_in_one_query(self, async_session, balances, statements):
+        scan = run(cash_control.scan_cash_limit(async_session, date(2024, 1, 1), date(2024, 12, 31)))
+
+        assert len(statements) == 1
+        assert scan['limit'] == 100000.0
+
+    def test_no_violations(self, async_session, balances):
+        scan = run(cash_control.scan_cash_limit(async_session, date(2024, 2, 1), date(2024, 12, 31)))
+
+        assert scan['violations'] == []
+        assert scan['longest_streak'] is None
+        assert scan['peak'] is None
@@ -0,0 +1,114 @@
+"""
+Тесты кассовой книги
+"""
+import asyncio
+import pytest
+from decimal import Decimal
+from datetime import date
+from sqlalchemy import select
+from app.database import crud, cash_ledger
+from app.database.models import CashLedger
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def cash(date_, type_, amount, confirmed=True, method='cash'):
+    return {
+        'date': date_,
+        'type': type_,
+        'amount': Decimal(amount),
+        'payment_method': method,
+        'is_confirmed': confirmed
+    }
+
+
+@pytest.fixture
+def transactions(async_session):
+    """Наличные операции, добавленные не по порядку дат"""
+    created = []
+    for data in [
+        cash(date(2024, 1, 10), 'income', '10000'),
+        cash(date(2024, 1, 12), 'expense', '2500'),
+        cash(date(2024, 1, 11), 'income', '4000'),         # задним числом
+        cash(date(2024, 1, 11), 'expense', '700', confirmed=False),
+        cash(date(2024, 1, 12), 'income', '9000', method='card'),
+        cash(date(2024, 1, 5), 'expense', '1000'),         # раньше всех
+    ]:
+        created.append(run(crud.create_transaction(async_session, data)))
+    return created
+
+
+DATES = [date(2024, 1, d) for d in (1, 5, 10, 11, 12, 20)]
+
+
+class TestCashLedger:
+    """Остаток по книге совпадает с полным пересчетом"""
+
+    def assert_matches_full_scan(self, async_session):
+        for date_ in DATES:
+            ledger = run(cash_ledger.get_ledger_balance(async_session, date_))
+            full_scan = run(cash_ledger.full_scan_cash_balance(async_session, date_))
+            assert ledger == full_scan, date_
+
+    def test_create_out_of_order(self, async_session, transactions):
+        self.assert_matches_full_scan(async_session)
+        assert run(crud.calculate_cash_balance(async_session, date(2024, 1, 12))) == Decimal('10500')
+
+    def test_confirm_and_delete(self, async_session, transactions):
+        unconfirmed = transactions[3]
+        run(crud.confirm_transaction(async_session, unconfirmed.id, user_id=1))
+        self.assert_matches_full_scan(async_session)
+        assert run(cash_ledger.get_ledger_balance(async_session, date(2024, 1, 20))) == Decimal('9800')
+
+        # Повторное подтверждение не меняет остаток
+        run(crud.confirm_transaction(async_session, unconfirmed.id, user_id=1))
+        assert run(cash_ledger.get_ledger_balance(async_session, date(2024, 1, 20))) == Decimal('9800')
+
+        run(crud.delete_transaction(async_session, transactions[0].id))
+        self.assert_matches_full_scan(async_session)
+        assert run(cash_ledger.get_ledger_balance(async_session, date(2024, 1, 20))) == Decimal('-200')
+
+    def test_check_consistent(self, async_session, transactions):
+        result = run(cash_ledger.check_cash_ledger(async_session, date(2024, 1, 31)))
+        assert result['is_consistent']
+        assert result['mismatched_days'] == []
+
+    def test_check_detects_drift_and_rebuild_fixes_it(self, db_session, async_session, transactions):
+        row = db_session.execute(
+            select(CashLedger).where(CashLedger.date == date(2024, 1, 11))
+        ).scalar_one()
+        row.inflow = Decimal('1')
+        db_session.commit()
+
+        result = run(cash_ledger.check_cash_ledger(async_session, date(2024, 1, 31)))
+        assert not result['is_consistent']
+        assert result['mismatched_days'] == ['2024-01-11']
+
+        days = run(cash_ledger.rebuild_cash_ledger(async_session))
+        assert days == 4
+        result = run(cash_ledger.check_cash_ledger(async_session, date(2024, 1, 31)))
+        assert result['is_consistent']
+        self.assert_matches_full_scan(async_session)
+
+    def test_migration_seed_matches_incremental_ledger(self, db_session, async_session, transactions):
+        import importlib.util
+        from pathlib import Path
+        from sqlalchemy import delete, text
+
+        path = Path(__file__).parent.parent / 'migrations' / 'versions' / '002_create_cash_ledger.py'
+        spec = importlib.util.spec_from_file_location('migration_002', path)
+        migration = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(migration)
+
+        columns = (CashLedger.date, CashLedger.opening_balance, CashLedger.inflow, CashLedger.outflow, CashLedger.closing_balance)
+        incremental = db_session.execute(select(*columns).order_by(CashLedger.date)).all()
+
+        db_session.execute(delete(CashLedger))
+        db_session.execute(text(migration.SEED_CASH_LEDGER))
+        db_session.commit()
+
+        seeded = db_session.execute(select(*columns).order_by(CashLedger.date)).all()
+        assert seeded == incremental
+        assert seeded[-1].closing_balance == Decimal('10500')
@@ -0,0 +1,283 @@
+"""
+Тесты сервиса чеков ФНС на локальном тестовом сервере
+"""
+import asyncio
+import time
+import pytest
+from datetime import date, datetime
+from decimal import Decimal
+from aiohttp import web
+from app.database import crud
+from app.database.models import Accountable, Receipt, Transaction
+from app.services.fns_receipt import FNSReceiptService
+
+
+FISCAL_QR = 't=20240115T1530&s=1500.00&fn=9999078900004792&i=12345&fp=3522207165&n=1'
+
+DELAY = 0.2
+
+
+RECEIPT_RESPONSE = {
+    "document": {
+        "receipt": {
+            "user": "ООО Ромашка",
+            "userInn": "7700000000",
+            "totalSum": 150000,
+            "cashTotalSum": 150000,
+            "items": [{"name": "Бумага", "quantity": 1, "price": 150000, "sum": 150000}]
+        }
+    }
+}
+
+
+async def start_fake_fns(primary_delay=DELAY, alternate_delay=DELAY, primary_status=200):
+    """
+    Тестовый API ФНС: основной (GET) и альтернативный (POST) с задержкой
+
+    Returns:
+        (runner, url основного, url альтернативного, список вызовов)
+    """
+    calls = []
+
+    def handler(name, delay, status):
+        async def handle(request):
+            calls.append(name)
+            await asyncio.sleep(delay)
+            if status != 200:
+                return web.json_response({"error": "unavailable"}, status=status)
+            return web.json_response(RECEIPT_RESPONSE)
+        return handle
+
+    app = web.Application()
+    app.router.add_get('/api/v1/check', handler('primary', primary_delay, primary_status))
+    app.router.add_post('/v01/extract', handler('alternate', alternate_delay, 200))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base = f"http://127.0.0.1:{port}"
+    return runner, f"{base}/api/v1/check", f"{base}/v01/extract", calls
+
+
+def make_service(urls, session_factory, **kwargs):
+    url, alt_url = urls
+    return FNSReceiptService(api_url=url, alt_api_url=alt_url, session_factory=session_factory, **kwargs)
+
+
+def lookup(service, number=12345):
+    """Запрос деталей чека в обход парсинга QR"""
+    return service.get_receipt_details(
+        fiscal_sign='3522207165',
+        fiscal_document=str(number),
+        fiscal_storage='9999078900004792',
+        purchase_date=datetime(2024, 1, 15, 15, 30)
+    )
+
+
+class TestFNSLookup:
+
+    def test_concurrent_lookups_share_one_request(self, session_factory):
+        async def scenario():
+            runner, *urls, calls = await start_fake_fns()
+            service = make_service(urls, session_factory)
+            try:
+                results = await asyncio.gather(
+                    *(service.verify_and_save_receipt(FISCAL_QR) for _ in range(5))
+                )
+                return results, calls, service.stats
+            finally:
+                await service.close()
+                await runner.cleanup()
+
+        results, calls, stats = asyncio.run(scenario())
+
+        assert len(calls) == 1
+        assert stats['coalesced'] == 4
+        for receipt in results:
+            assert receipt['seller_inn'] == "7700000000"
+            assert receipt['total_amount'] == Decimal('1500')
+            assert receipt['items'][0]['name'] == "Бумага"
+
+    def test_response_is_cached_in_db(self, session_factory):
+        async def scenario():
+            runner, *urls, calls = await start_fake_fns()
+            first = make_service(urls, session_factory)
+            second = make_service(urls, session_factory)
+            try:
+                await first.verify_and_save_receipt(FISCAL_QR)
+                receipt = await second.verify_and_save_receipt(FISCAL_QR)
+                return receipt, calls, second.stats
+            finally:
+                await first.close()
+                await second.close()
+                await runner.cleanup()
+
+        receipt, calls, stats = asyncio.run(scenario())
+
+        assert len(calls) == 1
+        assert stats['cache_hits'] == 1
+        assert stats['upstream_requests'] == 0
+        assert receipt['seller_name'] == "ООО Ромашка"
+
+
+class TestHedging:
+    """Хеджирование запросов между основным и альтернативным API"""
+
+    def run_lookups(self, session_factory, count=1, fake=None, **kwargs):
+        async def scenario():
+            runner, *urls, calls = await start_fake_fns(**(fake or {}))
+            service = make_service(urls, session_factory, **kwargs)
+            try:
+                started = time.perf_counter()
+                results = [await lookup(service, number) for number in range(count)]
+                return results, time.perf_counter() - started, calls, service
+            finally:
+                await service.close()
+                await runner.cleanup()
+
+        return asyncio.run(scenario())
+
+    def test_slow_primary_is_hedged(self, session_factory):
+        results, elapsed, calls, service = self.run_lookups(
+            session_factory, fake={'primary_delay': 2, 'alternate_delay': 0.05},
+            hedge_mode='delay', hedge_delay=0.1
+        )
+
+        assert results[0]['seller_inn'] == "7700000000"
+        assert elapsed < 1
+        assert calls == ['primary', 'alternate']
+        stats = service.get_provider_stats()
+        assert stats['hedged'] == 1
+        assert stats['providers']['primary']['cancelled'] == 1
+        assert stats['providers']['alternate']['success'] == 1
+
+    def test_race_takes_first_answer(self, session_factory):
+        results, elapsed, calls, service = self.run_lookups(
+            session_factory, fake={'primary_delay': 2, 'alternate_delay': 0.05}, hedge_mode='race'
+        )
+
+        assert results[0]['total_amount'] == Decimal('1500')
+        assert elapsed < 1
+        assert sorted(calls) == ['alternate', 'primary']
+
+    def test_failed_primary_falls_back_immediately(self, session_factory):
+        results, elapsed, calls, service = self.run_lookups(
+            session_factory, fake={'primary_delay': 0.01, 'primary_status': 503},
+            hedge_mode='delay', hedge_delay=5
+        )
+
+        assert results[0] is not None
+        assert elapsed < 1
+        assert service.providers['primary']['failure'] == 1
+
+    def test_off_mode_is_sequential(self, session_factory):
+        results, elapsed, calls, service = self.run_lookups(
+            session_factory, fake={'primary_delay': 0.01}, hedge_mode='off'
+        )
+
+        assert results[0] is not None
+        assert calls == ['primary']
+
+    def test_order_adapts_to_statistics(self, session_factory):
+        results, elapsed, calls, service = self.run_lookups(
+            session_factory, count=8,
+            fake={'primary_delay': 0.01, 'primary_status': 503, 'alternate_delay': 0.01},
+            hedge_mode='delay'
+        )
+
+        assert all(result is not None for result in results)
+        assert service.provider_order() == ['alternate', 'primary']
+        # После набора статистики основной API больше не опрашивается
+        assert calls[-1] == 'alternate' and calls[-2] == 'alternate'
+
+    def test_unknown_mode(self):
+        with pytest.raises(ValueError):
+            FNSReceiptService(hedge_mode='fastest')
+
+
+class TestReceiptPreCheck:
+
+    def test_get_receipt_by_fiscal(self, db_session, async_session):
+        db_session.add(Receipt(
+            fiscal_sign='3522207165',
+            fiscal_document='12345',
+            fiscal_storage='9999078900004792',
+            purchase_date=datetime(2024, 1, 15, 15, 30),
+            total_amount=Decimal('1500'),
+            operation_type='income',
+            qr_raw=FISCAL_QR
+        ))
+        db_session.commit()
+
+        found = asyncio.run(crud.get_receipt_by_fiscal(
+            async_session, '3522207165', '12345', '9999078900004792'
+        ))
+        assert found is not None and found.total_amount == Decimal('1500')
+
+        assert asyncio.run(crud.get_receipt_by_fiscal(
+            async_session, '3522207165', '12346', '9999078900004792'
+        )) is None
+
+
+def receipt_info(number, amount):
+    return {
+        'fiscal_sign': f'35222{number:05d}',
+        'fiscal_document': str(number),
+        'fiscal_storage': '9999078900004792',
+        'purchase_date': datetime(2024, 1, 15, 15, 30),
+        'total_amount': Decimal(amount),
+        'operation_type': 'income',
+        'seller_name': 'ООО Ромашка',
+        'qr_raw': f'fp=35222{number:05d}&i={number}'
+    }
+
+
+class TestAccountableReceipts:
+    """Пакетное сохранение чеков по подотчету"""
+
+    @pytest.fixture
+    def accountable(self, db_session):
+        record = Accountable(
+            employee_id=1,
+            issued_date=date(2024, 1, 14),
+            amount_issued=Decimal('5000'),
+            amount_reported=Decimal('0'),
+            report_deadline=date(2024, 1, 17)
+        )
+        db_session.add(record)
+        db_session.commit()
+        return record
+
+    def test_batch_with_duplicate(self, db_session, async_session, accountable):
+        first = asyncio.run(crud.save_accountable_receipts(
+            async_session, accountable.id, [receipt_info(1, '1500'), receipt_info(2, '1000')]
+        ))
+        assert [item['status'] for item in first['results']] == ['success', 'success']
+        assert first['accountable']['amount_reported'] == Decimal('2500')
+        assert first['accountable']['status'] == 'partial'
+
+        second = asyncio.run(crud.save_accountable_receipts(
+            async_session, accountable.id, [receipt_info(2, '1000'), receipt_info(3, '2500')]
+        ))
+        assert [item['status'] for item in second['results']] == ['duplicate', 'success']
+        assert second['accountable']['amount_reported'] == Decimal('5000')
+        assert second['accountable']['status'] == 'reported'
+
+        assert db_session.query(Receipt).count() == 3
+        assert db_session.query(Transaction).filter_by(source='receipt_qr').count() == 3
+
+        registered = asyncio.run(crud.get_registered_fiscal_keys(async_session, [
+            ('3522200001', '1', '9999078900004792'),
+            ('3522200009', '9', '9999078900004792'),
+        ]))
+        assert registered == {('3522200001', '1', '9999078900004792')}
+
+    def test_update_is_relative(self, db_session, async_session, accountable):
+        # Сумма, записанная параллельным отчетом, не затирается
+        db_session.query(Accountable).filter_by(id=accountable.id).update({'amount_reported': Decimal('700')})
+        db_session.commit()
+
+        result = asyncio.run(crud.add_accountable_reported(async_session, accountable.id, Decimal('300')))
+        assert result['amount_reported'] == Decimal('1000')
+        assert asyncio.run(crud.add_accountable_reported(async_session, 999, Decimal('1'))) is None
@@ -0,0 +1,124 @@
+"""
+Тесты исполнителя генерации отчетов в пуле процессов
+"""
+import asyncio
+import os
+import time
+import pytest
+from datetime import date
+from decimal import Decimal
+from openpyxl import load_workbook
+from app.database.models import Contract, Employee
+from app.services.document_generator import DocumentGenerator, employee_document_data, contract_document_data
+from app.services.generation_executor import GenerationExecutor
+from app.services.report_generators import RSVGenerator, SZVMGenerator, EFS1Generator
+
+
+def busy(seconds: float) -> int:
+    """CPU-нагрузка в процессе пула"""
+    deadline = time.perf_counter() + seconds
+    count = 0
+    while time.perf_counter() < deadline:
+        count += 1
+    return os.getpid()
+
+
+def fail():
+    raise ValueError("broken template")
+
+
+@pytest.fixture(scope='module')
+def executor():
+    executor = GenerationExecutor(workers=3)
+    executor.start()
+    yield executor
+    asyncio.run(executor.stop())
+
+
+def test_reports_in_parallel(executor, tmp_path):
+    payrolls = [{
+        'employee_name': 'Иванов Иван',
+        'gross_salary': Decimal('50000'),
+        'contributions': {'pension': Decimal('11000'), 'medical': Decimal('2550'),
+                          'social': Decimal('1450'), 'injury': Decimal('100')}
+    }]
+    employees = [{'full_name': 'Иванов Иван', 'snils': '112-233-445 95', 'inn': '500100732259'}]
+    employees_full = [{'full_name': 'Иванов Иван', 'position': 'Администратор',
+                       'hire_date': date(2024, 1, 10), 'employment_type': 'TD'}]
+
+    async def scenario():
+        return await asyncio.gather(
+            executor.run(RSVGenerator(str(tmp_path)).generate, 2024, 1, payrolls, {}),
+            executor.run(SZVMGenerator(str(tmp_path)).generate, 2024, 3, employees),
+            executor.run(EFS1Generator(str(tmp_path)).generate, 2024, 1, employees_full, [])
+        )
+
+    paths = asyncio.run(scenario())
+
+    assert len(set(paths)) == 3
+    for path in paths:
+        assert os.path.dirname(path) == str(tmp_path)
+        assert load_workbook(path).active.max_row > 1
+
+
+def test_contract_from_plain_data(executor, tmp_path, db_session):
+    employee = Employee(full_name='Иванов Иван', inn='500100732259', passport_series='4510', passport_number='123456')
+    db_session.add(employee)
+    db_session.flush()
+    contract = Contract(employee_id=employee.id, contract_type='TD', contract_number='7',
+                        start_date=date(2024, 1, 10), position='Администратор', salary=Decimal('40000'))
+    db_session.add(contract)
+    db_session.commit()
+
+    employee_data = employee_document_data(employee)
+    contract_data = contract_document_data(contract)
+    db_session.close()
+
+    # В процесс уходят только простые значения, без состояния ORM
+    assert {type(value) for value in (*employee_data.values(), *contract_data.values())} <= {
+        int, str, date, Decimal, type(None)
+    }
+
+    path = asyncio.run(executor.run(
+        DocumentGenerator(str(tmp_path)).generate_labor_contract, employee_data, contract_data
+    ))
+
+    from docx import Document
+    text = "\n".join(p.text for p in Document(path).paragraphs)
+    assert 'Иванов Иван, паспорт 4510 123456, ИНН 500100732259' in text
+    assert '40,000.00' in text
+
+
+def test_event_loop_stays_responsive(executor):
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        pids = await asyncio.gather(*(executor.run(busy, 0.5) for _ in range(3)))
+        elapsed = time.perf_counter() - started
+        task.cancel()
+        return pids, elapsed, ticks
+
+    pids, elapsed, ticks = asyncio.run(scenario())
+
+    assert os.getpid() not in pids
+    if (os.cpu_count() or 1) >= 3:
+        assert elapsed < 1.4  # три задания по 0.5 с идут параллельно
+    assert ticks >= 20
+
+
+def test_errors_are_propagated(executor):
+    failed = executor.failed
+
+    with pytest.raises(ValueError, match="broken template"):
+        asyncio.run(executor.run(fail))
+
+    assert executor.failed == failed + 1
+    assert executor.get_metrics()['completed'] >= 1
@@ -0,0 +1,101 @@
+"""
+Тесты потоковой генерации КУДиР
+"""
+import asyncio
+import openpyxl
+import pytest
+from datetime import date, datetime
+from decimal import Decimal
+from app.database.models import Category, Transaction
+from app.services import kudir_generator
+
+
+@pytest.fixture
+def transactions(db_session):
+    """Операции года вперемешку: доходы, учитываемые и неучитываемые расходы"""
+    deductible = Category(name='Аренда', type='expense', tax_deductible=True)
+    other = Category(name='Штрафы', type='expense', tax_deductible=False)
+    db_session.add_all([deductible, other])
+    db_session.flush()
+
+    rows = []
+    for i in range(30):
+        day = date(2024, 1 + i % 12, 1 + i % 27)
+        kind = i % 3
+        rows.append(Transaction(
+            date=day,
+            type='income' if kind == 0 else 'expense',
+            amount=Decimal('1000.50') + i,
+            category_id=None if kind == 0 else (deductible.id if kind == 1 else other.id),
+            counterparty=f'Контрагент {i}' if i % 2 else None,
+            description=f'Операция {i}' if i % 5 else None,
+            document_number=str(100 + i) if i % 4 else None,
+            is_confirmed=i != 29,
+            created_at=datetime(2024, 1, 1, 12, i)
+        ))
+    # Не попадает в 2024 год
+    rows.append(Transaction(date=date(2023, 12, 31), type='income', amount=Decimal('5'), is_confirmed=True))
+    db_session.add_all(rows)
+    db_session.commit()
+    return rows
+
+
+def side_style(side):
+    return side.style if side else None
+
+
+def cell_content(cell):
+    return (
+        cell.value if cell.value != "" else None,
+        cell.number_format,
+        cell.font.b, cell.font.sz,
+        cell.alignment.horizontal, cell.alignment.vertical, cell.alignment.wrap_text,
+        side_style(cell.border.left), side_style(cell.border.bottom),
+        cell.fill.fgColor.rgb if cell.fill.fill_type else None
+    )
+
+
+def sheet_content(ws):
+    return [
+        [cell_content(cell) for cell in row]
+        for row in ws.iter_rows(min_row=1, max_row=ws.max_row, max_col=5)
+    ]
+
+
+@pytest.mark.parametrize('quarter', [None, 2])
+def test_streaming_matches_regular_sheet(tmp_path, async_session, transactions, quarter):
+    regular_path = tmp_path / 'regular.xlsx'
+    workbook = asyncio.run(kudir_generator.generate_kudir(async_session, 2024, quarter))
+    workbook.save(regular_path)
+
+    streamed_path = asyncio.run(kudir_generator.generate_kudir_file(
+        async_session, 2024, quarter, output_path=str(tmp_path / 'streamed.xlsx')
+    ))
+
+    regular = openpyxl.load_workbook(regular_path)['Раздел I']
+    streamed = openpyxl.load_workbook(streamed_path)['Раздел I']
+
+    assert sheet_content(streamed) == sheet_content(regular)
+    assert {str(r) for r in streamed.merged_cells.ranges} == {str(r) for r in regular.merged_cells.ranges}
+    for column in 'ABCDE':
+        assert streamed.column_dimensions[column].width == regular.column_dimensions[column].width
+
+
+def test_streaming_totals(tmp_path, async_session, transactions, monkeypatch):
+    # Маленькие пачки: итоги считаются по всем пачкам
+    monkeypatch.setattr(kudir_generator, 'STREAM_BATCH_SIZE', 4)
+    path = asyncio.run(kudir_generator.stream_kudir_file(
+        async_session, 2024, output_path=str(tmp_path / 'kudir.xlsx')
+    ))
+    ws = openpyxl.load_workbook(path)['Раздел I']
+
+    confirmed = [t for t in transactions[:-1] if t.is_confirmed]
+    income = sum(t.amount for t in confirmed if t.type == 'income')
+    expense = sum(t.amount for i, t in enumerate(confirmed) if i % 3 == 1)
+
+    assert ws.cell(row=6 + len(confirmed) - 1, column=1).value == len(confirmed)
+    total_row = 6 + len(confirmed) + 1
+    assert ws.cell(row=total_row, column=1).value == "ИТОГО:"
+    assert ws.cell(row=total_row, column=4).value == pytest.approx(float(income))
+    assert ws.cell(row=total_row, column=5).value == pytest.approx(float(expense))
+    assert ws.cell(row=total_row + 2, column=4).value == pytest.approx(float(max(income - expense, 0)))
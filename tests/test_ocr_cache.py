@@ -0,0 +1,104 @@
+"""
+Тесты кэша результатов распознавания чеков
+"""
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from io import BytesIO
+from PIL import Image, ImageDraw
+from sqlalchemy import select
+from app.database.models import OCRCache, Document
+from app.services import ocr_cache
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def receipt_photo(quality=90, size=(300, 400), text='ИТОГО 500.00') -> bytes:
+    """Фото чека в JPEG заданного качества"""
+    image = Image.new('RGB', (300, 400), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((20, 20, 280, 120), fill='black')
+    draw.text((40, 200), text, fill='black')
+    draw.rectangle((20, 300, 150, 380), fill='gray')
+    buffer = BytesIO()
+    image.resize(size).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    ocr_cache.reset_stats()
+    yield
+    ocr_cache.reset_stats()
+
+
+class TestHashes:
+
+    def test_recompressed_photo_is_another_key(self):
+        original = receipt_photo(quality=95)
+
+        assert ocr_cache.content_hash(original) == ocr_cache.content_hash(receipt_photo(quality=95))
+        assert ocr_cache.content_hash(original) != ocr_cache.content_hash(receipt_photo(quality=60))
+
+
+class TestOCRCache:
+
+    def test_lookup_by_file_and_content(self, async_session, db_session):
+        photo = receipt_photo()
+        sha256 = ocr_cache.content_hash(photo)
+        data = {'amount': 500.0, 'seller': 'ООО Ромашка'}
+
+        assert run(ocr_cache.get_by_file(async_session, 'uniq-1')) is None
+        assert run(ocr_cache.get_by_image(async_session, sha256)) is None
+
+        run(ocr_cache.store(async_session, sha256, data, file_unique_id='uniq-1'))
+
+        assert run(ocr_cache.get_by_file(async_session, 'uniq-1')) == data
+        assert run(ocr_cache.get_by_image(async_session, sha256)) == data
+
+        entry = db_session.execute(select(OCRCache)).scalar_one()
+        db_session.refresh(entry)
+        assert entry.hits == 2
+
+        stats = ocr_cache.get_stats()
+        assert (stats['file'], stats['content'], stats['misses']) == (1, 1, 1)
+        assert stats['hit_rate'] == round(2 / 3, 3)
+
+    def test_same_layout_other_receipt_is_not_served(self, async_session):
+        # Разные чеки одной кассы: одинаковая верстка, другая сумма
+        first = ocr_cache.content_hash(receipt_photo(text='ИТОГО 500.00'))
+        second = ocr_cache.content_hash(receipt_photo(text='ИТОГО 900.00'))
+
+        run(ocr_cache.store(async_session, first, {'amount': 500.0, 'fiscal': {'fd': '101'}}))
+
+        assert run(ocr_cache.get_by_image(async_session, second)) is None
+        assert ocr_cache.get_stats()['misses'] == 1
+
+    def test_document_ocr_data_reused(self, async_session, db_session):
+        db_session.add(Document(telegram_file_id='file-1', ocr_data={'amount': 42}))
+        db_session.commit()
+
+        assert run(ocr_cache.get_by_file(async_session, 'uniq-x', 'file-1')) == {'amount': 42}
+        assert ocr_cache.get_stats()['document'] == 1
+
+    def test_lru_eviction(self, async_session, db_session):
+        entries = [f'{i:064x}' for i in range(4)]
+        for i, sha256 in enumerate(entries):
+            run(ocr_cache.store(async_session, sha256, {'n': i}, max_entries=10))
+
+        # Первые записи давно не использовались, запись 0 только что прочитана
+        now = datetime.now()
+        for entry in db_session.execute(select(OCRCache)).scalars():
+            entry.last_used_at = now - timedelta(days=10 - int(entry.content_hash, 16))
+        db_session.commit()
+        run(ocr_cache.get_by_image(async_session, entries[0]))
+
+        run(ocr_cache.store(async_session, f'{9:064x}', {'n': 9}, max_entries=3))
+
+        db_session.expire_all()
+        kept = sorted(
+            entry.ocr_data['n'] for entry in db_session.execute(select(OCRCache)).scalars()
+        )
+        assert kept == [0, 3, 9]
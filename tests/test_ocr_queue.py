@@ -0,0 +1,116 @@
+"""
+Тесты очереди распознавания чеков
+"""
+import asyncio
+import time
+import pytest
+from app.services.ocr_queue import OCRQueue
+from app.services.ocr_service import parse_receipt_response
+
+
+DELAY = 0.1
+
+
+async def slow_recognizer(image_bytes: bytes):
+    """Имитация запроса к OCR: не блокирует цикл событий"""
+    await asyncio.sleep(DELAY)
+    if image_bytes == b'bad':
+        raise RuntimeError('vision error')
+    return {'amount': len(image_bytes)}
+
+
+class TestOCRQueue:
+    """Задания обрабатываются пулом воркеров, результат - через callback"""
+
+    def test_workers_run_concurrently(self):
+        async def scenario():
+            queue = OCRQueue(workers=3, recognizer=slow_recognizer)
+            results = {}
+            done = asyncio.Event()
+
+            def callback_for(key):
+                async def callback(result):
+                    results[key] = result
+                    if len(results) == 6:
+                        done.set()
+                return callback
+
+            started = time.perf_counter()
+            positions = [queue.submit(b'x' * i, callback_for(i)) for i in range(1, 7)]
+            await asyncio.wait_for(done.wait(), 5)
+            elapsed = time.perf_counter() - started
+            metrics = queue.get_metrics()
+            await queue.stop()
+            return positions, results, elapsed, metrics
+
+        positions, results, elapsed, metrics = asyncio.run(scenario())
+
+        assert positions == [0, 1, 2, 3, 4, 5]
+        assert results == {i: {'amount': i} for i in range(1, 7)}
+        # 6 заданий на 3 воркерах - две волны, а не шесть
+        assert DELAY * 2 <= elapsed < DELAY * 4
+        assert metrics['processed'] == 6
+        assert metrics['queue_depth'] == 0
+        assert metrics['process']['avg_ms'] >= DELAY * 1000 * 0.9
+        assert metrics['wait']['max_ms'] >= DELAY * 1000 * 0.9
+
+    def test_event_loop_not_blocked(self):
+        async def scenario():
+            queue = OCRQueue(workers=1, recognizer=slow_recognizer)
+            done = asyncio.Event()
+
+            async def callback(result):
+                done.set()
+
+            queue.submit(b'photo', callback)
+
+            # Пока идет распознавание, цикл событий обслуживает другие задачи
+            ticks = 0
+            while not done.is_set():
+                ticks += 1
+                await asyncio.sleep(DELAY / 10)
+
+            await queue.stop()
+            return ticks
+
+        assert asyncio.run(scenario()) >= 5
+
+    def test_failures_and_full_queue(self):
+        async def scenario():
+            queue = OCRQueue(workers=1, maxsize=1, recognizer=slow_recognizer)
+            results = []
+            done = asyncio.Event()
+
+            async def callback(result):
+                results.append(result)
+                if len(results) == 2:
+                    done.set()
+
+            queue.submit(b'bad', callback)
+            await asyncio.sleep(0)      # воркер забрал первое задание
+            queue.submit(b'ok', callback)
+            with pytest.raises(asyncio.QueueFull):
+                queue.submit(b'overflow', callback)
+
+            await asyncio.wait_for(done.wait(), 5)
+            metrics = queue.get_metrics()
+            await queue.stop()
+            return results, metrics
+
+        results, metrics = asyncio.run(scenario())
+
+        assert results == [None, {'amount': 2}]
+        assert metrics['failed'] == 1
+        assert metrics['processed'] == 1
+
+
+class TestParseReceiptResponse:
+    """Извлечение JSON из ответа модели"""
+
+    @pytest.mark.parametrize('text', [
+        '{"amount": 500}',
+        '```json\n{"amount": 500}\n```',
+        'Вот чек:\n```\n{"amount": 500}\n```',
+    ])
+    def test_formats(self, text):
+        assert parse_receipt_response(text) == {'amount': 500}
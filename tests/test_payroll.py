@@ -0,0 +1,146 @@
+"""
+Тесты расчета зарплаты всех сотрудников
+"""
+import asyncio
+import pytest
+from decimal import Decimal
+from datetime import date
+from sqlalchemy import event, select
+from app.database.models import Employee, Payroll, Shift
+from app.services.payroll_calculator import PayrollCalculator
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def staff(db_session):
+    """Сотрудники со сменами в марте и соседних месяцах"""
+    employees = [
+        Employee(full_name='Иванов Иван', hourly_rate=Decimal('250.00')),
+        Employee(full_name='Петров Петр', hourly_rate=Decimal('312.50')),
+        Employee(full_name='Сидорова Анна', hourly_rate=Decimal('199.99')),  # без смен в марте
+        Employee(full_name='Без ставки'),
+        Employee(full_name='Уволенный', hourly_rate=Decimal('300'), fire_date=date(2024, 2, 1)),
+    ]
+    db_session.add_all(employees)
+    db_session.flush()
+
+    for day in range(1, 32):
+        db_session.add(Shift(employee_id=employees[day % 2].id, shift_date=date(2024, 3, day), hours_worked=Decimal('11.5')))
+    db_session.add(Shift(employee_id=employees[2].id, shift_date=date(2024, 2, 29), hours_worked=Decimal('12')))
+    db_session.add(Shift(employee_id=employees[0].id, shift_date=date(2024, 4, 1), hours_worked=Decimal('12')))
+    db_session.add(Shift(employee_id=employees[3].id, shift_date=date(2024, 3, 3), hours_worked=Decimal('12')))
+    db_session.commit()
+    return employees
+
+
+@pytest.fixture
+def statements(db_engine):
+    executed = []
+
+    def record(conn, cursor, statement, *args):
+        executed.append(statement.split()[0].upper())
+
+    event.listen(db_engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(db_engine, 'before_cursor_execute', record)
+
+
+class TestPayrollRun:
+
+    def test_matches_per_employee_calculation(self, async_session, staff, statements):
+        calculator = PayrollCalculator(async_session)
+
+        result = run(calculator.run_payroll(2024, 3))
+
+        assert statements == ['SELECT', 'INSERT']
+        assert result['skipped'] == [staff[3].id]
+        assert result['duration_ms'] >= 0
+
+        expected = [run(calculator.calculate_monthly_payroll(e.id, 2024, 3)) for e in staff[:3]]
+        assert result['payrolls'] == expected
+        assert [p['total_hours'] for p in expected] == [Decimal('172.5'), Decimal('184.0'), Decimal('0')]
+
+    def test_upsert_keeps_status(self, db_session, async_session, staff):
+        db_session.add(Payroll(
+            employee_id=staff[0].id, period_year=2024, period_month=3,
+            gross_salary=Decimal('1'), net_salary=Decimal('1'), status='APPROVED'
+        ))
+        db_session.commit()
+
+        payrolls = run(PayrollCalculator(async_session).calculate_all_payrolls(2024, 3))
+        run(PayrollCalculator(async_session).calculate_all_payrolls(2024, 3))
+
+        db_session.expire_all()
+        saved = {p.employee_id: p for p in db_session.execute(select(Payroll)).scalars().all()}
+
+        assert len(saved) == 3
+        assert saved[staff[0].id].status == 'APPROVED'
+        assert saved[staff[1].id].status == 'DRAFT'
+        for payroll_data in payrolls:
+            payroll = saved[payroll_data['employee_id']]
+            assert payroll.gross_salary == payroll_data['gross_salary'].quantize(Decimal('0.01'))
+            assert payroll.ndfl == payroll_data['ndfl']
+            assert payroll.contributions == payroll_data['contributions']['total']
+
+    def test_no_employees(self, async_session, statements):
+        result = run(PayrollCalculator(async_session).run_payroll(2024, 3))
+
+        assert result['payrolls'] == []
+        assert statements == ['SELECT']
+
+
+@pytest.fixture
+def quarter_payroll(db_session, staff):
+    """Начисления первого квартала: черновик, утвержденные и чужой квартал"""
+    rows = [
+        (staff[0].id, 1, Decimal('43125.00'), 'PAID'),
+        (staff[1].id, 2, Decimal('57500.00'), 'APPROVED'),
+        (staff[2].id, 3, Decimal('19999.99'), 'APPROVED'),
+        (staff[0].id, 3, Decimal('1000.00'), 'DRAFT'),
+        (staff[1].id, 4, Decimal('99999.00'), 'APPROVED'),
+    ]
+    for employee_id, month, gross, status in rows:
+        db_session.add(Payroll(
+            employee_id=employee_id, period_year=2024, period_month=month,
+            gross_salary=gross, ndfl=(gross * Decimal('0.13')).quantize(Decimal('0.01')),
+            net_salary=gross, status=status
+        ))
+    db_session.commit()
+
+
+class TestQuarterReportData:
+
+    def test_report_data_in_two_queries(self, async_session, staff, quarter_payroll, statements):
+        from app.database import reporting
+
+        data = run(reporting.get_quarter_report_data(async_session, 2024, 1))
+
+        assert statements == ['SELECT', 'SELECT']
+        assert [(row.full_name, row.period_month) for row in data['payroll']] == [
+            ('Иванов Иван', 1), ('Петров Петр', 2), ('Иванов Иван', 3), ('Сидорова Анна', 3)
+        ]
+        assert [e.full_name for e in data['employees']] == [e.full_name for e in staff[:4]]
+
+    def test_rsv_payrolls_and_taxes_from_shared_rows(self, async_session, staff, quarter_payroll, statements):
+        from app.database import reporting
+
+        calculator = PayrollCalculator(async_session)
+        rows = run(reporting.get_quarter_payroll(async_session, 2024, 1))
+
+        payrolls = calculator.report_payrolls(rows)
+        taxes = run(calculator.calculate_quarterly_taxes(2024, 1, rows))
+
+        assert statements == ['SELECT']
+        assert run(calculator.calculate_quarterly_taxes(2024, 1)) == taxes
+        assert taxes['total_gross_salary'] == Decimal('120624.99')
+        assert taxes['ndfl']['amount'] == Decimal('15681.25')
+
+        first = payrolls[0]
+        assert first['employee_name'] == 'Иванов Иван'
+        assert first['contributions']['pension'] == (Decimal('43125.00') * calculator.PENSION_RATE).quantize(Decimal('0.01'))
+        assert first['contributions']['total'] == sum(
+            value for key, value in first['contributions'].items() if key != 'total'
+        )
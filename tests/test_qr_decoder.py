@@ -0,0 +1,84 @@
+"""
+Тесты быстрого пути распознавания чека по фискальному QR-коду
+"""
+import asyncio
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+np = pytest.importorskip('numpy')
+
+from app.services import qr_decoder  # noqa: E402
+from app.services.fns_receipt import fns_receipt_service  # noqa: E402
+
+
+FISCAL_QR = 't=20240115T1530&s=1500.00&fn=9999078900004792&i=12345&fp=3522207165&n=1'
+
+
+def photo_with_qr(text: str, size: int = 1200) -> bytes:
+    """Фото чека: QR-код посреди белого листа, JPEG"""
+    qr = cv2.QRCodeEncoder.create().encode(text)
+    qr = cv2.resize(qr, (qr.shape[1] * 8, qr.shape[0] * 8), interpolation=cv2.INTER_NEAREST)
+    page = np.full((size, size), 255, dtype=np.uint8)
+    top, left = size // 3, 100
+    page[top:top + qr.shape[0], left:left + qr.shape[1]] = qr
+    ok, encoded = cv2.imencode('.jpg', page, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return encoded.tobytes()
+
+
+def blank_photo() -> bytes:
+    ok, encoded = cv2.imencode('.jpg', np.full((400, 300), 255, dtype=np.uint8))
+    return encoded.tobytes()
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    qr_decoder.reset_stats()
+    yield
+    qr_decoder.reset_stats()
+
+
+@pytest.fixture
+def fns_offline(monkeypatch):
+    """ФНС недоступна: данные чека берутся только из QR"""
+    async def no_details(**kwargs):
+        return None
+    monkeypatch.setattr(fns_receipt_service, 'get_receipt_details', no_details)
+
+
+class TestDecodeQR:
+
+    def test_decodes_fiscal_qr(self):
+        text = qr_decoder.decode_qr(photo_with_qr(FISCAL_QR))
+        assert text == FISCAL_QR
+        assert qr_decoder.is_fiscal_qr(text)
+
+    def test_large_photo(self):
+        assert qr_decoder.decode_qr(photo_with_qr(FISCAL_QR, size=3000)) == FISCAL_QR
+
+    def test_no_qr(self):
+        assert qr_decoder.decode_qr(blank_photo()) is None
+        assert qr_decoder.decode_qr(b'not an image') is None
+
+    def test_not_fiscal(self):
+        assert not qr_decoder.is_fiscal_qr('https://example.com')
+
+
+class TestRecognizeFiscalQR:
+
+    def test_fast_path(self, fns_offline):
+        data = asyncio.run(qr_decoder.recognize_fiscal_qr(photo_with_qr(FISCAL_QR)))
+
+        assert data['date'] == '2024-01-15'
+        assert data['amount'] == 1500.0
+        assert data['fiscal'] == {
+            'fn': '9999078900004792', 'fd': '12345', 'fp': '3522207165', 'qr_raw': FISCAL_QR
+        }
+
+    def test_hit_rate(self, fns_offline):
+        photos = [photo_with_qr(FISCAL_QR), photo_with_qr('https://example.com'), blank_photo()]
+        results = [asyncio.run(qr_decoder.recognize_fiscal_qr(photo)) for photo in photos]
+
+        assert [r is not None for r in results] == [True, False, False]
+        stats = qr_decoder.get_stats()
+        assert (stats['attempts'], stats['qr_found'], stats['fiscal']) == (3, 2, 1)
+        assert stats['hit_rate'] == 0.333
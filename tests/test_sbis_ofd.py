@@ -0,0 +1,284 @@
+"""
+Тесты клиента СБИС ОФД на локальном тестовом сервере
+"""
+import asyncio
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from aiohttp import web
+from sqlalchemy import select
+from app.database.models import OfdShiftTotals
+from app.services import sbis_ofd
+
+
+DELAY = 0.2
+
+
+async def start_fake_ofd(open_dates=()):
+    """Тестовый ОФД с фиксированной задержкой ответа (смены закрыты, кроме open_dates)"""
+    peers = set()
+
+    async def shift_report(request):
+        peers.add(request.transport.get_extra_info('peername'))
+        await asyncio.sleep(DELAY)
+        shift_date = request.query["date"]
+        return web.json_response({
+            "cash": 1000,
+            "cashless": 500,
+            "total": 1500,
+            "receipts_count": 10,
+            "shift_number": int(shift_date[-2:]),
+            "closed_at": None if shift_date in open_dates else f"{shift_date}T23:00:00"
+        })
+
+    app = web.Application()
+    app.router.add_get('/ofd/v1/shift-report', shift_report)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/ofd/v1", peers
+
+
+def week_shifts():
+    return [
+        {
+            "shift_date": date(2025, 1, 1) + timedelta(days=i),
+            "fact_cash": 1000.0,
+            "fact_cashless": 500.0 if i else 900.0,
+            "fact_qr": 0.0
+        }
+        for i in range(7)
+    ]
+
+
+class TestPooledClient:
+    """Общий клиент: одна сессия, параллельные запросы, метрики"""
+
+    def test_week_check_runs_in_parallel(self, monkeypatch, session_factory):
+        async def scenario():
+            runner, url, peers = await start_fake_ofd()
+            monkeypatch.setenv("SBIS_OFD_URL", url)
+            sbis_ofd.get_ofd_client("token", "1234567890").session_factory = session_factory
+            try:
+                started = time.perf_counter()
+                results = await sbis_ofd.validate_shifts_with_ofd(
+                    week_shifts(), max_concurrency=7, api_token="token", inn="1234567890"
+                )
+                elapsed = time.perf_counter() - started
+                client = sbis_ofd.get_ofd_client("token", "1234567890")
+                return results, elapsed, client.get_metrics(), peers
+            finally:
+                await sbis_ofd.close_ofd_clients()
+                await runner.cleanup()
+
+        results, elapsed, metrics, peers = asyncio.run(scenario())
+
+        assert [r["status"] for r in results] == ["warning"] + ["ok"] * 6
+        assert [r["kkt_shift_number"] for r in results] == list(range(1, 8))
+        assert elapsed < DELAY * 3
+        assert metrics["shift-report"]["requests"] == 7
+        assert metrics["shift-report"]["errors"] == 0
+        assert metrics["shift-report"]["avg_ms"] >= DELAY * 1000 * 0.9
+
+    def test_connections_are_reused(self, session_factory):
+        async def scenario():
+            runner, url, peers = await start_fake_ofd()
+            client = sbis_ofd.SbisOFD("token", "1234567890", base_url=url, session_factory=session_factory)
+            try:
+                for shift in week_shifts()[:3]:
+                    assert await client.get_shift_totals(shift["shift_date"])
+                return peers
+            finally:
+                await client.close()
+                await runner.cleanup()
+
+        # Последовательные запросы идут по одному keep-alive соединению
+        assert len(asyncio.run(scenario())) == 1
+
+    def test_semaphore_bounds_concurrency(self, monkeypatch, session_factory):
+        async def scenario():
+            runner, url, peers = await start_fake_ofd()
+            monkeypatch.setenv("SBIS_OFD_URL", url)
+            sbis_ofd.get_ofd_client("token", "1234567890").session_factory = session_factory
+            try:
+                started = time.perf_counter()
+                await sbis_ofd.validate_shifts_with_ofd(
+                    week_shifts()[:4], max_concurrency=2, api_token="token", inn="1234567890"
+                )
+                return time.perf_counter() - started
+            finally:
+                await sbis_ofd.close_ofd_clients()
+                await runner.cleanup()
+
+        # 4 запроса по 2 одновременно - две волны
+        assert asyncio.run(scenario()) >= DELAY * 2
+
+    def test_session_from_finished_loop_is_released(self, session_factory):
+        import gc
+        import warnings
+
+        client = sbis_ofd.SbisOFD("token", "1234567890", base_url="http://127.0.0.1:1", session_factory=session_factory)
+
+        async def get_session():
+            return client._get_session()
+
+        first = asyncio.run(get_session())
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            second = asyncio.run(get_session())
+            del first
+            gc.collect()
+
+        assert second is not None and not second.closed
+        assert not [w for w in caught if "Unclosed" in str(w.message)]
+        asyncio.run(client.close())
+
+    def test_not_configured(self, monkeypatch):
+        monkeypatch.delenv("SBIS_OFD_TOKEN", raising=False)
+        assert sbis_ofd.get_ofd_client(inn="1234567890") is None
+
+
+class TestShiftTotalsCache:
+    """Итоги закрытых смен берутся из кэша, открытых - обновляются по TTL"""
+
+    def run_client(self, session_factory, calls, open_dates=(), open_shift_ttl=60):
+        async def scenario():
+            runner, url, peers = await start_fake_ofd(open_dates)
+            client = sbis_ofd.SbisOFD(
+                "token", "1234567890", base_url=url,
+                session_factory=session_factory, open_shift_ttl=open_shift_ttl
+            )
+            try:
+                results = [await client.get_shift_totals(shift_date) for shift_date in calls]
+                return results, client
+            finally:
+                await client.close()
+                await runner.cleanup()
+
+        return asyncio.run(scenario())
+
+    def test_closed_shift_persisted(self, db_session, session_factory):
+        day = date(2025, 1, 3)
+
+        results, client = self.run_client(session_factory, [day, day])
+        assert results[0] == results[1]
+        assert client.metrics["shift-report"]["requests"] == 1
+        assert client.cache_stats == {"memory": 1, "db": 0, "ofd": 1}
+
+        row = db_session.execute(select(OfdShiftTotals)).scalar_one()
+        assert (row.inn, row.kkt_number, row.date, row.total) == ("1234567890", "", day, Decimal("1500"))
+
+        # Новый клиент (перезапуск) берет итоги из БД без запроса в ОФД
+        results, client = self.run_client(session_factory, [day])
+        assert results[0]["total"] == Decimal("1500")
+        assert results[0]["shift_number"] == 3
+        assert "shift-report" not in client.metrics
+        assert client.cache_stats["db"] == 1
+
+    def test_open_shift_not_persisted(self, db_session, session_factory):
+        day = date(2025, 1, 4)
+
+        results, client = self.run_client(session_factory, [day, day], open_dates={day.isoformat()})
+        assert results[0]["closed_at"] is None
+        assert client.cache_stats == {"memory": 1, "db": 0, "ofd": 1}
+        assert db_session.execute(select(OfdShiftTotals)).first() is None
+
+        # После истечения TTL открытая смена запрашивается заново
+        results, client = self.run_client(
+            session_factory, [day, day], open_dates={day.isoformat()}, open_shift_ttl=0
+        )
+        assert client.metrics["shift-report"]["requests"] == 2
+
+    def test_validation_and_report_from_one_fetch(self, monkeypatch, session_factory):
+        async def scenario():
+            runner, url, peers = await start_fake_ofd()
+            monkeypatch.setenv("SBIS_OFD_URL", url)
+            client = sbis_ofd.get_ofd_client("token", "1234567890")
+            client.session_factory = session_factory
+            try:
+                validation, report = await sbis_ofd.get_shift_validation(
+                    date(2025, 1, 5), 1000.0, 300.0, 0.0, api_token="token", inn="1234567890"
+                )
+                return validation, report, client.get_metrics()
+            finally:
+                await sbis_ofd.close_ofd_clients()
+                await runner.cleanup()
+
+        validation, report, metrics = asyncio.run(scenario())
+
+        assert validation["status"] == "warning"
+        assert "СВЕРКА СМЕНЫ С КАССОЙ" in report
+        assert "Безнал: -200 ₽" in report
+        assert metrics["shift-report"]["requests"] == 1
+
+
+class TestReceiptPages:
+    """Постраничная выгрузка чеков и агрегация по типам оплаты"""
+
+    RECEIPTS = [
+        {
+            "operation_type": "income" if i % 10 else "refund",
+            "payments": [{"type": i % 4, "amount": 100.05 + i}]
+        }
+        for i in range(2500)
+    ]
+
+    def run_client(self, coro_factory, fail_offset=None):
+        offsets = []
+
+        async def receipts(request):
+            offset = int(request.query["offset"])
+            limit = int(request.query["limit"])
+            offsets.append(offset)
+            if offset == fail_offset:
+                return web.Response(status=500, text="boom")
+            return web.json_response({"receipts": self.RECEIPTS[offset:offset + limit]})
+
+        async def scenario():
+            app = web.Application()
+            app.router.add_get('/receipts', receipts)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            client = sbis_ofd.SbisOFD("token", "1234567890", base_url=f"http://127.0.0.1:{port}")
+            try:
+                return await coro_factory(client)
+            finally:
+                await client.close()
+                await runner.cleanup()
+
+        return asyncio.run(scenario()), offsets
+
+    def expected_totals(self):
+        totals = [Decimal("0")] * 4
+        for receipt in self.RECEIPTS:
+            if receipt["operation_type"] == "income":
+                for payment in receipt["payments"]:
+                    totals[payment["type"]] += Decimal(str(payment["amount"]))
+        return dict(zip(("cash", "cashless", "prepaid", "credit"), totals))
+
+    def test_totals_match_full_list(self):
+        totals, offsets = self.run_client(
+            lambda client: client.get_receipts_by_payment_type(date(2025, 1, 1), page_size=1000)
+        )
+        assert totals == self.expected_totals()
+        assert offsets == [0, 1000, 2000]
+
+    def test_get_shift_receipts_collects_pages(self):
+        receipts, offsets = self.run_client(
+            lambda client: client.get_shift_receipts(date(2025, 1, 1))
+        )
+        assert receipts == self.RECEIPTS
+        assert offsets == [0, 1000, 2000]
+
+    def test_failed_page_returns_none(self):
+        totals, offsets = self.run_client(
+            lambda client: client.get_receipts_by_payment_type(date(2025, 1, 1), page_size=1000),
+            fail_offset=1000
+        )
+        assert totals is None
+        assert offsets == [0, 1000]
@@ -0,0 +1,356 @@
+"""
+Тесты пакетного импорта смен из Bot_Claude
+"""
+import asyncio
+import sqlite3
+import pytest
+from decimal import Decimal
+from datetime import date, timedelta
+from sqlalchemy import event, select, func
+from app.database.models import Category, Employee, Shift, ShiftReport, SyncCursor, Transaction
+from app.database import crud
+from app.services.bot_claude_sync import BotClaudeSync
+from app.services.shift_importer import ShiftImporter
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+START = date(2024, 1, 1)
+DAYS = 90
+NAMES = ['Иванов Иван', 'Петров Петр', 'Сидорова Анна']
+
+
+@pytest.fixture
+def bot_claude(tmp_path):
+    """БД Bot_Claude: две смены и два отчета в день за квартал"""
+    path = tmp_path / 'knowledge.db'
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE shifts (
+            id INTEGER PRIMARY KEY, date TEXT, shift_type TEXT, employee_name TEXT,
+            hours_worked REAL, revenue_cash REAL, revenue_cashless REAL, revenue_qr REAL,
+            expenses REAL, notes TEXT
+        );
+        CREATE TABLE shift_reports (
+            date TEXT, shift_type TEXT, cash_fact REAL, cash_plan REAL, cashless_fact REAL,
+            qr_payments REAL, safe REAL, expenses_json TEXT, workers_list TEXT, equipment_issues TEXT
+        );
+    """)
+    for day in range(DAYS):
+        date_ = (START + timedelta(days=day)).isoformat()
+        for index, shift in enumerate(('morning', 'evening')):
+            revenue = 0 if day % 10 == 0 else 1000 + day
+            conn.execute(
+                "INSERT INTO shifts VALUES (?, ?, ?, ?, 12, ?, 500, 0, NULL, NULL)",
+                (day * 2 + index + 1, date_, shift, NAMES[(day + index) % 3], revenue)
+            )
+            conn.execute(
+                "INSERT INTO shift_reports VALUES (?, ?, 1000, 1000, 500, 0, 0, NULL, NULL, NULL)",
+                (date_, shift)
+            )
+    conn.commit()
+    conn.close()
+    return BotClaudeSync(str(path))
+
+
+@pytest.fixture
+def club_category(db_session):
+    category = Category(name='Услуги компьютерного клуба', type='income')
+    db_session.add(category)
+    db_session.add(Employee(full_name='Иванов Иван', employment_type='TD'))
+    db_session.commit()
+    return category
+
+
+@pytest.fixture
+def statements(db_engine):
+    executed = []
+
+    def record(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    event.listen(db_engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(db_engine, 'before_cursor_execute', record)
+
+
+def count(db_session, model):
+    return db_session.scalar(select(func.count()).select_from(model))
+
+
+class TestShiftImporter:
+
+    def test_import_quarter(self, db_session, async_session, bot_claude, club_category, statements):
+        importer = ShiftImporter(async_session, bot_claude)
+        end = START + timedelta(days=DAYS - 1)
+
+        stats = run(importer.import_shifts(START, end))
+        reports = run(importer.import_shift_reports(START, end))
+
+        assert stats == {
+            'shifts_imported': 180,
+            'shifts_updated': 0,
+            'shifts_skipped': 0,
+            'employees_created': 2,
+            'transactions_created': 180,
+            'transactions_updated': 0,
+            'transactions_deleted': 0
+        }
+        assert reports == 180
+        # Несколько запросов на весь квартал, а не по нескольку на смену
+        assert len(statements) <= 10
+
+        assert count(db_session, Shift) == 180
+        assert count(db_session, ShiftReport) == 180
+        assert count(db_session, Employee) == 3
+
+        ivanov = db_session.scalar(select(Employee).where(Employee.full_name == 'Иванов Иван'))
+        assert ivanov.employment_type == 'TD'
+        assert db_session.scalar(select(func.count()).where(Shift.employee_id == ivanov.id)) == 60
+
+        transactions = db_session.execute(select(Transaction)).scalars().all()
+        assert all(t.category_id == club_category.id and t.is_confirmed for t in transactions)
+        assert sum(t.amount for t in transactions) == sum(
+            Decimal(1000 + day if day % 10 else 0) + 500 for day in range(DAYS) for _ in range(2)
+        )
+
+    def test_repeated_import_is_skipped(self, db_session, async_session, bot_claude, club_category):
+        importer = ShiftImporter(async_session, bot_claude)
+        end = START + timedelta(days=DAYS - 1)
+
+        run(importer.import_shifts(START, START + timedelta(days=29)))
+        run(importer.import_shift_reports(START, START + timedelta(days=29)))
+
+        stats = run(importer.import_shifts(START, end))
+        reports = run(importer.import_shift_reports(START, end))
+
+        assert stats['shifts_imported'] == 120
+        assert stats['shifts_skipped'] == 60
+        assert stats['employees_created'] == 0
+        assert reports == 120
+        assert count(db_session, Shift) == 180
+        assert count(db_session, Transaction) == 180
+
+    def test_conflicting_rows_are_not_duplicated(self, db_session, async_session, club_category):
+        """Смена, вставленная параллельно после предварительной выборки, пропускается конфликтом"""
+        importer = ShiftImporter(async_session)
+        shifts = [
+            {'bot_shift_id': 1, 'shift_date': START, 'employee_name': None, 'revenue': Decimal('100')},
+            {'bot_shift_id': 1, 'shift_date': START, 'employee_name': None, 'revenue': Decimal('100')},
+            {'bot_shift_id': 2, 'shift_date': START, 'employee_name': None, 'revenue': Decimal('0')},
+        ]
+        db_session.add(Shift(shift_date=START, bot_shift_id=2))
+        db_session.commit()
+
+        stats = run(importer.save_shifts(shifts))
+
+        assert stats['shifts_imported'] == 1
+        assert stats['shifts_skipped'] == 2
+        assert stats['transactions_created'] == 1
+
+
+class TestIncrementalSync:
+    """Загрузка после водяного знака с продолжением после сбоя"""
+
+    def test_resumes_after_crash(self, db_session, async_session, bot_claude, club_category, statements):
+        importer = ShiftImporter(async_session, bot_claude)
+        fetch_since = bot_claude.fetch_since
+        calls = []
+
+        def failing_fetch(table, cursor, limit):
+            calls.append(cursor)
+            if len(calls) == 3:
+                raise RuntimeError("connection lost")
+            return fetch_since(table, cursor, limit)
+
+        bot_claude.fetch_since = failing_fetch
+        with pytest.raises(RuntimeError):
+            run(importer.sync_shifts(batch_size=50))
+        run(async_session.rollback())
+
+        # Две пачки зафиксированы вместе со знаком
+        assert count(db_session, Shift) == 100
+        assert run(crud.get_sync_cursor(async_session, 'bot_claude.shifts'))['rowid'] == 100
+
+        bot_claude.fetch_since = fetch_since
+        stats = run(importer.sync_shifts(batch_size=50))
+
+        assert stats['shifts_imported'] == 80
+        assert stats['shifts_skipped'] == 0
+        assert count(db_session, Shift) == 180
+        assert count(db_session, Transaction) == 180
+        assert db_session.scalar(select(SyncCursor.rows_synced)) == 180
+
+        statements.clear()
+        assert run(importer.sync_shifts(batch_size=50))['shifts_imported'] == 0
+        assert len(statements) == 1  # только чтение знака
+
+    def test_late_rows_and_edits(self, tmp_path, db_session, async_session, club_category):
+        path = tmp_path / 'knowledge.db'
+        conn = sqlite3.connect(path)
+        conn.executescript("""
+            CREATE TABLE shift_reports (
+                date TEXT, shift_type TEXT, cash_fact REAL, cash_plan REAL, cashless_fact REAL,
+                qr_payments REAL, safe REAL, expenses_json TEXT, workers_list TEXT, equipment_issues TEXT,
+                updated_at TEXT
+            );
+            INSERT INTO shift_reports VALUES ('2024-05-01', 'morning', 100, 100, 0, 0, 0, NULL, NULL, NULL, '2024-05-01 10:00');
+            INSERT INTO shift_reports VALUES ('2024-05-01', 'evening', 200, 200, 0, 0, 0, NULL, NULL, NULL, '2024-05-01 22:00');
+        """)
+        conn.commit()
+        importer = ShiftImporter(async_session, BotClaudeSync(str(path)))
+
+        assert run(importer.sync_shift_reports()) == 2
+
+        # Исправление задним числом и пропущенный день, внесенный позже
+        conn.executescript("""
+            UPDATE shift_reports SET cash_fact = 150, updated_at = '2024-05-03 09:00'
+            WHERE date = '2024-05-01' AND shift_type = 'morning';
+            INSERT INTO shift_reports VALUES ('2024-04-30', 'evening', 300, 300, 0, 0, 0, NULL, 'Иванов,Петров', NULL, '2024-05-03 09:30');
+        """)
+        conn.commit()
+        conn.close()
+
+        assert run(importer.sync_shift_reports()) == 1
+
+        reports = {
+            (r.date, r.shift): r
+            for r in db_session.execute(select(ShiftReport)).scalars().all()
+        }
+        assert len(reports) == 3
+        assert reports[(date(2024, 5, 1), 'morning')].cash_fact == Decimal('150')
+        assert reports[(date(2024, 4, 30), 'evening')].workers == ['Иванов', 'Петров']
+        assert run(crud.get_sync_cursor(async_session, 'bot_claude.shift_reports')) == {
+            'rowid': 3, 'updated_at': '2024-05-03 09:30'
+        }
+
+    def test_revenue_edited_after_import(self, tmp_path, db_session, async_session, club_category):
+        from app.database import cash_ledger
+
+        path = tmp_path / 'knowledge.db'
+        conn = sqlite3.connect(path)
+        conn.executescript("""
+            CREATE TABLE shifts (
+                id INTEGER PRIMARY KEY, date TEXT, shift_type TEXT, employee_name TEXT,
+                hours_worked REAL, revenue_cash REAL, revenue_cashless REAL, revenue_qr REAL,
+                expenses REAL, notes TEXT, updated_at TEXT
+            );
+            INSERT INTO shifts VALUES (1, '2024-05-01', 'morning', 'Иванов Иван', 12, 1000, 500, 0, NULL, NULL, '2024-05-01 10:00');
+            INSERT INTO shifts VALUES (2, '2024-05-01', 'evening', 'Иванов Иван', 12, 0, 0, 0, NULL, NULL, '2024-05-01 22:00');
+            INSERT INTO shifts VALUES (3, '2024-05-02', 'morning', 'Иванов Иван', 12, 700, 0, 0, NULL, NULL, '2024-05-02 10:00');
+        """)
+        conn.commit()
+        importer = ShiftImporter(async_session, BotClaudeSync(str(path)))
+
+        assert run(importer.sync_shifts())['transactions_created'] == 2
+
+        # Доход первой смены принят наличными и проведен по кассе
+        db_session.execute(
+            Transaction.__table__.update().where(Transaction.amount == Decimal('1500')).values(payment_method='cash')
+        )
+        db_session.commit()
+        run(cash_ledger.rebuild_cash_ledger(async_session))
+
+        # Выручка исправлена, у пустой смены появилась, у третьей обнулена
+        conn.executescript("""
+            UPDATE shifts SET revenue_cash = 1200, updated_at = '2024-05-03 09:00' WHERE id = 1;
+            UPDATE shifts SET revenue_cashless = 800, updated_at = '2024-05-03 09:01' WHERE id = 2;
+            UPDATE shifts SET revenue_cash = 0, updated_at = '2024-05-03 09:02' WHERE id = 3;
+        """)
+        conn.commit()
+        conn.close()
+
+        stats = run(importer.sync_shifts())
+
+        assert stats['shifts_updated'] == 3
+        assert (stats['transactions_created'], stats['transactions_updated'], stats['transactions_deleted']) == (1, 1, 1)
+
+        shifts = {s.bot_shift_id: s for s in db_session.execute(select(Shift)).scalars().all()}
+        income = {
+            t.shift_id: t.amount
+            for t in db_session.execute(select(Transaction).where(Transaction.source == 'bot_claude_import')).scalars().all()
+        }
+        assert income == {shifts[1].id: Decimal('1700'), shifts[2].id: Decimal('800')}
+        assert sum(income.values()) == sum(s.revenue for s in shifts.values())
+
+        assert run(cash_ledger.get_ledger_balance(async_session, date(2024, 5, 31))) == Decimal('1700')
+        assert run(cash_ledger.check_cash_ledger(async_session, date(2024, 5, 31)))['is_consistent']
+
+        # Повторная синхронизация ничего не меняет
+        assert run(importer.sync_shifts())['transactions_updated'] == 0
+
+    @pytest.fixture
+    def legacy(self, tmp_path, db_session, club_category):
+        """Смены и доход прежнего импорта без связи транзакций со сменами"""
+        path = tmp_path / 'knowledge.db'
+        conn = sqlite3.connect(path)
+        conn.executescript("""
+            CREATE TABLE shifts (
+                id INTEGER PRIMARY KEY, date TEXT, shift_type TEXT, employee_name TEXT,
+                hours_worked REAL, revenue_cash REAL, revenue_cashless REAL, revenue_qr REAL,
+                expenses REAL, notes TEXT
+            );
+            INSERT INTO shifts VALUES (1, '2024-01-01', 'morning', 'Иванов Иван', 12, 1000, 0, 0, NULL, NULL);
+            INSERT INTO shifts VALUES (2, '2024-01-01', 'evening', 'Иванов Иван', 12, 1000, 0, 0, NULL, NULL);
+            INSERT INTO shifts VALUES (3, '2024-01-02', 'morning', 'Иванов Иван', 12, 900, 0, 0, NULL, NULL);
+        """)
+        conn.commit()
+        conn.close()
+
+        for bot_shift_id, shift_date, revenue, income in (
+            (1, date(2024, 1, 1), '1000', '1000'),
+            (2, date(2024, 1, 1), '1000', '1000'),
+            (3, date(2024, 1, 2), '900', '850'),   # сумма дохода уже не совпадает
+        ):
+            db_session.add(Shift(
+                shift_date=shift_date, revenue=Decimal(revenue), imported_from_bot=True, bot_shift_id=bot_shift_id
+            ))
+            db_session.add(Transaction(
+                date=shift_date, type='income', amount=Decimal(income), category_id=club_category.id,
+                source='bot_claude_import', is_confirmed=True, is_kudir_included=True
+            ))
+        db_session.commit()
+        return BotClaudeSync(str(path))
+
+    def test_first_sync_adopts_legacy_income(self, db_session, async_session, legacy):
+        stats = run(ShiftImporter(async_session, legacy).sync_shifts())
+
+        assert stats['shifts_updated'] == 3
+        assert (stats['transactions_created'], stats['transactions_updated']) == (0, 1)
+
+        shifts = {s.id: s for s in db_session.execute(select(Shift)).scalars().all()}
+        income = db_session.execute(select(Transaction)).scalars().all()
+        assert len(income) == 3
+        assert sorted(t.shift_id for t in income) == sorted(shifts)
+        assert all(t.amount == shifts[t.shift_id].revenue for t in income)
+
+    def test_migration_links_legacy_income_one_to_one(self, db_session, legacy):
+        import importlib.util
+        from pathlib import Path
+        from sqlalchemy import text
+
+        path = Path(__file__).parent.parent / 'migrations' / 'versions' / '009_add_transaction_shift_id.py'
+        spec = importlib.util.spec_from_file_location('migration_009', path)
+        migration = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(migration)
+
+        db_session.execute(text(migration.LINK_SHIFT_INCOME))
+        db_session.commit()
+
+        shifts = {s.bot_shift_id: s.id for s in db_session.execute(select(Shift)).scalars().all()}
+        linked = {}
+        for t in db_session.execute(select(Transaction).order_by(Transaction.id)).scalars().all():
+            linked.setdefault(t.amount, []).append(t.shift_id)
+
+        # Равные пары дата-сумма - по одной, расходящаяся сумма не связывается
+        assert linked == {Decimal('1000'): [shifts[1], shifts[2]], Decimal('850'): [None]}
+
+    def test_source_is_read_only(self, bot_claude):
+        conn = bot_claude._connect()
+        try:
+            with pytest.raises(sqlite3.OperationalError, match="readonly"):
+                conn.execute("DELETE FROM shifts")
+        finally:
+            conn.close()
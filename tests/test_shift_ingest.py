@@ -0,0 +1,134 @@
+"""
+Тесты загрузки отчетов о сменах
+"""
+import asyncio
+from decimal import Decimal
+from datetime import date
+from sqlalchemy import select, event
+from app.database import crud
+from app.database.models import ShiftReport, Transaction
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def report(date_, shift='evening', expenses=None, **amounts):
+    return {
+        'date': date_,
+        'shift': shift,
+        'cash_fact': amounts.get('cash_fact'),
+        'cashless_fact': amounts.get('cashless_fact'),
+        'qr_payments': amounts.get('qr_payments'),
+        'expenses': expenses,
+    }
+
+
+class TestIngestShiftReport:
+    """Отчет и транзакции пишутся одной транзакцией"""
+
+    def test_creates_report_and_transactions(self, db_session, async_session):
+        data = report(
+            date(2024, 1, 15),
+            cash_fact=Decimal('15000'), cashless_fact=Decimal('8000'), qr_payments=Decimal('3500'),
+            expenses=[{'amount': 500, 'description': 'Вода для кулера'}, {'amount': 1200}]
+        )
+
+        result = run(crud.ingest_shift_report(async_session, data))
+
+        assert result['total_revenue'] == 26500.0
+        assert len(result['transactions_created']) == 3
+        assert db_session.get(ShiftReport, result['report_id']).shift == 'evening'
+
+        transactions = db_session.execute(
+            select(Transaction).order_by(Transaction.id)
+        ).scalars().all()
+        assert [t.id for t in transactions] == result['transactions_created']
+
+        income, water, other = transactions
+        assert (income.type, income.amount, income.payment_method, income.is_confirmed) == \
+            ('income', Decimal('26500'), 'mixed', True)
+        assert (water.amount, water.description, water.is_confirmed) == \
+            (Decimal('500'), 'Вода для кулера', False)
+        assert other.description == 'Расход со смены'
+        assert all(t.source == 'shift_report' for t in transactions)
+
+    def test_no_revenue_no_expenses(self, async_session):
+        result = run(crud.ingest_shift_report(async_session, report(date(2024, 1, 16))))
+        assert result['transactions_created'] == []
+        assert result['total_revenue'] == 0.0
+
+
+class TestIdempotentDelivery:
+    """Повторная доставка смены возвращает первый результат без записи"""
+
+    def test_retry_returns_original_result(self, db_session, async_session):
+        data = report(date(2024, 3, 1), cash_fact=Decimal('5000'), expenses=[{'amount': 100}])
+
+        first = run(crud.ingest_shift_report(async_session, data))
+        retry = run(crud.ingest_shift_report(async_session, {**data, 'cash_fact': Decimal('1')}))
+
+        assert first['duplicate'] is False
+        assert retry['duplicate'] is True
+        assert {k: v for k, v in retry.items() if k != 'duplicate'} == \
+            {k: v for k, v in first.items() if k != 'duplicate'}
+        assert len(db_session.execute(select(Transaction)).scalars().all()) == 2
+
+    def test_retry_does_not_write(self, db_engine, async_session):
+        data = report(date(2024, 3, 2), qr_payments=Decimal('700'))
+        run(crud.ingest_shift_report(async_session, data))
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement.split()[0].upper())
+
+        event.listen(db_engine, 'before_cursor_execute', record)
+        try:
+            run(crud.ingest_shift_report(async_session, data))
+        finally:
+            event.remove(db_engine, 'before_cursor_execute', record)
+
+        assert statements == ['SELECT']
+
+    def test_report_without_stored_result(self, db_session, async_session):
+        """Отчеты, загруженные до ingest_result, тоже считаются дублями"""
+        db_session.add(ShiftReport(
+            date=date(2024, 3, 3), shift='morning',
+            cash_fact=Decimal('100'), qr_payments=Decimal('50')
+        ))
+        db_session.commit()
+
+        result = run(crud.ingest_shift_report(
+            async_session, report(date(2024, 3, 3), 'morning', cash_fact=Decimal('100'))
+        ))
+
+        assert result['duplicate'] is True
+        assert result['total_revenue'] == 150.0
+        assert result['transactions_created'] == []
+
+
+class TestIngestShiftReportsBatch:
+    """Пакетная загрузка: результат по каждому отчету"""
+
+    def test_error_does_not_cancel_others(self, db_session, async_session):
+        reports = [
+            report(date(2024, 2, 1), 'morning', cash_fact=Decimal('1000')),
+            report(date(2024, 2, 1), 'night', cash_fact=Decimal('9999')),     # неверная смена
+            report(date(2024, 2, 1), 'evening', expenses=[{'amount': 300}]),
+            report(date(2024, 2, 1), 'morning', cash_fact=Decimal('1000')),   # повтор
+        ]
+
+        results = run(crud.ingest_shift_reports(async_session, reports))
+
+        assert [item['status'] for item in results] == ['success', 'error', 'success', 'success']
+        assert [item['index'] for item in results] == [0, 1, 2, 3]
+        assert results[1]['shift'] == 'night'
+        assert results[3]['duplicate'] is True
+        assert results[3]['report_id'] == results[0]['report_id']
+
+        assert len(db_session.execute(select(ShiftReport)).scalars().all()) == 2
+        amounts = db_session.execute(
+            select(Transaction.amount).order_by(Transaction.id)
+        ).scalars().all()
+        assert amounts == [Decimal('1000'), Decimal('300')]
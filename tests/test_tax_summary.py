@@ -0,0 +1,89 @@
+"""
+Тесты годовой сводки по налогам (один запрос против поквартального расчета)
+"""
+import asyncio
+import pytest
+from decimal import Decimal
+from datetime import date
+from app.database.models import Transaction, Category
+from app.services import calculator
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def reference_quarter_taxes(session, year):
+    """Прежний путь: отдельный расчет налога по каждому кварталу"""
+    return [
+        await calculator.calculate_usn_tax(session, year, quarter)
+        for quarter in range(1, 5)
+    ]
+
+
+async def reference_tax_summary(session, year):
+    """Прежняя сводка: четыре расчета + авансовые платежи"""
+    quarter_taxes = await reference_quarter_taxes(session, year)
+    annual = quarter_taxes[-1]
+    return {
+        'annual_summary': annual,
+        'quarterly_data': quarter_taxes,
+        'advance_payments': calculator.calculate_advance_payments(quarter_taxes),
+        'total_tax_to_pay': annual['tax_to_pay']
+    }
+
+
+@pytest.fixture
+def transactions(db_session):
+    """Операции по всем кварталам, включая квартал с убытком"""
+    rent = Category(name='Аренда помещений', type='expense', tax_deductible=True)
+    fines = Category(name='Штрафы и пени', type='expense', tax_deductible=False)
+    db_session.add_all([rent, fines])
+    db_session.flush()
+
+    rows = [
+        (date(2024, 1, 15), 'income', '120000.00', None, True),
+        (date(2024, 2, 10), 'expense', '40000.00', rent.id, True),
+        (date(2024, 3, 31), 'expense', '2000.00', fines.id, True),
+        (date(2024, 4, 1), 'income', '50000.00', None, True),
+        (date(2024, 6, 30), 'expense', '90000.00', rent.id, True),     # убыток
+        (date(2024, 8, 20), 'income', '75000.55', None, True),
+        (date(2024, 9, 1), 'income', '5000.00', None, False),
+        (date(2024, 12, 31), 'income', '33333.33', None, True),
+        (date(2024, 11, 5), 'expense', '10000.00', rent.id, True),
+        (date(2023, 12, 31), 'income', '99999.00', None, True),
+        (date(2025, 1, 1), 'income', '99999.00', None, True),
+    ]
+    for date_, type_, amount, category_id, confirmed in rows:
+        db_session.add(Transaction(
+            date=date_,
+            type=type_,
+            amount=Decimal(amount),
+            category_id=category_id,
+            is_confirmed=confirmed
+        ))
+    db_session.commit()
+
+
+class TestTaxSummary:
+    """Расчет по кварталам из одного запроса совпадает с прежним"""
+
+    def test_quarter_taxes_parity(self, async_session, transactions):
+        expected = run(reference_quarter_taxes(async_session, 2024))
+        actual = run(calculator.calculate_quarter_taxes(async_session, 2024))
+        assert actual == expected
+
+    def test_tax_summary_parity(self, async_session, transactions):
+        expected = run(reference_tax_summary(async_session, 2024))
+        summary = run(calculator.get_tax_summary(async_session, 2024))
+        for key, value in expected.items():
+            assert summary[key] == value, key
+
+    def test_min_tax_applies_for_loss_quarter(self, async_session, transactions):
+        q2 = run(calculator.calculate_quarter_taxes(async_session, 2024))[1]
+        assert q2['tax_base'] == 0
+        assert q2['tax_to_pay'] == q2['min_tax'] == 500.0
+
+    def test_empty_year(self, async_session, transactions):
+        expected = run(reference_quarter_taxes(async_session, 2030))
+        assert run(calculator.calculate_quarter_taxes(async_session, 2030)) == expected